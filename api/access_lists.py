@@ -0,0 +1,166 @@
+"""
+ホワイトリスト・OP の一括変更
+
+望む状態（追加・削除する名前、または sync で渡す全員）を whitelist.json / ops.json の
+今の内容と突き合わせ、変わるプレイヤーだけにコマンドを出す。
+
+サーバー稼働中はコマンドを 1 本の RCON 接続にパイプラインで流す（UUID はサーバーが引き、
+ファイルもサーバーが書く）。停止中は JSON ファイルを一時ファイルと rename で書き換える
+（次の起動で読まれるので reload は要らない）。ファイルに新しく載せるプレイヤーの UUID は
+呼び出し側が渡す。
+
+結果はプレイヤーごとに {"player", "action": "add" | "remove",
+"result": "added" | "removed" | "unchanged" | "failed", "detail"}。
+"""
+import re
+
+LISTS = {
+    "whitelist": {"add": "whitelist add {}", "remove": "whitelist remove {}"},
+    "ops": {"add": "op {}", "remove": "deop {}"},
+}
+# 1 回の要求で扱う人数の上限
+MAX_PLAYERS = 1000
+PLAYER_NAME = re.compile(r"[A-Za-z0-9_]{1,16}\Z")
+# 1 コマンドにかかる時間の見込み（秒）。オンラインモードの whitelist add / op は
+# 知らない名前の UUID を Mojang API に問い合わせるので、応答まで時間がかかる
+COMMAND_SECONDS = 0.5
+
+# コマンドの出力（バニラと Paper）
+CHANGED = re.compile(r"^(Added|Removed|Made|Opped|De-?opped)\b", re.IGNORECASE)
+UNCHANGED = re.compile(r"already|is not|not whitelisted|Nothing changed", re.IGNORECASE)
+
+
+class ListError(ValueError):
+    pass
+
+
+def _names(entries: list) -> dict:
+    """
+    小文字の名前 -> ファイル上の表記
+    """
+    return {
+        str(entry["name"]).lower(): entry["name"]
+        for entry in entries if isinstance(entry, dict) and entry.get("name")
+    }
+
+
+def plan(entries: list, add=(), remove=(), sync=None) -> dict:
+    """
+    変更が必要なプレイヤーを決める
+
+    sync を渡すと add / remove の代わりに「sync の全員だけが載っている」状態にする。
+    名前の大文字・小文字は区別しない。
+    戻り値: {"add": [...], "remove": [...（ファイル上の表記）], "unchanged": [(名前, 操作), ...]}
+    """
+    requested = list(sync) if sync is not None else list(add) + list(remove)
+    if len(requested) > MAX_PLAYERS:
+        raise ListError(f"Too many players (max {MAX_PLAYERS})")
+    invalid = [name for name in requested if not PLAYER_NAME.match(name)]
+    if invalid:
+        raise ListError(f"Invalid player names: {', '.join(invalid[:10])}")
+    current = _names(entries)
+    if sync is not None:
+        # ファイル上の名前は検証しない（Floodgate の ".Name" など）
+        wanted = {name.lower(): name for name in sync}
+        add = list(wanted.values())
+        remove = [name for key, name in current.items() if key not in wanted]
+    both = {name.lower() for name in add} & {name.lower() for name in remove}
+    if both:
+        raise ListError(f"Players both added and removed: {', '.join(sorted(both)[:10])}")
+
+    changes = {"add": [], "remove": [], "unchanged": []}
+    seen = set()
+    for action, names in (("add", add), ("remove", remove)):
+        for name in names:
+            key = name.lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            if (key in current) == (action == "add"):
+                changes["unchanged"].append((current.get(key, name), action))
+            else:
+                changes[action].append(current.get(key, name))
+    return changes
+
+
+def commands(kind: str, changes: dict) -> list:
+    """
+    [(名前, 操作, コマンド), ...]
+    """
+    templates = LISTS[kind]
+    return [
+        (name, action, templates[action].format(name))
+        for action in ("add", "remove") for name in changes[action]
+    ]
+
+
+def unchanged_results(changes: dict) -> list:
+    return [
+        {"player": name, "action": action, "result": "unchanged", "detail": "Already in the desired state"}
+        for name, action in changes["unchanged"]
+    ]
+
+
+def command_result(name: str, action: str, output: str) -> dict:
+    """
+    コマンドの出力をプレイヤーごとの結果にする
+    """
+    output = output.strip()
+    if CHANGED.match(output):
+        result = "added" if action == "add" else "removed"
+    elif UNCHANGED.search(output):
+        result = "unchanged"
+    else:
+        result = "failed"
+    return {"player": name, "action": action, "result": result, "detail": output}
+
+
+def verify(entries: list, pending: list, error: str) -> list:
+    """
+    パイプラインが途中で失敗したとき、ファイルの内容から各プレイヤーの結果を決める
+    """
+    current = _names(entries)
+    results = []
+    for name, action, _ in pending:
+        if (name.lower() in current) == (action == "add"):
+            results.append({"player": name, "action": action,
+                            "result": "added" if action == "add" else "removed", "detail": ""})
+        else:
+            results.append({"player": name, "action": action, "result": "failed", "detail": error})
+    return results
+
+
+def edit(entries: list, kind: str, changes: dict, uuid_of, op_level: int = 4) -> tuple:
+    """
+    ファイルの内容を書き換えた新しい entries と結果を返す（書き込みは呼び出し側）
+
+    uuid_of: 名前 -> UUID or None。UUID が分からないプレイヤーは載せられないので failed
+    """
+    removing = {name.lower() for name in changes["remove"]}
+    updated = [
+        entry for entry in entries
+        if not (isinstance(entry, dict) and str(entry.get("name", "")).lower() in removing)
+    ]
+    results = [
+        {"player": name, "action": "remove", "result": "removed", "detail": ""}
+        for name in changes["remove"]
+    ]
+    listed = {str(entry.get("uuid", "")).lower() for entry in updated if isinstance(entry, dict)}
+    for name in changes["add"]:
+        uuid = uuid_of(name)
+        if not uuid:
+            results.append({"player": name, "action": "add", "result": "failed",
+                            "detail": "Unknown UUID (start the server to add new players)"})
+            continue
+        if uuid.lower() in listed:
+            # 名前を変えたプレイヤー: UUID はもう載っている
+            results.append({"player": name, "action": "add", "result": "unchanged",
+                            "detail": "UUID is already listed under another name"})
+            continue
+        entry = {"uuid": uuid, "name": name}
+        if kind == "ops":
+            entry.update(level=op_level, bypassesPlayerLimit=False)
+        updated.append(entry)
+        listed.add(uuid.lower())
+        results.append({"player": name, "action": "add", "result": "added", "detail": ""})
+    return updated, results
@@ -1,40 +1,249 @@
-from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException, Header, Request
+from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException, Header, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse, Response
+from pydantic import BaseModel, ValidationError
 import shutil
-import subprocess
+import asyncio
 import os
-import zipfile
 import datetime
 import psutil
 import secrets
+import hashlib
+import threading
 import sqlite3
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MISSED
 from apscheduler.triggers.cron import CronTrigger
-import glob
+from apscheduler.triggers.interval import IntervalTrigger
+import json
+import random
+import re
 import time
 from typing import Optional, List
+from rcon_client import RconPool, RconError, PIPELINE_WINDOW
+from ops import AsyncOps, OperationTimeout
+from docker_engine import DockerEngine, DockerError, summarize_state
+from backup_store import BackupStore, available_codecs
+from hot_backup import HotBackupCoordinator
+from restore import RestoreCoordinator, extract_zip
+import log_tail
+from log_tail import LogFollower, LineFilter
+from log_ingest import LogIngester
+from jobs import JobManager
+from db import Database
+from write_behind import WriteBehindQueue, QueueFull
+from key_cache import ApiKeyCache
+import rollup
+from rollup import MetricRollup, RESOLUTIONS
+import metric_store
+from metric_store import MetricStore
+from sampler import PerformanceSampler
+from chat_search import ChatIndex, QueryError
+from chat_stats import ChatStats
+from players import PlayerRegistry, PlayerListFile, SnapshotCache
+from profiles import UuidResolver
+import access_lists
+from access_lists import ListError
+from nbt import NBTError, parse_entity_data, parse_path, read_nbt_file, select
+import openmetrics
+from openmetrics import Registry, RequestMetrics
 
 # =============================
 # 設定
 # =============================
 MC_DATA_DIR = "/mc-data"
 BACKUP_DIR = "/backups"
-LOG_FILE = os.path.join(MC_DATA_DIR, "logs", "latest.log")
+BACKUP_REPO_DIR = os.path.join(BACKUP_DIR, "repo")
+BACKUP_WORKERS = int(os.getenv("BACKUP_WORKERS", "0")) or None
+BACKUP_CODEC = os.getenv("BACKUP_CODEC", "deflate")
+BACKUP_LEVEL = int(os.getenv("BACKUP_LEVEL", "6"))
+UPLOAD_SPOOL_DIR = os.path.join(BACKUP_DIR, "uploads")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# 凍結コピー置き場（reflink が効くようにワールドと同じファイルシステムに置く）
+BACKUP_STAGING_DIR = os.path.join(MC_DATA_DIR, ".backup-staging")
+# リストア時の展開先と、入れ替えで外した現行データの置き場（rename できるよう同じファイルシステム）
+RESTORE_STAGING_DIR = os.path.join(MC_DATA_DIR, ".restore-staging")
+RESTORE_PREVIOUS_DIR = os.path.join(MC_DATA_DIR, ".restore-previous")
+LOG_DIR = os.path.join(MC_DATA_DIR, "logs")
+# バックアップ・リストアの対象から外す MC_DATA_DIR 直下のエントリ
+# （logs/ を戻すとログ取り込みのチェックポイントとずれて古いセッションを取り込み直すので入れ替えない）
+WORLD_EXCLUDE = tuple(os.path.basename(d) for d in (BACKUP_STAGING_DIR, RESTORE_STAGING_DIR, RESTORE_PREVIOUS_DIR, LOG_DIR))
+LOG_FILE = os.path.join(LOG_DIR, "latest.log")
+# チャットをログから取り込むか（プラグインが /chat/log に送っている場合は false）
+LOG_INGEST_CHAT = os.getenv("LOG_INGEST_CHAT", "true").lower() == "true"
 
 ROOT_API_KEY = os.getenv("ROOT_API_KEY", "dev-root-key")
 
+RCON_HOST = os.getenv("RCON_HOST", "mc-server")
+RCON_PORT = int(os.getenv("RCON_PORT", "25575"))
+RCON_POOL_SIZE = int(os.getenv("RCON_POOL_SIZE", "4"))
+RCON_TIMEOUT = float(os.getenv("RCON_TIMEOUT", "5"))
+
+MC_CONTAINER = os.getenv("MC_CONTAINER", "mc-server")
+DOCKER_SOCKET = os.getenv("DOCKER_SOCKET", "/var/run/docker.sock")
+CONTAINER_TIMEOUT = float(os.getenv("CONTAINER_TIMEOUT", "90"))
+
 DB_DIR = "/data"
 DB_PATH = os.path.join(DB_DIR, "api.db")
+# WAL の定期チェックポイント間隔（分）
+DB_CHECKPOINT_MINUTES = int(os.getenv("DB_CHECKPOINT_MINUTES", "10"))
+# 高頻度の INSERT をまとめてコミットする間隔（ミリ秒）と最大行数、キューの上限
+WRITE_BATCH_MS = int(os.getenv("WRITE_BATCH_MS", "50"))
+WRITE_BATCH_ROWS = int(os.getenv("WRITE_BATCH_ROWS", "500"))
+WRITE_QUEUE_CAPACITY = int(os.getenv("WRITE_QUEUE_CAPACITY", "10000"))
+# 一括取り込みエンドポイントの 1 リクエストあたり最大行数
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", "10000"))
+# API キー検証結果のキャッシュ期間（秒）。存在しないキーは短めに覚える
+API_KEY_CACHE_TTL = float(os.getenv("API_KEY_CACHE_TTL", "60"))
+API_KEY_NEGATIVE_TTL = float(os.getenv("API_KEY_NEGATIVE_TTL", "10"))
+# 他のワーカープロセスでのキー追加・削除を確認する間隔（秒）
+API_KEY_CHECK_INTERVAL = float(os.getenv("API_KEY_CHECK_INTERVAL", "1"))
+# 監査ログ: 読み取り系操作を記録する割合（0 で記録しない）と、操作ごとの上書き（例 "status=0,metrics=0.1"）
+AUDIT_READ_SAMPLE = float(os.getenv("AUDIT_READ_SAMPLE", "1"))
+AUDIT_SAMPLING = {
+    action.strip(): float(rate)
+    for action, _, rate in (item.partition("=") for item in os.getenv("AUDIT_SAMPLING", "").split(","))
+    if action.strip()
+}
+# 監査ログの保存日数（0 で無期限）
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "90"))
+# パフォーマンスの生データとロールアップ（1 分 / 1 時間・1 日）の保存日数
+PERFORMANCE_RAW_DAYS = int(os.getenv("PERFORMANCE_RAW_DAYS", "7"))
+ROLLUP_MINUTE_DAYS = int(os.getenv("ROLLUP_MINUTE_DAYS", "30"))
+ROLLUP_RETENTION_DAYS = int(os.getenv("ROLLUP_RETENTION_DAYS", "365"))
+# 内蔵サンプラー（プレイ中 / 0 人 / 停止中の計測間隔、秒）
+SAMPLER_ENABLED = os.getenv("SAMPLER_ENABLED", "true").lower() == "true"
+SAMPLER_INTERVAL = float(os.getenv("SAMPLER_INTERVAL", "10"))
+SAMPLER_IDLE_INTERVAL = float(os.getenv("SAMPLER_IDLE_INTERVAL", "60"))
+SAMPLER_STOPPED_INTERVAL = float(os.getenv("SAMPLER_STOPPED_INTERVAL", "300"))
+# オンラインプレイヤーを list で補正する間隔（秒）。参加・退出はログから反映する
+PLAYER_RECONCILE_INTERVAL = float(os.getenv("PLAYER_RECONCILE_INTERVAL", "300"))
+# /players/{name} の NBT をキャッシュする秒数
+PLAYER_DATA_TTL = float(os.getenv("PLAYER_DATA_TTL", "5"))
+# 名前 → UUID の問い合わせ先（Mojang の bulk API 互換。空にすると使わない）
+PROFILE_API_URL = os.getenv("PROFILE_API_URL", "https://api.minecraftservices.com/minecraft/profile/lookup/bulk/byname")
+PROFILE_BATCH_SIZE = int(os.getenv("PROFILE_BATCH_SIZE", "10"))
+# 問い合わせ結果の保存期間（見つからなかった名前は秒）
+PROFILE_CACHE_DAYS = float(os.getenv("PROFILE_CACHE_DAYS", "7"))
+PROFILE_NEGATIVE_TTL = float(os.getenv("PROFILE_NEGATIVE_TTL", "3600"))
+# /metrics/prometheus 用のトークン（Authorization: Bearer）。未設定なら API キーで認証
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
 
 os.makedirs(BACKUP_DIR, exist_ok=True)
 os.makedirs(DB_DIR, exist_ok=True)
 
+# =============================
+# 計測（OpenMetrics）
+# =============================
+# ホットパスから値を入れるもの。スクレイプ時に読むだけの値は Metrics 節のコレクターで出す
+registry = Registry()
+http_duration = registry.histogram(
+    "mc_api_request_duration_seconds", "API request latency until response headers", ("method", "route")
+)
+http_requests = registry.counter("mc_api_requests", "API requests", ("method", "route", "status"))
+db_statement_duration = registry.histogram(
+    "mc_sqlite_statement_duration_seconds", "SQLite execute/executemany latency", ("kind",),
+    buckets=openmetrics.FAST_BUCKETS
+)
+db_commit_duration = registry.histogram(
+    "mc_sqlite_commit_duration_seconds", "SQLite commit latency", buckets=openmetrics.FAST_BUCKETS
+)
+operation_duration = registry.histogram(
+    "mc_api_operation_duration_seconds", "Container / RCON / IO operation latency (class=rcon is RCON round-trip)",
+    ("class", "name")
+)
+operation_failures = registry.counter(
+    "mc_api_operation_failures", "Operations that timed out or failed", ("class", "name", "outcome")
+)
+backup_duration = registry.histogram(
+    "mc_backup_duration_seconds", "Snapshot creation time", ("kind",),
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+)
+backup_bytes = registry.counter("mc_backup_bytes", "Bytes processed by snapshots", ("kind", "stage"))
+backup_failures = registry.counter("mc_backup_failures", "Snapshots that failed or were cancelled", ("kind",))
+scheduler_lag = registry.histogram(
+    "mc_scheduler_job_lag_seconds", "Delay between scheduled and actual submission of scheduler jobs", ("job",),
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+)
+scheduler_job_duration = registry.histogram("mc_scheduler_job_duration_seconds", "Scheduler job run time", ("job",))
+scheduler_missed = registry.counter("mc_scheduler_jobs_missed", "Scheduler runs skipped (misfire)", ("job",))
+scheduler_errors = registry.counter("mc_scheduler_job_errors", "Scheduler jobs that raised", ("job",))
+# 直近のスナップショット（スループットのゲージ用）
+LAST_BACKUP: dict = {}
+
+def observe_db(kind: str, elapsed: float):
+    if kind == "commit":
+        db_commit_duration.observe(elapsed)
+    else:
+        db_statement_duration.observe(elapsed, (kind,))
+
+def observe_operation(op_class: str, name: str, elapsed: float, outcome: str):
+    operation_duration.observe(elapsed, (op_class, name))
+    if outcome != "ok":
+        operation_failures.inc((op_class, name, outcome))
+
 # =============================
 # DB
 # =============================
+# スレッドごとの接続を使い回す（WAL・busy_timeout などは接続時に設定）
+database = Database(DB_PATH, observer=observe_db)
+
 def get_db():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+    return database.connection()
+
+# 監査ログ・メトリクス・チャットの INSERT はここに積んでまとめて書く
+write_queue = WriteBehindQueue(
+    get_db, max_rows=WRITE_BATCH_ROWS, interval=WRITE_BATCH_MS / 1000, capacity=WRITE_QUEUE_CAPACITY
+)
+
+# API キーの検証結果（キーの追加・削除で無効化。他プロセスには世代番号で伝える）
+key_cache = ApiKeyCache(
+    get_db, ttl=API_KEY_CACHE_TTL, negative_ttl=API_KEY_NEGATIVE_TTL, check_interval=API_KEY_CHECK_INTERVAL
+)
+
+# パフォーマンスの生データ（エポックミリ秒・1 時間ごとの圧縮ブロック）
+metrics_store = MetricStore(get_db)
+
+# 生データを 1 分 / 1 時間 / 1 日単位に集計する
+rollups = MetricRollup(
+    metrics_store,
+    get_db,
+    raw_days=PERFORMANCE_RAW_DAYS,
+    retention_days={"1m": ROLLUP_MINUTE_DAYS, "1h": ROLLUP_RETENTION_DAYS, "1d": ROLLUP_RETENTION_DAYS},
+    lag=WRITE_BATCH_MS / 1000 + 5,
+)
+
+# チャットの全文検索（chat_logs にトリガーで同期する FTS5 索引）
+chat_index = ChatIndex(get_db)
+# チャット統計のカウンター（日別×プレイヤー・1 時間ごと。トリガーで増減）
+chat_stats = ChatStats(get_db)
+
+def on_event_loop() -> bool:
+    """
+    イベントループのスレッド（async def のエンドポイント）から呼ばれているか
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+def queue_write(sql: str, params, wait: bool = False):
+    """
+    write_queue に積む。キューが一杯なら 503
+
+    スレッドプールからは空くまで少し待つが、イベントループのスレッドでは待たずに
+    すぐ 503 にする（待つとループ全体が止まる）。wait=True はスレッドプールからだけ使う。
+    """
+    try:
+        write_queue.submit(sql, params, wait=wait, timeout=0 if on_event_loop() else 5.0)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Write queue is full, retry later")
+
+def add_column_if_missing(conn, table: str, column: str, definition: str):
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
 
 def init_db():
     with get_db() as conn:
@@ -46,6 +255,16 @@ def init_db():
             created TEXT NOT NULL
         )
         """)
+        key_cache.init_schema(conn)
+        # v4.7: ジョブの submitted_by に API キーそのものを残さない（表示用の名前に置き換える）
+        jobs.init_schema(conn)
+        for (key,) in conn.execute("""
+            SELECT DISTINCT submitted_by FROM jobs
+            WHERE length(submitted_by) = 64 AND submitted_by NOT GLOB '*[^0-9a-f]*'
+        """).fetchall():
+            row = conn.execute("SELECT role, player_name FROM api_keys WHERE key = ?", (key,)).fetchone()
+            user = {"api_key": key, "role": row[0] if row else "unknown", "player_name": row[1] if row else None}
+            conn.execute("UPDATE jobs SET submitted_by = ? WHERE submitted_by = ?", (job_submitter(user), key))
         conn.execute("""
         CREATE TABLE IF NOT EXISTS audit_logs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -57,6 +276,12 @@ def init_db():
             ip TEXT
         )
         """)
+        # /audit/logs の絞り込み（id 順に読むので id を後ろに付ける）と保存期間の削除用
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_time ON audit_logs(time)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_action ON audit_logs(action, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_key ON audit_logs(api_key, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_role ON audit_logs(role, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_ip ON audit_logs(ip, id)")
         conn.execute("""
         CREATE TABLE IF NOT EXISTS backup_schedules (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -68,6 +293,9 @@ def init_db():
             last_run TEXT
         )
         """)
+        # v4.3: スケジュールごとの圧縮方式
+        add_column_if_missing(conn, "backup_schedules", "codec", f"TEXT DEFAULT '{BACKUP_CODEC}'")
+        add_column_if_missing(conn, "backup_schedules", "compression_level", f"INTEGER DEFAULT {BACKUP_LEVEL}")
         
         # v1.3.9: プレイヤーアクティビティ
         conn.execute("""
@@ -90,22 +318,20 @@ def init_db():
             last_join TEXT
         )
         """)
+        # v4.4: ログ取り込みで差分更新する累計
+        add_column_if_missing(conn, "player_stats", "chat_messages", "INTEGER DEFAULT 0")
+        add_column_if_missing(conn, "player_stats", "deaths", "INTEGER DEFAULT 0")
+        add_column_if_missing(conn, "player_stats", "advancements", "INTEGER DEFAULT 0")
+        # v4.7: 名前ではなく UUID で引く（名前は解決するときに大文字・小文字を区別せず探す）
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_activity_player ON player_activity(player_uuid, login_time)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_player_stats_name ON player_stats(player_name COLLATE NOCASE)")
+        uuid_resolver.init_schema(conn)
         
         # v1.3.9: パフォーマンスメトリクス
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS performance_metrics (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            tps REAL,
-            memory_used INTEGER,
-            memory_total INTEGER,
-            memory_percent REAL,
-            entities INTEGER,
-            chunks INTEGER,
-            players INTEGER
-        )
-        """)
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_perf_timestamp ON performance_metrics(timestamp)")
+        # v4.5: 列指向ストアへ移行（旧 performance_metrics は移して削除）
+        metrics_store.init_schema(conn)
+        migrated = metrics_store.migrate(conn)
+        rollups.init_schema(conn)
         
         # v1.3.9: チャットログ
         conn.execute("""
@@ -119,7 +345,15 @@ def init_db():
         )
         """)
         conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_timestamp ON chat_logs(timestamp)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_player ON chat_logs(player_uuid)")
+        # v4.7: プレイヤーごとの新しい順（/chat/player）。player_uuid だけの索引はこれで足りる
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_player_time ON chat_logs(player_uuid, timestamp)")
+        conn.execute("DROP INDEX IF EXISTS idx_chat_player")
+        # v4.6: 全文検索の索引（初回は既存のログから作る）
+        if chat_index.init_schema(conn):
+            print("Chat search index built")
+        # v4.6: /chat/stats 用のカウンター（初回は既存のログから数える）
+        if chat_stats.init_schema(conn):
+            print("Chat counters built")
         
         # v1.3.9: コマンドテンプレート
         conn.execute("""
@@ -134,6 +368,10 @@ def init_db():
         )
         """)
 
+    if migrated:
+        # 移した行を時間枠ごとのブロックにまとめる
+        metrics_store.seal()
+
 # =============================
 # FastAPI
 # =============================
@@ -143,80 +381,442 @@ app = FastAPI(
     version="4.2.0"
 )
 
+# =============================
+# 非同期実行レイヤー
+# =============================
+# 操作クラスごとの同時実行数とタイムアウト（秒）
+ops = AsyncOps(
+    limits={"container": 2, "rcon": RCON_POOL_SIZE * 2, "io": 2, "backup": 1},
+    timeouts={"container": CONTAINER_TIMEOUT, "rcon": RCON_TIMEOUT + 1, "io": 3600},
+    observer=observe_operation,
+)
+
+# =============================
+# RCON
+# =============================
+def server_property(key: str, default: str = "") -> str:
+    """
+    server.properties の値（ファイルやキーがなければ default）
+    """
+    try:
+        with open(os.path.join(MC_DATA_DIR, "server.properties"), encoding="utf-8") as f:
+            for line in f:
+                if line.startswith(key + "="):
+                    return line.split("=", 1)[1].strip()
+    except OSError:
+        pass
+    return default
+
+def rcon_password() -> str:
+    """
+    RCON パスワード（環境変数がなければ server.properties から読む）
+    """
+    return os.getenv("RCON_PASSWORD") or server_property("rcon.password")
+
+rcon_pool = RconPool(
+    RCON_HOST,
+    RCON_PORT,
+    rcon_password,
+    size=RCON_POOL_SIZE,
+    timeout=RCON_TIMEOUT
+)
+
+async def rcon(cmd: str, name: str = None) -> str:
+    try:
+        output = await ops.run("rcon", name or cmd.split(" ", 1)[0], rcon_pool.command(cmd))
+    except (RconError, OperationTimeout) as e:
+        return f"RCON error: {e}"
+    return output.strip()
+
+def rcon_sync(cmd: str) -> str:
+    """
+    スケジューラーなどイベントループ外のスレッドから RCON を実行（失敗時は例外）
+    """
+    return ops.call(ops.run("rcon", cmd.split(" ", 1)[0], rcon_pool.command(cmd)))
+
+# =============================
+# コンテナ制御（Docker Engine API）
+# =============================
+docker_engine = DockerEngine(DOCKER_SOCKET, timeout=CONTAINER_TIMEOUT)
+
+# イベントストリームで更新される inspect 結果（None = コンテナなし）
+CONTAINER_INFO: dict = {"info": None, "loaded": False}
+STATUS_LISTENERS: set = set()
+
+async def container(action: str, *args):
+    """
+    コンテナ操作を実行（Engine API エラーは HTTP エラーに変換）
+    """
+    try:
+        return await ops.run("container", action, getattr(docker_engine, action)(MC_CONTAINER, *args))
+    except DockerError as e:
+        raise HTTPException(status_code=404 if e.status == 404 else 502, detail=e.message)
+    except (OperationTimeout, OSError) as e:
+        raise HTTPException(status_code=504 if isinstance(e, OperationTimeout) else 502, detail=str(e))
+
+async def refresh_container_status() -> dict:
+    """
+    inspect で状態を取り直し、購読者に通知する
+    """
+    try:
+        info = await ops.run("container", "inspect", docker_engine.inspect(MC_CONTAINER))
+    except DockerError as e:
+        if e.status != 404:
+            raise
+        info = None
+    CONTAINER_INFO.update(info=info, loaded=True)
+    current = container_status()
+    for queue in list(STATUS_LISTENERS):
+        queue.put_nowait(current)
+    return current
+
+def container_status() -> dict:
+    info = CONTAINER_INFO["info"]
+    if info is None:
+        return {"status": "not_found", "running": False}
+    return summarize_state(info)
+
+async def watch_container_events():
+    """
+    コンテナイベントを購読して状態キャッシュを更新し続ける
+    """
+    filters = {"type": ["container"], "container": [MC_CONTAINER]}
+    while True:
+        try:
+            # 接続し直すまでの間のイベントは取りこぼすので取り直す
+            await refresh_container_status()
+            async for event in docker_engine.events(filters):
+                # exec_* は rcon-cli などで頻発し、状態は変わらない
+                if event.get("Action", "").startswith("exec_"):
+                    continue
+                await refresh_container_status()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            CONTAINER_INFO["loaded"] = False
+            print(f"Docker event stream error: {e}")
+        await asyncio.sleep(5)
+
+# =============================
+# 内蔵サンプラー
+# =============================
+async def sampler_command(cmd: str) -> str:
+    return await ops.run("rcon", cmd.split(" ", 1)[0], rcon_pool.command(cmd))
+
+async def sampler_container_stats() -> dict:
+    return await ops.run("container", "stats", docker_engine.stats(MC_CONTAINER))
+
+def record_sample(ts: int, sample: dict):
+    """
+    サンプラーの計測値を書き込みキューに積む（一杯なら捨てる。イベントループを止めない）
+    """
+    try:
+        write_queue.submit(
+            metric_store.INSERT, (ts, *(sample.get(name) for name in metric_store.COLUMNS)), timeout=0
+        )
+    except QueueFull:
+        print("Sampler: write queue is full, sample dropped")
+
+sampler = PerformanceSampler(
+    sampler_command,
+    sampler_container_stats,
+    container_status,
+    record_sample,
+    interval=SAMPLER_INTERVAL,
+    idle_interval=SAMPLER_IDLE_INTERVAL,
+    stopped_interval=SAMPLER_STOPPED_INTERVAL,
+)
+
+# =============================
+# オンラインプレイヤー
+# =============================
+# ログの参加・退出で更新し、低頻度の list で補正する（読み取りで RCON を使わない）
+player_registry = PlayerRegistry(
+    sampler_command, container_status, reconcile_interval=PLAYER_RECONCILE_INTERVAL
+)
+whitelist_file = PlayerListFile(os.path.join(MC_DATA_DIR, "whitelist.json"))
+usercache_file = PlayerListFile(os.path.join(MC_DATA_DIR, "usercache.json"))
+ops_file = PlayerListFile(os.path.join(MC_DATA_DIR, "ops.json"))
+ACCESS_LIST_FILES = {"whitelist": whitelist_file, "ops": ops_file}
+ACCESS_LIST_LOCK = asyncio.Lock()
+
+# 名前 ⇔ UUID（usercache.json → 入ったことのあるプレイヤー → オフライン UUID → プロフィール API）
+uuid_resolver = UuidResolver(
+    get_db,
+    usercache_file,
+    lambda: server_property("online-mode", "true").lower() == "false",
+    PROFILE_API_URL,
+    batch_size=PROFILE_BATCH_SIZE,
+    ttl=PROFILE_CACHE_DAYS * 86400,
+    negative_ttl=PROFILE_NEGATIVE_TTL,
+)
+def profile_network(user) -> bool:
+    """
+    プロフィール API の応答を待つか。待つのは管理者だけで、ほかの呼び出し元は
+    ローカルで分からない名前を未解決として扱う（API には裏で問い合わせる）
+    """
+    return user["role"] in ["root", "admin"]
+
+# /players/{name} の NBT（キーは ("live", 名前) / ("file", UUID)）
+player_snapshots = SnapshotCache(ttl=PLAYER_DATA_TTL)
+
+# =============================
+# バックアップリポジトリ
+# =============================
+backup_store = BackupStore(BACKUP_REPO_DIR, workers=BACKUP_WORKERS)
+hot_backup = HotBackupCoordinator(
+    backup_store, rcon_sync, lambda: ops.call(refresh_container_status())["running"],
+    MC_DATA_DIR, BACKUP_STAGING_DIR, LOG_FILE, exclude=WORLD_EXCLUDE
+)
+restorer = RestoreCoordinator(
+    backup_store, MC_DATA_DIR, RESTORE_STAGING_DIR, RESTORE_PREVIOUS_DIR, keep=WORLD_EXCLUDE
+)
+
+def create_snapshot(tag: str, codec: str = BACKUP_CODEC, level: int = BACKUP_LEVEL,
+                    progress=None) -> dict:
+    """
+    MC_DATA_DIR のスナップショットを作成（変更のないチャンクは保存しない）
+
+    サーバー稼働中は save-off の間に変更ファイルだけを凍結コピーする。
+    """
+    ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    kind = "manual" if tag == "manual" else "scheduled"
+    start = time.perf_counter()
+    try:
+        result = hot_backup.run(f"{tag}_{ts}", tag, codec, level, progress)
+    except Exception:
+        backup_failures.inc((kind,))
+        raise
+    elapsed = time.perf_counter() - start
+    backup_duration.observe(elapsed, (kind,))
+    for stage in ("total", "read", "written"):
+        backup_bytes.inc((kind, stage), result.get(f"bytes_{stage}", 0))
+    LAST_BACKUP.update(
+        kind=kind, finished=time.time(), duration=elapsed,
+        throughput=result.get("bytes_total", 0) / elapsed if elapsed > 0 else None
+    )
+    return result
+
+# =============================
+# ジョブ
+# =============================
+# ワールドを読み書きするジョブは同時に 1 件だけ実行する
+jobs = JobManager(get_db, workers=JOB_WORKERS)
+
+def run_backup_job(job) -> dict:
+    """
+    手動 / スケジュールバックアップ
+    """
+    schedule_id = job.params.get("schedule_id")
+    if schedule_id is None:
+        return create_snapshot("manual", progress=job.progress)
+    
+    with get_db() as conn:
+        cur = conn.execute(
+            "SELECT name, max_backups, codec, compression_level FROM backup_schedules WHERE id = ?",
+            (schedule_id,)
+        )
+        row = cur.fetchone()
+    if not row:
+        raise ValueError(f"Schedule {schedule_id} not found")
+    schedule_name, max_backups, codec, level = row
+    
+    # バックアップ作成
+    result = create_snapshot(schedule_name, codec, level, progress=job.progress)
+    
+    # 最終実行時刻を更新
+    with get_db() as conn:
+        conn.execute(
+            "UPDATE backup_schedules SET last_run = ? WHERE id = ?",
+            (datetime.datetime.now().isoformat(), schedule_id)
+        )
+    
+    # 古いバックアップを削除（世代管理）
+    cleanup_old_backups(schedule_name, max_backups)
+    
+    print(f"Auto backup created: {result['name']} ({result['bytes_written']} bytes written)")
+    return result
+
+def run_restore_job(job) -> dict:
+    """
+    バックアップからリストア
+
+    稼働中に展開・検証まで済ませ、停止中はディレクトリの入れ替えだけを行う。
+    """
+    filename = job.params["backup"]
+    source = filename if backup_store.exists(filename) else os.path.join(BACKUP_DIR, filename)
+    ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    
+    # 前回のリストアで取り込み損ねた旧データがあれば先に保存
+    if os.path.isdir(RESTORE_PREVIOUS_DIR):
+        restorer.archive_previous(f"pre_restore_{ts}_leftover", "pre_restore",
+                                  BACKUP_CODEC, BACKUP_LEVEL, WORLD_EXCLUDE)
+    
+    # サーバー稼働中に展開・検証
+    job.progress(message="staging")
+    staged = restorer.stage(source, job.progress)
+    
+    # 停止中はディレクトリを入れ替えるだけ
+    job.progress(message="swapping")
+    try:
+        down_at = time.perf_counter()
+        ops.call(container("stop"))
+        swap = restorer.swap()
+    except BaseException:
+        restorer.discard()
+        ops.call(container("start"))
+        raise
+    ops.call(container("start"))
+    downtime = time.perf_counter() - down_at
+    
+    # 外した現行データを pre_restore スナップショットとして保存
+    job.progress(message="archiving previous world")
+    pre_restore = restorer.archive_previous(f"pre_restore_{ts}", "pre_restore",
+                                            BACKUP_CODEC, BACKUP_LEVEL, WORLD_EXCLUDE)
+    return {
+        "backup": filename,
+        "pre_restore_backup": pre_restore["name"],
+        "staged": staged,
+        "swap_sec": swap["swap_sec"],
+        "downtime_sec": round(downtime, 3),
+    }
+
+def run_upload_job(job) -> dict:
+    """
+    アップロード済みファイルを配置（ZIP は展開）してサーバーを再起動
+    """
+    spool = job.params["spool"]
+    filename = job.params["filename"]
+    if filename.endswith(".zip"):
+        extract_zip(spool, MC_DATA_DIR, BACKUP_WORKERS or 4, job.progress)
+        os.remove(spool)
+    else:
+        path = os.path.join(MC_DATA_DIR, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.move(spool, path)
+    
+    ops.call(container("restart"))
+    return {"filename": filename}
+
+jobs.register("backup", run_backup_job, group="world")
+jobs.register("restore", run_restore_job, group="world")
+jobs.register("upload", run_upload_job, group="world")
+
 # =============================
 # Scheduler
 # =============================
 scheduler = BackgroundScheduler()
+BACKGROUND_TASKS: list = []
 
 def auto_backup(schedule_id: int):
     """
-    自動バックアップを実行
+    自動バックアップをジョブとして投入
     """
     try:
-        with get_db() as conn:
-            cur = conn.execute(
-                "SELECT name, max_backups FROM backup_schedules WHERE id = ?",
-                (schedule_id,)
-            )
-            row = cur.fetchone()
-            if not row:
-                return
-            
-            schedule_name, max_backups = row
-        
-        # バックアップ作成
-        ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_file = os.path.join(BACKUP_DIR, f"{schedule_name}_{ts}.zip")
-        
-        with zipfile.ZipFile(backup_file, "w", zipfile.ZIP_DEFLATED) as zipf:
-            for root, _, files in os.walk(MC_DATA_DIR):
-                for f in files:
-                    full = os.path.join(root, f)
-                    zipf.write(full, os.path.relpath(full, MC_DATA_DIR))
-        
-        # 最終実行時刻を更新
-        with get_db() as conn:
-            conn.execute(
-                "UPDATE backup_schedules SET last_run = ? WHERE id = ?",
-                (datetime.datetime.now().isoformat(), schedule_id)
-            )
-        
-        # 古いバックアップを削除（世代管理）
-        cleanup_old_backups(schedule_name, max_backups)
-        
-        print(f"Auto backup created: {backup_file}")
+        jobs.submit("backup", {"schedule_id": schedule_id}, submitted_by="scheduler")
     except Exception as e:
         print(f"Auto backup failed: {e}")
 
 def cleanup_old_backups(schedule_name: str, max_backups: int):
     """
-    古いバックアップファイルを削除
+    古いスナップショットを削除し、参照されなくなったチャンクを回収
     """
-    pattern = os.path.join(BACKUP_DIR, f"{schedule_name}_*.zip")
-    backups = sorted(glob.glob(pattern), key=os.path.getmtime, reverse=True)
+    snapshots = backup_store.list_snapshots(tag=schedule_name)
     
-    # max_backups を超えた古いバックアップを削除
-    for old_backup in backups[max_backups:]:
+    # max_backups を超えた古いスナップショットを削除
+    for old in snapshots[max_backups:]:
         try:
-            os.remove(old_backup)
-            print(f"Deleted old backup: {old_backup}")
+            backup_store.delete_snapshot(old["name"])
+            print(f"Deleted old backup: {old['name']}")
         except Exception as e:
-            print(f"Failed to delete {old_backup}: {e}")
+            print(f"Failed to delete {old['name']}: {e}")
+    
+    result = backup_store.gc()
+    if result["chunks_deleted"]:
+        print(f"Backup GC: {result['chunks_deleted']} chunks, {result['bytes_freed']} bytes freed")
 
 def cleanup_old_data():
     """
     古いデータを定期的にクリーンアップ
     """
-    with get_db() as conn:
-        # パフォーマンスデータ: 7日以上前を削除
-        cutoff_perf = (datetime.datetime.now() - datetime.timedelta(days=7)).isoformat()
-        conn.execute("DELETE FROM performance_metrics WHERE timestamp < ?", (cutoff_perf,))
-        
-        # チャットログ: 30日以上前を削除
-        cutoff_chat = (datetime.datetime.now() - datetime.timedelta(days=30)).isoformat()
-        conn.execute("DELETE FROM chat_logs WHERE timestamp < ?", (cutoff_chat,))
-        
-        print("Old data cleanup completed")
+    # チャットログ: 30日以上前を削除（全文検索の索引もトリガーで消すので少しずつ）
+    cutoff_chat = (datetime.datetime.now() - datetime.timedelta(days=30)).isoformat()
+    while True:
+        with get_db() as conn:
+            cur = conn.execute("""
+            DELETE FROM chat_logs WHERE id IN (
+                SELECT id FROM chat_logs WHERE timestamp < ? LIMIT 5000
+            )
+            """, (cutoff_chat,))
+        if cur.rowcount < 5000:
+            break
+    chat_stats.prune()
+
+    # 監査ログ: 保存期間を過ぎた分を少しずつ削除（書き込みを長く止めない）
+    if AUDIT_RETENTION_DAYS > 0:
+        cutoff_audit = (datetime.datetime.now() - datetime.timedelta(days=AUDIT_RETENTION_DAYS)).isoformat()
+        while True:
+            with get_db() as conn:
+                cur = conn.execute("""
+                DELETE FROM audit_logs WHERE id IN (
+                    SELECT id FROM audit_logs WHERE time < ? LIMIT 5000
+                )
+                """, (cutoff_audit,))
+            if cur.rowcount < 5000:
+                break
+
+    # パフォーマンスデータ: PERFORMANCE_RAW_DAYS 日以上前を削除（長期の推移はロールアップに残る）
+    metrics_store.prune(metric_store.now_ms() - PERFORMANCE_RAW_DAYS * 86400 * 1000)
+    rollups.prune()
+
+    print("Old data cleanup completed")
+    
+    # 大量削除で伸びた WAL を縮める
+    database.checkpoint("TRUNCATE")
+
+def checkpoint_db():
+    """
+    WAL を DB 本体に書き戻す（自動チェックポイントが読み取りに負けて進まない場合の保険）
+    """
+    result = database.checkpoint()
+    if result["busy"]:
+        print(f"DB checkpoint incomplete: {result}")
+
+def optimize_db():
+    database.optimize()
+
+def rollup_metrics():
+    """
+    閉じた 1 時間枠を圧縮ブロックにまとめ、閉じたバケットを集計する
+    """
+    metrics_store.seal()
+    rollups.run()
+
+# submit から終了までの時間を測るための開始時刻（ジョブ ID ごと）
+SCHEDULER_STARTED: dict = {}
+
+def scheduler_listener(event):
+    """
+    スケジューラーの遅れ（予定時刻から実際の投入まで）とジョブの所要時間を記録する
+    """
+    job = event.job_id
+    if event.code == EVENT_JOB_SUBMITTED:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for run_time in event.scheduled_run_times:
+            scheduler_lag.observe(max(0.0, (now - run_time).total_seconds()), (job,))
+        SCHEDULER_STARTED[job] = time.perf_counter()
+    elif event.code == EVENT_JOB_MISSED:
+        scheduler_missed.inc((job,))
+    else:
+        started = SCHEDULER_STARTED.pop(job, None)
+        if started is not None:
+            scheduler_job_duration.observe(time.perf_counter() - started, (job,))
+        if event.code == EVENT_JOB_ERROR:
+            scheduler_errors.inc((job,))
+
+scheduler.add_listener(
+    scheduler_listener, EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED
+)
 
 def load_schedules():
     """
@@ -251,8 +851,24 @@ def load_schedules():
                 print(f"Failed to load schedule {name}: {e}")
 
 @app.on_event("startup")
-def startup():
+async def startup():
+    ops.bind_loop(asyncio.get_running_loop())
+    player_registry.bind_loop(asyncio.get_running_loop())
     init_db()
+    write_queue.start()
+    log_ingester.load_state()
+    player_registry.seed(log_ingester.sessions)
+    jobs.start()
+    BACKGROUND_TASKS.append(asyncio.create_task(watch_container_events()))
+    BACKGROUND_TASKS.append(asyncio.create_task(log_follower.run()))
+    BACKGROUND_TASKS.append(asyncio.create_task(log_ingester.run(log_follower)))
+    if SAMPLER_ENABLED:
+        sampler_events = asyncio.Queue()
+        STATUS_LISTENERS.add(sampler_events)
+        BACKGROUND_TASKS.append(asyncio.create_task(sampler.run(sampler_events)))
+    registry_events = asyncio.Queue()
+    STATUS_LISTENERS.add(registry_events)
+    BACKGROUND_TASKS.append(asyncio.create_task(player_registry.run(registry_events)))
     load_schedules()
     
     # データクリーンアップを毎日実行
@@ -262,12 +878,39 @@ def startup():
         id="cleanup_old_data",
         replace_existing=True
     )
+    scheduler.add_job(
+        checkpoint_db,
+        IntervalTrigger(minutes=DB_CHECKPOINT_MINUTES),
+        id="checkpoint_db",
+        replace_existing=True
+    )
+    scheduler.add_job(
+        optimize_db,
+        IntervalTrigger(hours=1),
+        id="optimize_db",
+        replace_existing=True
+    )
+    scheduler.add_job(
+        rollup_metrics,
+        IntervalTrigger(minutes=1),
+        id="rollup_metrics",
+        replace_existing=True
+    )
     
     scheduler.start()
 
 @app.on_event("shutdown")
-def shutdown():
+async def shutdown():
+    for task in BACKGROUND_TASKS:
+        task.cancel()
     scheduler.shutdown()
+    jobs.shutdown()
+    # 積まれている書き込みを最後まで反映する
+    write_queue.close()
+    rcon_pool.close()
+    uuid_resolver.shutdown()
+    backup_store.close()
+    docker_engine.close()
 
 # =============================
 # CORS
@@ -280,6 +923,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# リクエスト数とレイテンシ（最後に追加したものが一番外側になる）
+app.add_middleware(RequestMetrics, duration=http_duration, requests=http_requests)
+
 # =============================
 # Auth
 # =============================
@@ -309,13 +955,7 @@ def verify_api_key(
             "ip": request.client.host
         }
 
-    with get_db() as conn:
-        cur = conn.execute(
-            "SELECT role, player_name FROM api_keys WHERE key = ?",
-            (x_api_key,)
-        )
-        row = cur.fetchone()
-
+    row = key_cache.lookup(x_api_key)
     if not row:
         raise HTTPException(status_code=403, detail="Invalid API Key")
 
@@ -326,36 +966,130 @@ def verify_api_key(
         "ip": request.client.host
     }
 
+def job_submitter(user) -> str:
+    """
+    ジョブの submitted_by に残す名前（API キーそのものは残さない）
+    """
+    if user["api_key"] == "ROOT":
+        return "ROOT"
+    if user["player_name"]:
+        return f"{user['role']}:{user['player_name']}"
+    return f"{user['role']}:key-{hashlib.sha256(user['api_key'].encode()).hexdigest()[:12]}"
+
+def can_see_job(job: dict, user) -> bool:
+    """
+    admin / root はすべてのジョブ、それ以外は自分が投入したジョブだけ見られる
+    """
+    return user["role"] in ["root", "admin"] or job["submitted_by"] == job_submitter(user)
+
 # =============================
 # Audit Log
 # =============================
+# 状態を変えない操作（監視のポーリングで大量に呼ばれる）
+READ_ONLY_ACTIONS = {
+    "status", "metrics", "players_list", "player_detail", "get_player_stats",
+    "logs", "log_search", "list_plugins", "list_backups", "whitelist_list", "resolve_profiles",
+}
+
+audit_stats = {"queued": 0, "sampled_out": 0, "dropped": 0}
+# log_action はイベントループとスレッドプールの両方から呼ばれる
+AUDIT_STATS_LOCK = threading.Lock()
+
+def count_audit(outcome: str):
+    with AUDIT_STATS_LOCK:
+        audit_stats[outcome] += 1
+
+def audit_snapshot() -> dict:
+    with AUDIT_STATS_LOCK:
+        return dict(audit_stats)
+
 def log_action(user, action, detail=""):
-    with get_db() as conn:
-        conn.execute("""
-        INSERT INTO audit_logs (time, api_key, role, action, detail, ip)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """, (
-            datetime.datetime.now().isoformat(),
-            user["api_key"],
-            user["role"],
-            action,
-            detail,
-            user["ip"]
-        ))
+    """
+    監査ログを書き込みキューに積む（コミットは待たない）
+
+    読み取り系の操作は AUDIT_READ_SAMPLE / AUDIT_SAMPLING の割合で間引き、
+    キューが一杯なら捨てる。状態を変える操作は必ず記録する（一杯なら 503）。
+    """
+    read_only = action in READ_ONLY_ACTIONS
+    rate = AUDIT_SAMPLING.get(action, AUDIT_READ_SAMPLE if read_only else 1.0)
+    if rate < 1.0 and random.random() >= rate:
+        count_audit("sampled_out")
+        return
+    params = (
+        datetime.datetime.now().isoformat(),
+        user["api_key"],
+        user["role"],
+        action,
+        detail,
+        user["ip"]
+    )
+    sql = """
+    INSERT INTO audit_logs (time, api_key, role, action, detail, ip)
+    VALUES (?, ?, ?, ?, ?, ?)
+    """
+    if read_only:
+        try:
+            write_queue.submit(sql, params, timeout=0)
+        except QueueFull:
+            count_audit("dropped")
+            return
+    else:
+        queue_write(sql, params)
+    count_audit("queued")
 
 @app.get("/audit/logs", tags=["Audit"])
-def get_audit_logs(user=Depends(verify_root)):
+def get_audit_logs(
+    cursor: Optional[int] = None,
+    limit: int = 100,
+    action: Optional[str] = None,
+    api_key: Optional[str] = None,
+    role: Optional[str] = None,
+    ip: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    user=Depends(verify_root)
+):
+    """
+    監査ログを新しい順に取得
+
+    cursor には前回の応答の next_cursor を渡す（id によるキーセットページング）。
+    since / until は ISO 8601 の日時（until は含まない）。
+    """
+    conditions, params = [], []
+    if cursor is not None:
+        conditions.append("id < ?")
+        params.append(cursor)
+    for column, value in (("action", action), ("api_key", api_key), ("role", role), ("ip", ip)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+    for op, value in ((">=", since), ("<", until)):
+        if value is not None:
+            try:
+                value = datetime.datetime.fromisoformat(value).isoformat()
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid datetime: {value}")
+            conditions.append(f"time {op} ?")
+            params.append(value)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    limit = max(1, min(limit, 1000))
+
     with get_db() as conn:
-        cur = conn.execute("""
-        SELECT time, api_key, role, action, detail, ip
+        cur = conn.execute(f"""
+        SELECT id, time, api_key, role, action, detail, ip
         FROM audit_logs
+        {where}
         ORDER BY id DESC
-        LIMIT 100
-        """)
-        return [
-            dict(time=t, api_key=k, role=r, action=a, detail=d, ip=i)
-            for t, k, r, a, d, i in cur.fetchall()
+        LIMIT ?
+        """, (*params, limit))
+        rows = [
+            dict(id=n, time=t, api_key=k, role=r, action=a, detail=d, ip=i)
+            for n, t, k, r, a, d, i in cur.fetchall()
         ]
+    return {
+        "logs": rows,
+        "next_cursor": rows[-1]["id"] if len(rows) == limit else None,
+    }
 
 # =============================
 # API Key 管理（プレイヤー名対応）
@@ -377,6 +1111,9 @@ def create_api_key(req: CreateKeyRequest, user=Depends(verify_root)):
             "INSERT INTO api_keys VALUES (?, ?, ?, ?)",
             (key, req.role, req.player_name, created)
         )
+        key_cache.invalidate(conn, key)
+    # コミット前に別スレッドが覚えた「存在しない」を捨てる
+    key_cache.evict(key)
 
     log_action(user, "create_api_key", f"player={req.player_name}, role={req.role}")
     return {"api_key": key, "role": req.role, "player_name": req.player_name}
@@ -405,70 +1142,162 @@ def get_my_key_info(user=Depends(verify_api_key)):
 def delete_api_key(key: str, user=Depends(verify_root)):
     with get_db() as conn:
         conn.execute("DELETE FROM api_keys WHERE key = ?", (key,))
+        key_cache.invalidate(conn, key)
+    # コミット前に別スレッドが覚えた古い結果を捨てる
+    key_cache.evict(key)
     log_action(user, "delete_api_key", key)
     return {"deleted": key}
 
 # =============================
-# Whitelist 管理
+# Whitelist / Operator の一括変更
 # =============================
-def rcon(cmd: str) -> str:
-    result = subprocess.run(
-        ["docker", "exec", "mc-server", "rcon-cli", cmd],
-        capture_output=True,
-        text=True
-    )
-    return (result.stdout or result.stderr).strip()
+class BulkPlayersRequest(BaseModel):
+    add: List[str] = []
+    remove: List[str] = []
+
+class SyncPlayersRequest(BaseModel):
+    players: List[str]
+
+def edit_access_list(kind: str, changes: dict) -> list:
+    """
+    停止中: ファイルを直接書き換える（新しく載せるプレイヤーの UUID は resolver で引く）
+    """
+    list_file = ACCESS_LIST_FILES[kind]
+    try:
+        op_level = int(server_property("op-permission-level", "4"))
+    except ValueError:
+        op_level = 4
+    uuids = uuid_resolver.resolve(changes["add"]) if changes["add"] else {}
+    entries, results = access_lists.edit(list(list_file.entries()), kind, changes, uuids.get, op_level)
+    if any(r["result"] != "failed" for r in results):
+        list_file.save(entries)
+    return results
+
+async def change_access_list(kind: str, add=(), remove=(), sync=None) -> dict:
+    """
+    whitelist.json / ops.json と突き合わせて、変わるプレイヤーだけを変更する
+
+    稼働中は 1 本の RCON 接続にコマンドをパイプラインで流し、停止中はファイルを直接書き換える。
+    コンテナの状態が取れないときはどちらもせず 503。
+    同時に来た要求は順に処理する（ファイルの読み書きが重ならないように）。
+    """
+    list_file = ACCESS_LIST_FILES[kind]
+    async with ACCESS_LIST_LOCK:
+        try:
+            changes = access_lists.plan(list_file.entries(), add, remove, sync)
+        except ListError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        pending = access_lists.commands(kind, changes)
+        results = access_lists.unchanged_results(changes)
+
+        if pending and not CONTAINER_INFO["loaded"]:
+            # 状態がわからないまま稼働中のサーバーのファイルを書き換えないように取り直す
+            try:
+                await refresh_container_status()
+            except (DockerError, OperationTimeout, OSError) as e:
+                raise HTTPException(status_code=503, detail=f"Server state is unknown: {e}")
+
+        if not pending:
+            method = "none"
+        elif container_status().get("running"):
+            method = "rcon"
+            window_timeout = RCON_TIMEOUT + access_lists.COMMAND_SECONDS * PIPELINE_WINDOW
+            windows = -(-len(pending) // PIPELINE_WINDOW)
+            try:
+                outputs = await ops.run(
+                    "rcon", f"{kind}_bulk",
+                    rcon_pool.pipeline([cmd for _, _, cmd in pending], timeout=window_timeout),
+                    timeout=RCON_TIMEOUT + window_timeout * windows
+                )
+                results += [access_lists.command_result(name, action, output)
+                            for (name, action, _), output in zip(pending, outputs)]
+            except (RconError, OperationTimeout) as e:
+                # 途中まで実行されたかもしれない: サーバーが書いたファイルで確かめる
+                print(f"Bulk {kind} change failed: {e}")
+                results += access_lists.verify(list_file.entries(), pending, f"RCON error: {e}")
+        else:
+            method = "file"
+            try:
+                results += await asyncio.to_thread(edit_access_list, kind, changes)
+            except OSError as e:
+                raise HTTPException(status_code=500, detail=f"Failed to write {os.path.basename(list_file.path)}: {e}")
+
+    summary = {}
+    for r in results:
+        summary[r["result"]] = summary.get(r["result"], 0) + 1
+    return {"method": method, "commands": len(pending) if method == "rcon" else 0,
+            "summary": summary, "results": results}
 
+# =============================
+# Whitelist 管理
+# =============================
 @app.post("/whitelist/add/{player}", tags=["Whitelist"])
-def whitelist_add(player: str, user=Depends(verify_api_key)):
+async def whitelist_add(player: str, user=Depends(verify_api_key)):
     """
     ホワイトリストにプレイヤーを追加
     """
-    output = rcon(f"whitelist add {player}")
+    output = await rcon(f"whitelist add {player}")
     log_action(user, "whitelist_add", player)
     return {"player": player, "output": output}
 
 @app.post("/whitelist/remove/{player}", tags=["Whitelist"])
-def whitelist_remove(player: str, user=Depends(verify_api_key)):
+async def whitelist_remove(player: str, user=Depends(verify_api_key)):
     """
     ホワイトリストからプレイヤーを削除
     """
-    output = rcon(f"whitelist remove {player}")
+    output = await rcon(f"whitelist remove {player}")
     log_action(user, "whitelist_remove", player)
     return {"player": player, "output": output}
 
 @app.get("/whitelist", tags=["Whitelist"])
-def whitelist_list(user=Depends(verify_api_key)):
+async def whitelist_list(user=Depends(verify_api_key)):
     """
-    ホワイトリストを表示
+    ホワイトリストを表示（サーバーの whitelist.json を読む。RCON は使わない）
     """
-    output = rcon("whitelist list")
+    entries = whitelist_file.entries()
     log_action(user, "whitelist_list")
-    
-    # 出力例: "There are 3 whitelisted players: Steve, Alex, Notch"
-    if ":" in output:
-        players_str = output.split(":", 1)[1].strip()
-        players = [p.strip() for p in players_str.split(",")] if players_str else []
-    else:
-        players = []
-    
-    return {"players": players, "raw_output": output}
+    return {
+        "players": [entry.get("name") for entry in entries],
+        "entries": entries
+    }
+
+@app.post("/whitelist/bulk", tags=["Whitelist"])
+async def whitelist_bulk(req: BulkPlayersRequest, user=Depends(verify_api_key)):
+    """
+    ホワイトリストにまとめて追加・削除（載っている / いないプレイヤーにはコマンドを出さない）
+    """
+    result = await change_access_list("whitelist", req.add, req.remove)
+    log_action(user, "whitelist_bulk", json.dumps(
+        {"add": req.add, "remove": req.remove, "method": result["method"], **result["summary"]}
+    ))
+    return result
+
+@app.post("/whitelist/sync", tags=["Whitelist"])
+async def whitelist_sync(req: SyncPlayersRequest, user=Depends(verify_api_key)):
+    """
+    ホワイトリストを players の全員だけにする（足りない人を追加し、それ以外を削除）
+    """
+    result = await change_access_list("whitelist", sync=req.players)
+    log_action(user, "whitelist_sync", json.dumps(
+        {"players": req.players, "method": result["method"], **result["summary"]}
+    ))
+    return result
 
 @app.post("/whitelist/enable", tags=["Whitelist"])
-def whitelist_enable(user=Depends(verify_api_key)):
+async def whitelist_enable(user=Depends(verify_api_key)):
     """
     ホワイトリストを有効化
     """
-    output = rcon("whitelist on")
+    output = await rcon("whitelist on")
     log_action(user, "whitelist_enable")
     return {"output": output}
 
 @app.post("/whitelist/disable", tags=["Whitelist"])
-def whitelist_disable(user=Depends(verify_api_key)):
+async def whitelist_disable(user=Depends(verify_api_key)):
     """
     ホワイトリストを無効化
     """
-    output = rcon("whitelist off")
+    output = await rcon("whitelist off")
     log_action(user, "whitelist_disable")
     return {"output": output}
 
@@ -476,7 +1305,7 @@ def whitelist_disable(user=Depends(verify_api_key)):
 # Operator 管理
 # =============================
 @app.post("/op/add/{player}", tags=["Operator"])
-def op_add(player: str, user=Depends(verify_api_key)):
+async def op_add(player: str, user=Depends(verify_api_key)):
     """
     プレイヤーにOP権限を付与
     """
@@ -484,22 +1313,50 @@ def op_add(player: str, user=Depends(verify_api_key)):
     if user["role"] not in ["root", "admin"]:
         raise HTTPException(status_code=403, detail="Admin role required")
     
-    output = rcon(f"op {player}")
+    output = await rcon(f"op {player}")
     log_action(user, "op_add", player)
     return {"player": player, "output": output}
 
 @app.post("/op/remove/{player}", tags=["Operator"])
-def op_remove(player: str, user=Depends(verify_api_key)):
+async def op_remove(player: str, user=Depends(verify_api_key)):
     """
     プレイヤーからOP権限を削除
     """
     if user["role"] not in ["root", "admin"]:
         raise HTTPException(status_code=403, detail="Admin role required")
     
-    output = rcon(f"deop {player}")
+    output = await rcon(f"deop {player}")
     log_action(user, "op_remove", player)
     return {"player": player, "output": output}
 
+@app.post("/op/bulk", tags=["Operator"])
+async def op_bulk(req: BulkPlayersRequest, user=Depends(verify_api_key)):
+    """
+    OP 権限をまとめて付与・削除（管理者のみ）
+    """
+    if user["role"] not in ["root", "admin"]:
+        raise HTTPException(status_code=403, detail="Admin role required")
+
+    result = await change_access_list("ops", req.add, req.remove)
+    log_action(user, "op_bulk", json.dumps(
+        {"add": req.add, "remove": req.remove, "method": result["method"], **result["summary"]}
+    ))
+    return result
+
+@app.post("/op/sync", tags=["Operator"])
+async def op_sync(req: SyncPlayersRequest, user=Depends(verify_api_key)):
+    """
+    OP を players の全員だけにする（管理者のみ）
+    """
+    if user["role"] not in ["root", "admin"]:
+        raise HTTPException(status_code=403, detail="Admin role required")
+
+    result = await change_access_list("ops", sync=req.players)
+    log_action(user, "op_sync", json.dumps(
+        {"players": req.players, "method": result["method"], **result["summary"]}
+    ))
+    return result
+
 # =============================
 # Plugin 管理（PAPER/SPIGOT用）
 # =============================
@@ -571,7 +1428,7 @@ def delete_plugin(filename: str, user=Depends(verify_api_key)):
     return {"status": "deleted", "plugin": filename, "note": "Server restart required"}
 
 @app.post("/plugins/reload", tags=["Plugins"])
-def reload_plugins(user=Depends(verify_api_key)):
+async def reload_plugins(user=Depends(verify_api_key)):
     """
     プラグインをリロード（Bukkit/Spigot/Paper）
     """
@@ -579,11 +1436,11 @@ def reload_plugins(user=Depends(verify_api_key)):
         raise HTTPException(status_code=403, detail="Admin role required")
     
     # plugmanがインストールされていれば使用
-    output = rcon("plugman reload all")
+    output = await rcon("plugman reload all")
     
     # なければBukkitの標準コマンド（あまり推奨されないが）
     if "Unknown command" in output or "plugman" not in output.lower():
-        output = rcon("reload confirm")
+        output = await rcon("reload confirm")
     
     log_action(user, "reload_plugins")
     return {"output": output}
@@ -596,13 +1453,18 @@ def get_player_stats(player_name: str, user=Depends(verify_api_key)):
     """
     プレイヤーの統計情報を取得
     """
+    player_uuid = uuid_resolver.resolve_one(player_name, profile_network(user))
+    if not player_uuid:
+        raise HTTPException(status_code=404, detail="Player not found")
+
     with get_db() as conn:
         # 統計情報
         cur = conn.execute("""
-            SELECT player_uuid, player_name, total_playtime, total_sessions, first_join, last_join
+            SELECT player_uuid, player_name, total_playtime, total_sessions, first_join, last_join,
+                   chat_messages, deaths, advancements
             FROM player_stats
-            WHERE player_name = ?
-        """, (player_name,))
+            WHERE player_uuid = ?
+        """, (player_uuid,))
         stats = cur.fetchone()
         
         if not stats:
@@ -612,10 +1474,10 @@ def get_player_stats(player_name: str, user=Depends(verify_api_key)):
         cur = conn.execute("""
             SELECT login_time, logout_time, session_duration
             FROM player_activity
-            WHERE player_name = ?
+            WHERE player_uuid = ?
             ORDER BY login_time DESC
             LIMIT 10
-        """, (player_name,))
+        """, (player_uuid,))
         recent = [
             {
                 "login": login,
@@ -625,6 +1487,19 @@ def get_player_stats(player_name: str, user=Depends(verify_api_key)):
             for login, logout, duration in cur.fetchall()
         ]
         
+        # 最近の死亡・進捗
+        cur = conn.execute("""
+            SELECT timestamp, type, detail
+            FROM player_events
+            WHERE player_uuid = ?
+            ORDER BY timestamp DESC
+            LIMIT 10
+        """, (stats[0],))
+        events = [
+            {"timestamp": ts, "type": event_type, "detail": detail}
+            for ts, event_type, detail in cur.fetchall()
+        ]
+        
         log_action(user, "get_player_stats", player_name)
         
         return {
@@ -634,7 +1509,11 @@ def get_player_stats(player_name: str, user=Depends(verify_api_key)):
             "total_sessions": stats[3],
             "first_join": stats[4],
             "last_join": stats[5],
-            "recent_activity": recent
+            "chat_messages": stats[6],
+            "deaths": stats[7],
+            "advancements": stats[8],
+            "recent_activity": recent,
+            "recent_events": events
         }
 
 @app.get("/stats/players", tags=["Statistics"])
@@ -644,7 +1523,7 @@ def get_all_player_stats(user=Depends(verify_api_key)):
     """
     with get_db() as conn:
         cur = conn.execute("""
-            SELECT player_name, total_playtime, total_sessions, last_join
+            SELECT player_name, total_playtime, total_sessions, last_join, chat_messages, deaths, advancements
             FROM player_stats
             ORDER BY total_playtime DESC
         """)
@@ -654,11 +1533,112 @@ def get_all_player_stats(user=Depends(verify_api_key)):
                 "player_name": name,
                 "total_playtime_hours": round(playtime / 3600, 2),
                 "total_sessions": sessions,
-                "last_join": last_join
+                "last_join": last_join,
+                "chat_messages": chats,
+                "deaths": deaths,
+                "advancements": advancements
             }
-            for name, playtime, sessions, last_join in cur.fetchall()
+            for name, playtime, sessions, last_join, chats, deaths, advancements in cur.fetchall()
         ]
 
+# =============================
+# 一括取り込み
+# =============================
+async def read_bulk_rows(request: Request) -> list:
+    """
+    JSON 配列、または NDJSON（1 行 1 オブジェクト）のボディを行のリストにする
+
+    NDJSON は受信しながら分割する。JSON として読めない行は ValueError を入れておく。
+    """
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        rows = []
+        buf = b""
+
+        def take(line: bytes):
+            if line.strip():
+                try:
+                    rows.append(json.loads(line))
+                except ValueError as e:
+                    rows.append(ValueError(f"Invalid JSON: {e}"))
+
+        async for chunk in request.stream():
+            buf += chunk
+            *lines, buf = buf.split(b"\n")
+            for line in lines:
+                take(line)
+            if len(rows) > BULK_MAX_ROWS:
+                break
+        take(buf)
+    else:
+        try:
+            rows = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    
+    if len(rows) > BULK_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"Too many rows (max {BULK_MAX_ROWS})")
+    return rows
+
+def validate_bulk_rows(model, rows: list):
+    """
+    全行を 1 回で検証し、(有効な (行番号, モデル), エラー) を返す
+    """
+    valid, errors = [], []
+    for index, row in enumerate(rows):
+        if isinstance(row, Exception):
+            errors.append({"index": index, "error": str(row)})
+            continue
+        try:
+            valid.append((index, model.model_validate(row)))
+        except ValidationError as e:
+            message = "; ".join(
+                f"{'.'.join(str(p) for p in err['loc']) or 'row'}: {err['msg']}" for err in e.errors()
+            )
+            errors.append({"index": index, "error": message})
+    return valid, errors
+
+def bulk_timestamp(value: Optional[datetime.datetime], received: str) -> str:
+    """
+    クライアント指定の時刻（ISO 8601 / UNIX 秒・ミリ秒）を DB の形式（ローカル時刻）に
+    """
+    if value is None:
+        return received
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value.isoformat()
+
+def bulk_insert(sql: str, rows: list) -> list:
+    """
+    (行番号, パラメータ) を 1 トランザクションで executemany し、失敗した行を返す
+
+    executemany が途中で失敗した場合はセーブポイントまで戻して 1 行ずつ入れ直す。
+    """
+    errors = []
+    with get_db() as conn:
+        conn.execute("SAVEPOINT bulk")
+        try:
+            conn.executemany(sql, [params for _, params in rows])
+        except sqlite3.Error:
+            conn.execute("ROLLBACK TO bulk")
+            for index, params in rows:
+                try:
+                    conn.execute(sql, params)
+                except sqlite3.Error as e:
+                    errors.append({"index": index, "error": str(e)})
+        conn.execute("RELEASE bulk")
+    return errors
+
+def bulk_result(received: int, errors: list) -> dict:
+    return {
+        "received": received,
+        "inserted": received - len(errors),
+        "rejected": len(errors),
+        "errors": sorted(errors, key=lambda e: e["index"])
+    }
+
 # =============================
 # v1.3.9: パフォーマンスモニタリング
 # =============================
@@ -667,58 +1647,63 @@ def get_current_performance(user=Depends(verify_api_key)):
     """
     現在のパフォーマンス情報を取得
     """
-    with get_db() as conn:
-        cur = conn.execute("""
-            SELECT timestamp, tps, memory_used, memory_total, memory_percent, 
-                   entities, chunks, players
-            FROM performance_metrics
-            ORDER BY timestamp DESC
-            LIMIT 1
-        """)
-        row = cur.fetchone()
-        
-        if not row:
-            return {"message": "No performance data available"}
-        
-        return {
-            "timestamp": row[0],
-            "tps": row[1],
-            "memory_used_mb": row[2],
-            "memory_total_mb": row[3],
-            "memory_percent": row[4],
-            "entities": row[5],
-            "chunks": row[6],
-            "players": row[7]
-        }
+    row = metrics_store.latest()
+    if not row:
+        return {"message": "No performance data available"}
+
+    return {
+        "timestamp": metric_store.iso(row["ts"]),
+        "tps": row["tps"],
+        "memory_used_mb": row["memory_used"],
+        "memory_total_mb": row["memory_total"],
+        "memory_percent": row["memory_percent"],
+        "entities": row["entities"],
+        "chunks": row["chunks"],
+        "players": row["players"]
+    }
 
 @app.get("/performance/history", tags=["Performance"])
 def get_performance_history(
     hours: int = 1,
+    max_points: int = 1440,
+    resolution: Optional[str] = None,
     user=Depends(verify_api_key)
 ):
     """
     パフォーマンス履歴を取得
-    """
-    cutoff = (datetime.datetime.now() - datetime.timedelta(hours=hours)).isoformat()
-    
-    with get_db() as conn:
-        cur = conn.execute("""
-            SELECT timestamp, tps, memory_percent, entities, chunks
-            FROM performance_metrics
-            WHERE timestamp > ?
-            ORDER BY timestamp ASC
-        """, (cutoff,))
-        
-        return [
-            {
-                "timestamp": ts,
-                "tps": tps,
-                "memory_percent": mem_pct,
-                "entities": ent,
-                "chunks": chunks
-            }
-            for ts, tps, mem_pct, ent, chunks in cur.fetchall()
-        ]
+
+    resolution（raw / 1m / 1h / 1d）を省略すると、max_points 以内に収まる
+    いちばん細かい解像度を選ぶ。ロールアップは閉じたバケットだけなので
+    直近の数分（1h なら現在の 1 時間）は含まれない。1d でも収まらなければ
+    連続するバケットをまとめる。raw を指定した場合は間引かない。
+    """
+    if resolution is not None and resolution != "raw" and resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown resolution: {resolution}")
+    max_points = max(1, max_points)
+    cutoff_ms = metric_store.now_ms() - hours * 3600 * 1000
+    cutoff = metric_store.iso(cutoff_ms)
+
+    if resolution is None:
+        if hours <= PERFORMANCE_RAW_DAYS * 24 and metrics_store.count(cutoff_ms, max_points) <= max_points:
+            resolution = "raw"
+        if resolution is None:
+            resolution = next(
+                (name for name, (seconds, _, _) in RESOLUTIONS.items() if hours * 3600 / seconds <= max_points),
+                "1d"
+            )
+
+    if resolution == "raw":
+        columns = metrics_store.range(cutoff_ms, columns=rollup.METRICS)
+        names = ("timestamp",) + rollup.METRICS
+        columns["ts"] = [metric_store.iso(ts) for ts in columns["ts"]]
+        points = [dict(zip(names, values)) for values in zip(*columns.values())]
+        return {"resolution": "raw", "points": points}
+
+    points = rollups.query(resolution, cutoff)
+    if len(points) > max_points:
+        step = -(-len(points) // max_points)
+        points = [rollup.merge(points[i:i + step]) for i in range(0, len(points), step)]
+    return {"resolution": resolution, "bucket_seconds": RESOLUTIONS[resolution][0], "points": points}
 
 class PerformanceRecord(BaseModel):
     tps: float
@@ -728,32 +1713,52 @@ class PerformanceRecord(BaseModel):
     entities: int
     chunks: int
     players: int
+    mspt: Optional[float] = None
+
+def performance_params(ts: int, record: PerformanceRecord) -> tuple:
+    """
+    metric_store.INSERT のパラメータ（送られてこない列は None）
+    """
+    return (ts, *(getattr(record, name, None) for name in metric_store.COLUMNS))
 
 @app.post("/performance/record", tags=["Performance"])
 def record_performance(
     data: PerformanceRecord,
+    wait: bool = False,
     user=Depends(verify_api_key)
 ):
     """
-    パフォーマンスデータを記録（プラグインから呼び出される）
+    パフォーマンスデータを記録（外部プラグイン用。内蔵サンプラーを使うなら不要）
+
+    書き込みはまとめて行う。wait=true ならコミットされてから応答する。
     """
-    with get_db() as conn:
-        conn.execute("""
-            INSERT INTO performance_metrics 
-            (timestamp, tps, memory_used, memory_total, memory_percent, entities, chunks, players)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            datetime.datetime.now().isoformat(),
-            data.tps,
-            data.memory_used,
-            data.memory_total,
-            data.memory_percent,
-            data.entities,
-            data.chunks,
-            data.players
-        ))
+    queue_write(metric_store.INSERT, performance_params(metric_store.now_ms(), data), wait=wait)
     
-    return {"status": "recorded"}
+    return {"status": "recorded", "durable": wait}
+
+class PerformanceSample(PerformanceRecord):
+    timestamp: Optional[datetime.datetime] = None
+
+@app.post("/performance/record/bulk", tags=["Performance"])
+async def record_performance_bulk(request: Request, user=Depends(verify_api_key)):
+    """
+    パフォーマンスデータを一括記録（JSON 配列または NDJSON）
+
+    timestamp（ISO 8601 / UNIX 時刻）を省略した行は受信時刻になる。
+    失敗した行は errors に行番号付きで返し、残りは記録する。
+    """
+    rows = await read_bulk_rows(request)
+    received = metric_store.now_ms()
+    valid, errors = validate_bulk_rows(PerformanceSample, rows)
+    params = [
+        (index, performance_params(metric_store.to_ms(s.timestamp) if s.timestamp is not None else received, s))
+        for index, s in valid
+    ]
+    if params:
+        errors += await asyncio.to_thread(bulk_insert, metric_store.INSERT, params)
+        # 集計済みのバケットに入った行があれば集計し直す
+        await asyncio.to_thread(rollups.invalidate, metric_store.iso(min(p[0] for _, p in params)))
+    return bulk_result(len(rows), errors)
 
 # =============================
 # v1.3.9: チャットログ
@@ -767,24 +1772,51 @@ class ChatMessage(BaseModel):
 @app.post("/chat/log", tags=["Chat"])
 def log_chat_message(
     msg: ChatMessage,
+    wait: bool = False,
     user=Depends(verify_api_key)
 ):
     """
     チャットメッセージを記録（プラグインから呼び出される）
+
+    書き込みはまとめて行う。wait=true ならコミットされてから応答する。
+    """
+    queue_write("""
+        INSERT INTO chat_logs (timestamp, player_uuid, player_name, message, world)
+        VALUES (?, ?, ?, ?, ?)
+    """, (
+        datetime.datetime.now().isoformat(),
+        msg.player_uuid,
+        msg.player_name,
+        msg.message,
+        msg.world
+    ), wait=wait)
+    
+    return {"status": "logged", "durable": wait}
+
+class ChatRecord(ChatMessage):
+    timestamp: Optional[datetime.datetime] = None
+
+@app.post("/chat/log/bulk", tags=["Chat"])
+async def log_chat_bulk(request: Request, user=Depends(verify_api_key)):
     """
-    with get_db() as conn:
-        conn.execute("""
+    チャットメッセージを一括記録（JSON 配列または NDJSON）
+
+    timestamp（ISO 8601 / UNIX 時刻）を省略した行は受信時刻になる。
+    失敗した行は errors に行番号付きで返し、残りは記録する。
+    """
+    rows = await read_bulk_rows(request)
+    received = datetime.datetime.now().isoformat()
+    valid, errors = validate_bulk_rows(ChatRecord, rows)
+    params = [
+        (index, (bulk_timestamp(m.timestamp, received), m.player_uuid, m.player_name, m.message, m.world))
+        for index, m in valid
+    ]
+    if params:
+        errors += await asyncio.to_thread(bulk_insert, """
             INSERT INTO chat_logs (timestamp, player_uuid, player_name, message, world)
             VALUES (?, ?, ?, ?, ?)
-        """, (
-            datetime.datetime.now().isoformat(),
-            msg.player_uuid,
-            msg.player_name,
-            msg.message,
-            msg.world
-        ))
-    
-    return {"status": "logged"}
+        """, params)
+    return bulk_result(len(rows), errors)
 
 @app.get("/chat/recent", tags=["Chat"])
 def get_recent_chat(
@@ -814,31 +1846,52 @@ def get_recent_chat(
 
 @app.get("/chat/search", tags=["Chat"])
 def search_chat(
-    keyword: str,
+    q: Optional[str] = None,
+    keyword: Optional[str] = None,
+    player: Optional[str] = None,
+    world: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    sort: str = "newest",
+    cursor: Optional[str] = None,
     limit: int = 20,
     user=Depends(verify_api_key)
 ):
     """
-    チャットログをキーワード検索
+    チャットログを全文検索
+
+    q は検索式（"フレーズ"、前方一致 dia*、AND / OR / NOT と括弧）。
+    keyword は検索式として解釈しない部分一致（従来の検索）。
+    sort は newest（新しい順）か relevance（関連度順）。cursor には前回の next_cursor を渡す。
+    snippet は一致箇所を <mark> で囲んだ HTML エスケープ済みの抜粋。
     """
-    with get_db() as conn:
-        cur = conn.execute("""
-            SELECT timestamp, player_name, message, world
-            FROM chat_logs
-            WHERE message LIKE ?
-            ORDER BY timestamp DESC
-            LIMIT ?
-        """, (f"%{keyword}%", limit))
-        
-        return [
-            {
-                "timestamp": ts,
-                "player_name": name,
-                "message": msg,
-                "world": world
-            }
-            for ts, name, msg, world in cur.fetchall()
-        ]
+    if (q is None) == (keyword is None):
+        raise HTTPException(status_code=400, detail="Specify either q or keyword")
+    bounds = {}
+    for name, value in (("since", since), ("until", until)):
+        if value is not None:
+            try:
+                bounds[name] = datetime.datetime.fromisoformat(value).isoformat()
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid datetime: {value}")
+    player_uuid = None
+    if player is not None:
+        player_uuid = uuid_resolver.resolve_one(player, profile_network(user))
+        if not player_uuid:
+            return {"results": [], "next_cursor": None}
+    try:
+        return chat_index.search(
+            q if q is not None else keyword,
+            player_uuid=player_uuid,
+            world=world,
+            sort=sort,
+            cursor=cursor,
+            limit=limit,
+            literal=q is None,
+            **bounds
+        )
+    except QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/chat/player/{player_name}", tags=["Chat"])
 def get_player_chat(
@@ -847,16 +1900,20 @@ def get_player_chat(
     user=Depends(verify_api_key)
 ):
     """
-    特定プレイヤーのチャットログを取得
+    特定プレイヤーのチャットログを取得（名前を UUID にして引く。改名前の発言も含む）
     """
+    player_uuid = uuid_resolver.resolve_one(player_name, profile_network(user))
+    if not player_uuid:
+        return []
+
     with get_db() as conn:
         cur = conn.execute("""
             SELECT timestamp, message, world
             FROM chat_logs
-            WHERE player_name = ?
+            WHERE player_uuid = ?
             ORDER BY timestamp DESC
             LIMIT ?
-        """, (player_name, limit))
+        """, (player_uuid, limit))
         
         return [
             {
@@ -868,41 +1925,26 @@ def get_player_chat(
         ]
 
 @app.get("/chat/stats", tags=["Chat"])
-def get_chat_stats(user=Depends(verify_api_key)):
+def get_chat_stats(top: int = 1, days: int = 7, user=Depends(verify_api_key)):
     """
-    チャット統計を取得
+    チャット統計を取得（集計済みのカウンターを読む）
+
+    top_chatters は直近 days 日（今日を含む）のメッセージ数上位 top 人。
     """
-    with get_db() as conn:
-        # 総メッセージ数
-        total = conn.execute("SELECT COUNT(*) FROM chat_logs").fetchone()[0]
-        
-        # 今日のメッセージ数
-        today_start = datetime.datetime.now().replace(hour=0, minute=0, second=0).isoformat()
-        today_count = conn.execute(
-            "SELECT COUNT(*) FROM chat_logs WHERE timestamp >= ?",
-            (today_start,)
-        ).fetchone()[0]
-        
-        # 最もアクティブなプレイヤー（過去7日）
-        week_ago = (datetime.datetime.now() - datetime.timedelta(days=7)).isoformat()
-        cur = conn.execute("""
-            SELECT player_name, COUNT(*) as count
-            FROM chat_logs
-            WHERE timestamp >= ?
-            GROUP BY player_name
-            ORDER BY count DESC
-            LIMIT 1
-        """, (week_ago,))
-        top_chatter = cur.fetchone()
-        
-        return {
-            "total_messages": total,
-            "today_messages": today_count,
-            "top_chatter": {
-                "player_name": top_chatter[0] if top_chatter else None,
-                "message_count": top_chatter[1] if top_chatter else 0
-            }
-        }
+    stats = chat_stats.summary(top=max(1, min(top, 100)), days=max(1, min(days, 30)))
+    leader = stats["top_chatters"][0] if stats["top_chatters"] else None
+    stats["top_chatter"] = {
+        "player_name": leader["player_name"] if leader else None,
+        "message_count": leader["message_count"] if leader else 0
+    }
+    return stats
+
+@app.get("/chat/stats/hourly", tags=["Chat"])
+def get_chat_hourly(hours: int = 24, days: int = 7, user=Depends(verify_api_key)):
+    """
+    1 時間ごとのメッセージ数（直近 hours 時間）と、直近 days 日の時刻別の合計
+    """
+    return chat_stats.hourly(hours=max(1, min(hours, 24 * 30)), days=max(1, min(days, 30)))
 
 # =============================
 # v1.3.9: コマンドテンプレート
@@ -986,85 +2028,113 @@ def delete_template(
 # =============================
 # Upload
 # =============================
-@app.post("/upload", tags=["File"])
+@app.post("/upload", tags=["File"], status_code=202)
 async def upload(
     file: UploadFile = File(...),
     user=Depends(verify_api_key)
 ):
-    path = os.path.join(MC_DATA_DIR, file.filename)
-    os.makedirs(os.path.dirname(path), exist_ok=True)
+    """
+    ファイルを受け取り、配置・展開・再起動はジョブで行う
+    """
+    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+    spool = os.path.join(UPLOAD_SPOOL_DIR, secrets.token_hex(8))
 
-    with open(path, "wb") as f:
-        shutil.copyfileobj(file.file, f)
+    def save():
+        with open(spool, "wb") as f:
+            shutil.copyfileobj(file.file, f)
 
-    if file.filename.endswith(".zip"):
-        with zipfile.ZipFile(path, "r") as zip_ref:
-            zip_ref.extractall(MC_DATA_DIR)
-        os.remove(path)
+    await ops.to_thread("io", "upload", save)
 
-    subprocess.run(["docker", "restart", "mc-server"])
+    job_id = jobs.submit("upload", {"spool": spool, "filename": file.filename}, job_submitter(user))
     log_action(user, "upload", file.filename)
 
-    return {"status": "uploaded"}
+    return {"status": "queued", "job_id": job_id}
 
 # =============================
 # Server Control
 # =============================
 @app.post("/start", tags=["Server"])
-def start(user=Depends(verify_api_key)):
-    subprocess.run(["docker", "start", "mc-server"])
+async def start(user=Depends(verify_api_key)):
+    await container("start")
     log_action(user, "start")
     return {"status": "started"}
 
 @app.post("/stop", tags=["Server"])
-def stop(user=Depends(verify_api_key)):
-    subprocess.run(["docker", "stop", "mc-server"])
+async def stop(user=Depends(verify_api_key)):
+    await container("stop")
     log_action(user, "stop")
     return {"status": "stopped"}
 
 @app.get("/status", tags=["Server"])
-def status(user=Depends(verify_api_key)):
-    result = subprocess.run(
-        ["docker", "ps", "-f", "name=mc-server", "--format", "{{.Status}}"],
-        capture_output=True, text=True
-    )
+async def status(user=Depends(verify_api_key)):
+    """
+    コンテナの状態・ヘルス・稼働時間（イベントで更新されるキャッシュから返す）
+    """
+    if not CONTAINER_INFO["loaded"]:
+        try:
+            await refresh_container_status()
+        except (DockerError, OperationTimeout, OSError) as e:
+            raise HTTPException(status_code=502, detail=str(e))
     log_action(user, "status")
-    return {"status": result.stdout.strip() or "stopped"}
+    return container_status()
+
+@app.get("/status/stream", tags=["Server"])
+async def status_stream(user=Depends(verify_api_key)):
+    """
+    状態変化を Server-Sent Events で配信
+    """
+    queue = asyncio.Queue()
+    STATUS_LISTENERS.add(queue)
+
+    async def events():
+        try:
+            yield f"data: {json.dumps(container_status())}\n\n"
+            while True:
+                try:
+                    current = await asyncio.wait_for(queue.get(), 15)
+                    yield f"data: {json.dumps(current)}\n\n"
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            STATUS_LISTENERS.discard(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
 # =============================
 # Backup
 # =============================
-@app.post("/backup", tags=["Backup"])
+@app.post("/backup", tags=["Backup"], status_code=202)
 def backup(user=Depends(verify_api_key)):
     """
-    手動バックアップを作成
+    手動バックアップをジョブとして投入（進捗は /jobs/{job_id}）
     """
-    ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_file = os.path.join(BACKUP_DIR, f"manual_{ts}.zip")
-
-    with zipfile.ZipFile(backup_file, "w", zipfile.ZIP_DEFLATED) as zipf:
-        for root, _, files in os.walk(MC_DATA_DIR):
-            for f in files:
-                full = os.path.join(root, f)
-                zipf.write(full, os.path.relpath(full, MC_DATA_DIR))
-
-    log_action(user, "backup", backup_file)
-    return {"backup": backup_file, "size_mb": round(os.path.getsize(backup_file) / (1024*1024), 2)}
+    job_id = jobs.submit("backup", {}, job_submitter(user))
+    log_action(user, "backup", job_id)
+    return {"status": "queued", "job_id": job_id}
 
 @app.get("/backups", tags=["Backup"])
 def list_backups(user=Depends(verify_api_key)):
     """
-    バックアップファイル一覧を取得
-    """
-    if not os.path.exists(BACKUP_DIR):
-        return {"backups": []}
-    
-    backups = []
+    バックアップ一覧を取得（スナップショットと旧形式の ZIP）
+    """
+    backups = [
+        {
+            "name": snap["name"],
+            "type": "snapshot",
+            "tag": snap["tag"],
+            "files": snap["files"],
+            "size_mb": round(snap["size"] / (1024*1024), 2),
+            "added_mb": round(snap["added_bytes"] / (1024*1024), 2),
+            "created": snap["created"]
+        }
+        for snap in backup_store.list_snapshots()
+    ]
     for filename in os.listdir(BACKUP_DIR):
         if filename.endswith(".zip"):
             filepath = os.path.join(BACKUP_DIR, filename)
             backups.append({
                 "name": filename,
+                "type": "zip",
                 "size_mb": round(os.path.getsize(filepath) / (1024*1024), 2),
                 "created": datetime.datetime.fromtimestamp(os.path.getmtime(filepath)).isoformat()
             })
@@ -1073,58 +2143,29 @@ def list_backups(user=Depends(verify_api_key)):
     backups.sort(key=lambda x: x["created"], reverse=True)
     
     log_action(user, "list_backups")
-    return {"backups": backups, "count": len(backups)}
+    return {"backups": backups, "count": len(backups), "repository": backup_store.usage()}
 
-@app.post("/backups/restore/{filename}", tags=["Backup"])
+@app.post("/backups/restore/{filename}", tags=["Backup"], status_code=202)
 def restore_backup(filename: str, user=Depends(verify_api_key)):
     """
-    バックアップからリストア
+    バックアップからリストア（ジョブとして投入）
     """
     if user["role"] not in ["root", "admin"]:
         raise HTTPException(status_code=403, detail="Admin role required")
     
     filepath = os.path.join(BACKUP_DIR, filename)
+    is_snapshot = backup_store.exists(filename)
     
-    if not os.path.exists(filepath):
+    if not is_snapshot and not os.path.exists(filepath):
         raise HTTPException(status_code=404, detail="Backup not found")
     
-    if not filename.endswith(".zip"):
+    if not is_snapshot and not filename.endswith(".zip"):
         raise HTTPException(status_code=400, detail="Invalid backup file")
     
-    # サーバーを停止
-    subprocess.run(["docker", "stop", "mc-server"])
-    
-    # 現在のデータをバックアップ（念のため）
-    ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    pre_restore_backup = os.path.join(BACKUP_DIR, f"pre_restore_{ts}.zip")
-    
-    with zipfile.ZipFile(pre_restore_backup, "w", zipfile.ZIP_DEFLATED) as zipf:
-        for root, _, files in os.walk(MC_DATA_DIR):
-            for f in files:
-                full = os.path.join(root, f)
-                zipf.write(full, os.path.relpath(full, MC_DATA_DIR))
-    
-    # 既存データを削除
-    for item in os.listdir(MC_DATA_DIR):
-        item_path = os.path.join(MC_DATA_DIR, item)
-        if os.path.isfile(item_path):
-            os.remove(item_path)
-        elif os.path.isdir(item_path):
-            shutil.rmtree(item_path)
-    
-    # バックアップを展開
-    with zipfile.ZipFile(filepath, "r") as zipf:
-        zipf.extractall(MC_DATA_DIR)
-    
-    # サーバーを起動
-    subprocess.run(["docker", "start", "mc-server"])
+    job_id = jobs.submit("restore", {"backup": filename}, job_submitter(user))
     
     log_action(user, "restore_backup", filename)
-    return {
-        "status": "restored",
-        "backup": filename,
-        "pre_restore_backup": pre_restore_backup
-    }
+    return {"status": "queued", "job_id": job_id, "backup": filename}
 
 @app.delete("/backups/{filename}", tags=["Backup"])
 def delete_backup(filename: str, user=Depends(verify_api_key)):
@@ -1134,6 +2175,12 @@ def delete_backup(filename: str, user=Depends(verify_api_key)):
     if user["role"] not in ["root", "admin"]:
         raise HTTPException(status_code=403, detail="Admin role required")
     
+    if backup_store.exists(filename):
+        backup_store.delete_snapshot(filename)
+        freed = backup_store.gc()
+        log_action(user, "delete_backup", filename)
+        return {"status": "deleted", "backup": filename, "freed_mb": round(freed["bytes_freed"] / (1024*1024), 2)}
+    
     filepath = os.path.join(BACKUP_DIR, filename)
     
     if not os.path.exists(filepath):
@@ -1154,6 +2201,8 @@ class CreateScheduleRequest(BaseModel):
     name: str
     cron_expression: str
     max_backups: int = 7
+    codec: str = BACKUP_CODEC
+    compression_level: int = BACKUP_LEVEL
 
 @app.post("/backup/schedules", tags=["Backup"])
 def create_schedule(req: CreateScheduleRequest, user=Depends(verify_api_key)):
@@ -1169,10 +2218,13 @@ def create_schedule(req: CreateScheduleRequest, user=Depends(verify_api_key)):
     if len(parts) != 5:
         raise HTTPException(status_code=400, detail="Invalid cron expression (should be 5 parts)")
     
+    if req.codec not in available_codecs():
+        raise HTTPException(status_code=400, detail=f"Unsupported codec (available: {', '.join(available_codecs())})")
+    
     with get_db() as conn:
         cur = conn.execute(
-            "INSERT INTO backup_schedules (name, cron_expression, max_backups, created) VALUES (?, ?, ?, ?)",
-            (req.name, req.cron_expression, req.max_backups, datetime.datetime.now().isoformat())
+            "INSERT INTO backup_schedules (name, cron_expression, max_backups, codec, compression_level, created) VALUES (?, ?, ?, ?, ?, ?)",
+            (req.name, req.cron_expression, req.max_backups, req.codec, req.compression_level, datetime.datetime.now().isoformat())
         )
         schedule_id = cur.lastrowid
     
@@ -1185,6 +2237,8 @@ def create_schedule(req: CreateScheduleRequest, user=Depends(verify_api_key)):
         "name": req.name,
         "cron_expression": req.cron_expression,
         "max_backups": req.max_backups,
+        "codec": req.codec,
+        "compression_level": req.compression_level,
         "enabled": True
     }
 
@@ -1195,7 +2249,7 @@ def list_schedules(user=Depends(verify_api_key)):
     """
     with get_db() as conn:
         cur = conn.execute("""
-            SELECT id, name, cron_expression, enabled, max_backups, created, last_run
+            SELECT id, name, cron_expression, enabled, max_backups, codec, compression_level, created, last_run
             FROM backup_schedules
             ORDER BY id DESC
         """)
@@ -1206,10 +2260,12 @@ def list_schedules(user=Depends(verify_api_key)):
                 "cron_expression": cron_expr,
                 "enabled": bool(enabled),
                 "max_backups": max_backups,
+                "codec": codec,
+                "compression_level": level,
                 "created": created,
                 "last_run": last_run
             }
-            for id, name, cron_expr, enabled, max_backups, created, last_run in cur.fetchall()
+            for id, name, cron_expr, enabled, max_backups, codec, level, created, last_run in cur.fetchall()
         ]
 
 @app.patch("/backup/schedules/{schedule_id}/toggle", tags=["Backup"])
@@ -1256,16 +2312,242 @@ def delete_schedule(schedule_id: int, user=Depends(verify_api_key)):
     log_action(user, "delete_backup_schedule", f"schedule_id={schedule_id}")
     return {"status": "deleted", "id": schedule_id}
 
+# =============================
+# Jobs
+# =============================
+@app.get("/jobs", tags=["Jobs"])
+def list_jobs(status: Optional[str] = None, limit: int = 50, user=Depends(verify_api_key)):
+    """
+    ジョブ一覧（admin / root 以外は自分が投入したジョブだけ）
+    """
+    submitted_by = None if user["role"] in ["root", "admin"] else job_submitter(user)
+    return jobs.list(status, limit, submitted_by=submitted_by)
+
+@app.get("/jobs/{job_id}", tags=["Jobs"])
+def get_job(job_id: str, user=Depends(verify_api_key)):
+    """
+    ジョブの状態と進捗（処理済みバイト数・ファイル数・ETA）
+    """
+    job = jobs.get(job_id)
+    if job is None or not can_see_job(job, user):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/stream", tags=["Jobs"])
+async def stream_job(job_id: str, user=Depends(verify_api_key)):
+    """
+    ジョブの進捗を Server-Sent Events で配信（終了したらストリームを閉じる）
+    """
+    job = jobs.get(job_id)
+    if job is None or not can_see_job(job, user):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        last = None
+        while True:
+            job = await asyncio.to_thread(jobs.get, job_id)
+            payload = json.dumps(job)
+            if payload != last:
+                last = payload
+                yield f"data: {payload}\n\n"
+            if job["status"] not in ("queued", "running"):
+                return
+            await asyncio.sleep(1)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.delete("/jobs/{job_id}", tags=["Jobs"])
+def cancel_job(job_id: str, user=Depends(verify_api_key)):
+    """
+    ジョブを取り消す（実行中のジョブは次の進捗報告時に中断）
+    """
+    if user["role"] not in ["root", "admin"]:
+        raise HTTPException(status_code=403, detail="Admin role required")
+    if not jobs.cancel(job_id):
+        raise HTTPException(status_code=404, detail="Job not running or queued")
+    log_action(user, "cancel_job", job_id)
+    return {"status": "cancelling", "id": job_id}
+
 # =============================
 # Logs
 # =============================
+log_follower = LogFollower(LOG_FILE)
+# 参加・退出・チャット・死亡・進捗を DB に取り込む
+log_ingester = LogIngester(
+    get_db, LOG_FILE, LOG_DIR, ingest_chat=LOG_INGEST_CHAT, on_events=player_registry.apply_events,
+    resolve_uuids=lambda names: uuid_resolver.resolve(names, network=False),
+)
+
+def make_line_filter(level: Optional[str], pattern: Optional[str]) -> LineFilter:
+    try:
+        return LineFilter(level, pattern)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Invalid level: {level}")
+    except re.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid pattern: {e}")
+
 @app.get("/logs", tags=["Log"])
-def logs(user=Depends(verify_api_key)):
-    if not os.path.exists(LOG_FILE):
-        return {"logs": ""}
-    log_action(user, "logs")
-    with open(LOG_FILE, encoding="utf-8", errors="ignore") as f:
-        return {"logs": f.read()}
+def logs(
+    cursor: Optional[str] = None,
+    tail: int = 500,
+    max_bytes: int = 1024 * 1024,
+    level: Optional[str] = None,
+    pattern: Optional[str] = None,
+    user=Depends(verify_api_key)
+):
+    """
+    latest.log の差分取得
+
+    cursor（前回の応答の cursor。バイトオフセットだけでも可）以降の行を返す。
+    cursor がなければ末尾 tail 行。ローテーション・切り詰めを検出した場合は
+    先頭から読み直して reset=true を返す。
+    """
+    line_filter = make_line_filter(level, pattern)
+    if cursor:
+        try:
+            file_id, offset = log_tail.parse_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        result = log_tail.read_from(LOG_FILE, file_id, offset, min(max_bytes, log_tail.READ_LIMIT * 8))
+    else:
+        log_action(user, "logs")
+        result = log_tail.tail(LOG_FILE, max(0, min(tail, 10000)))
+    
+    lines = [line for line in result.pop("lines") if line_filter.match(line)]
+    result["logs"] = "\n".join(lines)
+    result["line_count"] = len(lines)
+    return result
+
+@app.get("/logs/stream", tags=["Log"])
+async def logs_stream(
+    request: Request,
+    cursor: Optional[str] = None,
+    tail: int = 100,
+    level: Optional[str] = None,
+    pattern: Optional[str] = None,
+    user=Depends(verify_api_key)
+):
+    """
+    latest.log を Server-Sent Events で追従（event id がカーソル）
+
+    再接続時は Last-Event-ID（または cursor）の続きから送る。
+    """
+    line_filter = make_line_filter(level, pattern)
+    cursor = request.headers.get("last-event-id") or cursor
+    try:
+        start = log_tail.parse_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # 取りこぼしがないよう、先に購読してから過去分を読む
+    queue = log_follower.subscribe()
+
+    async def read_file(file_id, offset):
+        # file_id / offset の続きをファイルの末尾まで
+        chunks = []
+        while True:
+            chunk = await asyncio.to_thread(log_tail.read_from, LOG_FILE, file_id, offset)
+            chunks.append(chunk)
+            file_id, offset = chunk["file_id"], chunk["offset"]
+            if not chunk["more"]:
+                return chunks
+
+    async def events():
+        try:
+            if start is None:
+                chunk = await asyncio.to_thread(log_tail.tail, LOG_FILE, max(0, min(tail, 10000)))
+                backlog = [chunk]
+            else:
+                backlog = await read_file(*start)
+            # sent: 最後に処理した行の位置（フィルターで送らなかった行も含む）
+            sent_id, sent_offset = None, 0
+            while True:
+                for chunk in backlog:
+                    if chunk["reset"]:
+                        yield "event: reset\ndata: {}\n\n"
+                    if chunk["file_id"] is not None:
+                        sent_id, sent_offset = chunk["file_id"], chunk["offset"]
+                    matched = [line for line in chunk["lines"] if line_filter.match(line)]
+                    if matched:
+                        yield "".join(f"data: {line}\n" for line in matched[:-1])
+                        yield f"id: {chunk['cursor']}\ndata: {matched[-1]}\n\n"
+                backlog_end = (sent_id, sent_offset) if sent_id is not None else None
+
+                while True:
+                    try:
+                        file_id, offset, line = await asyncio.wait_for(queue.get(), 15)
+                    except asyncio.TimeoutError:
+                        yield ": keepalive\n\n"
+                        continue
+                    if line is log_tail.GAP:
+                        break
+                    if backlog_end is not None:
+                        if file_id == backlog_end[0] and offset <= backlog_end[1]:
+                            continue  # 過去分として送信済み
+                        backlog_end = None
+                    if sent_id is not None and (file_id != sent_id or offset <= sent_offset):
+                        # ローテーションまたは切り詰め
+                        yield "event: reset\ndata: {}\n\n"
+                    sent_id, sent_offset = file_id, offset
+                    if line_filter.match(line):
+                        yield f"id: {log_tail.make_cursor(file_id, offset)}\ndata: {line}\n\n"
+
+                # 送るのが追いつかず Queue の行が捨てられた: 処理済みの位置からファイルを読み直す
+                # （その間にローテーションされていれば reset になる）
+                backlog = await read_file(sent_id, sent_offset)
+        finally:
+            log_follower.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.get("/logs/archives", tags=["Log"])
+def log_archives(user=Depends(verify_api_key)):
+    """
+    ローテーション済みログ（*.log.gz）一覧
+    """
+    return {"archives": log_tail.list_archives(LOG_DIR)}
+
+@app.get("/logs/search", tags=["Log"])
+async def log_search(
+    pattern: Optional[str] = None,
+    level: Optional[str] = None,
+    archive: Optional[List[str]] = Query(None),
+    include_latest: bool = True,
+    limit: int = 500,
+    user=Depends(verify_api_key)
+):
+    """
+    ログを検索（.log.gz はメモリに展開せずストリーミングで読む）
+
+    archive を指定しなければ全アーカイブを新しい順に検索する。
+    """
+    if not pattern and not level:
+        raise HTTPException(status_code=400, detail="pattern or level is required")
+    make_line_filter(level, pattern)
+    limit = max(1, min(limit, 10000))
+
+    names = [a["name"] for a in log_tail.list_archives(LOG_DIR)]
+    if archive:
+        unknown = set(archive) - set(names)
+        if unknown:
+            raise HTTPException(status_code=404, detail=f"Archive not found: {', '.join(sorted(unknown))}")
+        names = [n for n in names if n in archive]
+    files = ([os.path.basename(LOG_FILE)] if include_latest and os.path.exists(LOG_FILE) else []) + names
+
+    def search():
+        matches = []
+        for name in files:
+            # 継続行のレベル判定をファイルごとにやり直す
+            line_filter = LineFilter(level, pattern)
+            for lineno, line in log_tail.search_file(os.path.join(LOG_DIR, name), line_filter, limit - len(matches)):
+                matches.append({"file": name, "line": lineno, "text": line})
+            if len(matches) >= limit:
+                break
+        return matches
+
+    matches = await ops.to_thread("io", "log_search", search, timeout=120)
+    log_action(user, "log_search", pattern or level)
+    return {"matches": matches, "truncated": len(matches) >= limit, "files": files}
 
 # =============================
 # Console
@@ -1278,15 +2560,11 @@ class ExecHistory(BaseModel):
 EXEC_HISTORY: list[ExecHistory] = []
 
 @app.post("/exec", tags=["Console"])
-def exec_cmd(
+async def exec_cmd(
     command: str = Form(...),
     user=Depends(verify_api_key)
 ):
-    result = subprocess.run(
-        ["docker", "exec", "mc-server", "rcon-cli", command],
-        capture_output=True, text=True
-    )
-    output = result.stdout.strip() or result.stderr.strip()
+    output = await rcon(command, name="exec")
 
     entry = ExecHistory(
         time=datetime.datetime.now().isoformat(),
@@ -1307,55 +2585,306 @@ def exec_history(user=Depends(verify_api_key)):
 # =============================
 # Metrics
 # =============================
+@registry.add_collector
+def collect_server_metrics():
+    """
+    内蔵サンプラーが最後に計測したサーバー・コンテナの値
+    """
+    latest = sampler.latest or {}
+    mib = 1024 * 1024
+
+    def gauge(name, help, key, scale=1):
+        value = latest.get(key)
+        return (name, "gauge", help, (), [((), value * scale if value is not None else None)])
+
+    yield ("mc_server_up", "gauge", "Minecraft container is running", (),
+           [((), 1 if container_status().get("running") else 0)])
+    yield ("mc_players_online", "gauge", "Online players (player registry)", (), [((), player_registry.count())])
+    if not latest:
+        return
+    yield ("mc_server_last_sample_timestamp_seconds", "gauge", "Time of the last sampler run", (),
+           [((), latest["timestamp"] / 1000)])
+    yield gauge("mc_server_tps", "Ticks per second (1m average)", "tps")
+    yield gauge("mc_server_mspt", "Milliseconds per tick", "mspt")
+    yield gauge("mc_server_players", "Online players", "players")
+    yield gauge("mc_server_entities", "Loaded entities", "entities")
+    yield gauge("mc_server_loaded_chunks", "Loaded chunks", "chunks")
+    yield gauge("mc_container_memory_used_bytes", "Container memory excluding page cache", "memory_used", mib)
+    yield gauge("mc_container_memory_limit_bytes", "Container memory limit", "memory_total", mib)
+    yield gauge("mc_container_cpu_percent", "Container CPU usage (100 = one core)", "cpu_percent")
+    yield gauge("mc_container_io_read_bytes_per_second", "Container block I/O read rate", "io_read")
+    yield gauge("mc_container_io_write_bytes_per_second", "Container block I/O write rate", "io_write")
+
+@registry.add_collector
+def collect_queue_metrics():
+    """
+    キューの深さと、各コンポーネントの累計値
+    """
+    queue_stats = write_queue.snapshot()
+    yield ("mc_write_queue_depth", "gauge", "Rows waiting in the write-behind queue", (),
+           [((), write_queue.depth())])
+    yield ("mc_write_queue_rows", "counter", "Rows committed by the write-behind queue", (),
+           [((), queue_stats["rows"])])
+    yield ("mc_write_queue_batches", "counter", "Write-behind group commits", (), [((), queue_stats["batches"])])
+    yield ("mc_write_queue_rejected", "counter", "Rows rejected because the queue was full", (),
+           [((), queue_stats["rejected"])])
+    depth = jobs.depth()
+    yield ("mc_jobs", "gauge", "Background jobs by state", ("state",),
+           [(("pending",), depth["pending"]), (("running",), depth["running"])])
+    inflight = ops.stats()["inflight"]
+    yield ("mc_operations_inflight", "gauge", "Operations in flight by class", ("class",),
+           [((op_class,), inflight.get(op_class, 0)) for op_class in ops.limits])
+    yield ("mc_log_subscribers", "gauge", "Log stream subscribers", (), [((), len(log_follower.subscribers))])
+    yield ("mc_log_dropped_lines", "counter", "Log lines dropped for slow subscribers", (),
+           [((), log_follower.dropped)])
+    yield ("mc_log_gaps", "counter", "Log queue overflows reported to slow subscribers", (),
+           [((), log_follower.gaps)])
+    yield ("mc_log_ingested_lines", "counter", "Log lines ingested", (), [((), log_ingester.stats["lines"])])
+    yield ("mc_status_listeners", "gauge", "Container status stream subscribers", (),
+           [((), len(STATUS_LISTENERS))])
+    cache = key_cache.snapshot()
+    yield ("mc_auth_cache_lookups", "counter", "API key cache lookups", ("result",),
+           [(("hit",), cache["hits"]), (("negative_hit",), cache["negative_hits"]), (("miss",), cache["misses"])])
+    audit = audit_snapshot()
+    yield ("mc_audit_events", "counter", "Audit events by outcome", ("outcome",),
+           [((outcome,), audit[outcome]) for outcome in ("queued", "sampled_out", "dropped")])
+    if LAST_BACKUP:
+        yield ("mc_backup_last_throughput_bytes_per_second", "gauge", "Throughput of the last snapshot", ("kind",),
+               [((LAST_BACKUP["kind"],), LAST_BACKUP["throughput"])])
+        yield ("mc_backup_last_success_timestamp_seconds", "gauge", "Time the last snapshot finished", (),
+               [((), LAST_BACKUP["finished"])])
+
+def verify_metrics_scraper(
+    request: Request,
+    authorization: Optional[str] = Header(None),
+    x_api_key: Optional[str] = Header(None)
+):
+    """
+    METRICS_TOKEN の Bearer トークン、または通常の API キー
+    """
+    if METRICS_TOKEN and authorization and secrets.compare_digest(authorization, f"Bearer {METRICS_TOKEN}"):
+        return {"api_key": "METRICS", "role": "metrics", "player_name": None, "ip": request.client.host}
+    if x_api_key is None:
+        raise HTTPException(status_code=401, detail="Metrics token or API key required")
+    return verify_api_key(request, x_api_key)
+
+@app.get("/metrics/prometheus", tags=["Metrics"])
+def prometheus_metrics(user=Depends(verify_metrics_scraper)):
+    """
+    OpenMetrics 形式のメトリクス（スクレイプごとに監査ログは書かない）
+    """
+    return Response(registry.render(), media_type=openmetrics.CONTENT_TYPE)
+
+@app.get("/metrics/operations", tags=["Metrics"])
+def operation_metrics(user=Depends(verify_api_key)):
+    """
+    コンテナ / RCON 操作のレイテンシ統計
+    """
+    stats = ops.stats()
+    stats["write_queue"] = dict(write_queue.snapshot(), depth=write_queue.depth())
+    stats["log_ingest"] = dict(log_ingester.stats, file_id=log_ingester.file_id, offset=log_ingester.offset)
+    stats["auth_cache"] = key_cache.snapshot()
+    stats["audit"] = audit_snapshot()
+    stats["rollup"] = dict(rollups.stats)
+    stats["metrics_store"] = dict(metrics_store.stats)
+    stats["sampler"] = dict(sampler.stats, enabled=SAMPLER_ENABLED, paper=sampler.paper)
+    stats["players"] = dict(player_registry.stats, online=player_registry.count(), snapshots=player_snapshots.stats)
+    stats["profiles"] = dict(uuid_resolver.stats)
+    return stats
+
 @app.get("/metrics", tags=["Metrics"])
 def metrics(user=Depends(verify_api_key)):
+    """
+    ホストのメモリと、内蔵サンプラーが最後に計測したサーバー・コンテナの値
+    """
     mem = psutil.virtual_memory()
     log_action(user, "metrics")
+    latest = sampler.latest
     return {
         "memory": {
             "total_gb": round(mem.total / 1024**3, 2),
             "used_gb": round(mem.used / 1024**3, 2),
             "percent": mem.percent
-        }
+        },
+        "server": {
+            "timestamp": metric_store.iso(latest["timestamp"]),
+            "tps": latest.get("tps"),
+            "mspt": latest.get("mspt"),
+            "players": latest.get("players"),
+            "entities": latest.get("entities"),
+            "chunks": latest.get("chunks"),
+        } if latest else None,
+        "container": {
+            "memory_used_mb": latest.get("memory_used"),
+            "memory_limit_mb": latest.get("memory_total"),
+            "memory_percent": latest.get("memory_percent"),
+            "cpu_percent": latest.get("cpu_percent"),
+            "io_read_bytes_per_sec": latest.get("io_read"),
+            "io_write_bytes_per_sec": latest.get("io_write"),
+        } if latest else None,
     }
 
 # =============================
 # Players
 # =============================
 @app.get("/players", tags=["Players"])
-def list_players(user=Depends(verify_api_key)):
-    """
-    オンラインプレイヤー一覧
+async def list_players(user=Depends(verify_api_key)):
     """
-    output = rcon("list")
-
-    # 例: There are 2 of a max of 20 players online: Steve, Alex
-    if ":" not in output:
-        return {"players": []}
-
-    players = output.split(":", 1)[1].strip()
-    player_list = [p.strip() for p in players.split(",")] if players else []
+    オンラインプレイヤー一覧（レジストリから返す。RCON は使わない）
 
+    sessions には UUID・参加時刻・セッションの長さ（秒）が入る。
+    """
+    sessions = player_registry.snapshot()
     log_action(user, "players_list")
     return {
-        "count": len(player_list),
-        "players": player_list
+        "count": len(sessions),
+        "players": [p["name"] for p in sessions],
+        "sessions": sessions
     }
 
+@app.get("/players/stream", tags=["Players"])
+async def players_stream(user=Depends(verify_api_key)):
+    """
+    参加・退出を Server-Sent Events で配信（最初に現在のオンライン一覧を送る）
+    """
+    queue = player_registry.subscribe()
+
+    async def events():
+        try:
+            yield f"event: snapshot\ndata: {json.dumps(player_registry.snapshot())}\n\n"
+            while True:
+                try:
+                    change = await asyncio.wait_for(queue.get(), 15)
+                    yield f"event: {change['type']}\ndata: {json.dumps(change)}\n\n"
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            player_registry.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# data get entity に埋め込むので、Minecraft の名前に使える文字だけ通す
+PLAYER_NAME = re.compile(r"[A-Za-z0-9_]{1,16}\Z")
+
+def player_uuid(name: str, network: bool = True):
+    """
+    名前から UUID を探す（オンラインならレジストリ、それ以外は resolver）
+    """
+    online = player_registry.get(name)
+    if online and online["uuid"]:
+        return online["uuid"]
+    return uuid_resolver.resolve_one(name, network)
+
+async def live_player_data(name: str):
+    """
+    data get entity の結果。エンティティがなければ None
+    """
+    output = await ops.run("rcon", "data", rcon_pool.command(f"data get entity {name}"))
+    data = await asyncio.to_thread(parse_entity_data, output)
+    return None if data is None else {"source": "live", "data": data, "raw_nbt": output}
+
+async def file_player_data(player_uuid: str):
+    """
+    <level-name>/playerdata/<uuid>.dat の内容。ファイルがなければ None
+    """
+    path = os.path.join(MC_DATA_DIR, server_property("level-name", "world"), "playerdata", f"{player_uuid}.dat")
+    try:
+        data = await asyncio.to_thread(read_nbt_file, path)
+    except FileNotFoundError:
+        return None
+    return {"source": "file", "data": data, "raw_nbt": None}
 
 @app.get("/players/{name}", tags=["Players"])
-def player_detail(name: str, user=Depends(verify_api_key)):
+async def player_detail(
+    name: str,
+    fields: Optional[str] = None,
+    source: str = "auto",
+    raw: bool = False,
+    user=Depends(verify_api_key)
+):
     """
-    プレイヤー詳細情報（NBT）
+    プレイヤー詳細情報（NBT を JSON にしたもの）
+
+    オンラインなら data get entity の結果、オフラインなら playerdata/<uuid>.dat を読む
+    （source=live / file でどちらかに固定）。どちらも PLAYER_DATA_TTL 秒キャッシュする。
+    fields はカンマ区切りのパス（"Pos,Health,Inventory[*].id"）で、指定すると data には
+    その値だけが入る（見つからないパスは含めない）。raw=true なら data get entity の出力も返す。
     """
-    raw = rcon(f"data get entity {name}")
+    if not PLAYER_NAME.match(name):
+        raise HTTPException(status_code=400, detail="Invalid player name")
+    if source not in ("auto", "live", "file"):
+        raise HTTPException(status_code=400, detail=f"Unknown source: {source}")
+    paths = [path.strip() for path in fields.split(",") if path.strip()] if fields else []
+    try:
+        for path in paths:
+            parse_path(path)
+    except NBTError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    uuid = await asyncio.to_thread(player_uuid, name, profile_network(user))
+    snapshot, fetched_at, cached = None, None, False
+    online = player_registry.get(name) is not None and container_status().get("running")
+    try:
+        if source == "live" or (source == "auto" and online):
+            try:
+                snapshot, fetched_at, cached = await player_snapshots.get(
+                    ("live", name), lambda: live_player_data(name)
+                )
+            except (RconError, OperationTimeout) as e:
+                if source == "live":
+                    raise HTTPException(status_code=502, detail=f"RCON error: {e}")
+                print(f"Player detail: RCON failed, reading the player data file instead: {e}")
+        if snapshot is None and source != "live" and uuid:
+            snapshot, fetched_at, cached = await player_snapshots.get(
+                ("file", uuid), lambda: file_player_data(uuid)
+            )
+    except NBTError as e:
+        raise HTTPException(status_code=502, detail=f"Invalid player data: {e}")
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Failed to read player data: {e}")
 
-    if "No entity was found" in raw:
-        raise HTTPException(status_code=404, detail="Player not online")
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Player not online" if source == "live" else "Player not found")
 
     log_action(user, "player_detail", name)
 
-    return {
+    response = {
         "player": name,
-        "raw_nbt": raw
-    }
\ No newline at end of file
+        "uuid": uuid,
+        "source": snapshot["source"],
+        "cached": cached,
+        "fetched_at": fetched_at.isoformat(),
+        "data": select(snapshot["data"], paths) if paths else snapshot["data"],
+    }
+    if raw:
+        response["raw_nbt"] = snapshot["raw_nbt"]
+    return response
+
+@app.get("/profiles", tags=["Players"])
+async def resolve_profiles(
+    names: Optional[str] = None,
+    uuids: Optional[str] = None,
+    user=Depends(verify_api_key)
+):
+    """
+    名前 → UUID と UUID → 名前をまとめて解決（どちらもカンマ区切り、合わせて 100 件まで）
+
+    名前は usercache.json・入ったことのあるプレイヤー・保存済みの結果で足りなければ
+    プロフィール API に PROFILE_BATCH_SIZE 件ずつ問い合わせる。UUID → 名前はローカルの情報だけで引く。
+    見つからないものは null。API の応答を待つのは admin / root だけで、ほかのキーでは
+    裏で問い合わせるので、少し後に呼び直すと見つかることがある。
+    """
+    name_list = [n.strip() for n in names.split(",") if n.strip()] if names else []
+    uuid_list = [u.strip() for u in uuids.split(",") if u.strip()] if uuids else []
+    if len(name_list) + len(uuid_list) > 100:
+        raise HTTPException(status_code=400, detail="Too many names / UUIDs (max 100)")
+    invalid = [n for n in name_list if not PLAYER_NAME.match(n)]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid player names: {', '.join(invalid[:10])}")
+
+    log_action(user, "resolve_profiles", f"{len(name_list)} names, {len(uuid_list)} uuids")
+    return {
+        "names": await asyncio.to_thread(uuid_resolver.resolve, name_list, profile_network(user)) if name_list else {},
+        "uuids": await asyncio.to_thread(uuid_resolver.names, uuid_list) if uuid_list else {},
+    }
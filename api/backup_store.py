@@ -0,0 +1,470 @@
+"""
+コンテンツアドレス方式のワールドバックアップ
+
+ファイルを固定長チャンクに分割し、SHA-256 をキーにリポジトリへ保存する。
+既に保存済みのチャンクは書き込まない。各バックアップ（スナップショット）は
+チャンクを参照するだけの小さなマニフェストになる。
+
+チャンクの圧縮はプロセスプールで並列に行い、結果は投入順に書き出す。
+
+リポジトリ構成:
+    chunks/ab/abcdef...   チャンク本体（先頭 1 バイトが圧縮方式）
+    snapshots/<name>.json.gz  マニフェスト
+    index.db              チャンクの参照カウントとスナップショット一覧
+"""
+import collections
+import datetime
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK_SIZE = 1024 * 1024
+
+CODEC_STORE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+CODECS = {"store": CODEC_STORE, "deflate": CODEC_ZLIB, "zstd": CODEC_ZSTD}
+
+# 既に圧縮済みの形式は再圧縮しない（リージョンファイルは zlib 圧縮済み）
+STORE_ONLY_SUFFIXES = (".mca", ".mcc", ".zip", ".jar", ".gz", ".png", ".ogg")
+
+# これより小さいチャンクはプロセス間転送の方が高くつくので直接圧縮する
+INLINE_COMPRESS_BYTES = 64 * 1024
+
+
+def available_codecs() -> list:
+    return [name for name in CODECS if name != "zstd" or zstandard is not None]
+
+
+def compress_chunk(data: bytes, codec: int, level: int) -> bytes:
+    """
+    チャンクを圧縮して先頭に方式 1 バイトを付けた blob を返す（プロセスプールから呼ばれる）
+
+    圧縮しても小さくならない場合は無圧縮で保存する。
+    """
+    if codec == CODEC_ZLIB:
+        compressed = zlib.compress(data, level)
+    elif codec == CODEC_ZSTD:
+        compressed = zstandard.ZstdCompressor(level=level).compress(data)
+    else:
+        compressed = None
+    if compressed is not None and len(compressed) < len(data):
+        return bytes([codec]) + compressed
+    return bytes([CODEC_STORE]) + data
+
+
+def decompress_chunk(blob: bytes) -> bytes:
+    codec = blob[0]
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(blob[1:])
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdDecompressor().decompress(blob[1:])
+    return blob[1:]
+
+
+class SnapshotPlan:
+    """
+    スナップショット対象の一覧
+
+    files: (相対パス, os.stat_result, 引き継ぐ前回エントリ or None)
+    """
+
+    def __init__(self):
+        self.files = []
+        self.dirs = []
+
+    def changed(self) -> list:
+        return [(rel, st) for rel, st, prev in self.files if prev is None]
+
+
+class SnapshotNotFound(Exception):
+    pass
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+class BackupStore:
+    def __init__(self, root: str, chunk_size: int = CHUNK_SIZE, workers: int = None):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = None
+        self.chunks_dir = os.path.join(root, "chunks")
+        self.snapshots_dir = os.path.join(root, "snapshots")
+        os.makedirs(self.chunks_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        self.lock = threading.RLock()
+        with self._db() as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                hash TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                stored_size INTEGER NOT NULL,
+                refs INTEGER NOT NULL DEFAULT 0
+            )
+            """)
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                name TEXT PRIMARY KEY,
+                tag TEXT NOT NULL,
+                created TEXT NOT NULL,
+                files INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                added_bytes INTEGER NOT NULL
+            )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_tag ON snapshots(tag, created)")
+
+    def _db(self):
+        return sqlite3.connect(os.path.join(self.root, "index.db"), check_same_thread=False)
+
+    def _chunk_path(self, digest: str) -> str:
+        return os.path.join(self.chunks_dir, digest[:2], digest)
+
+    def _manifest_path(self, name: str) -> str:
+        return os.path.join(self.snapshots_dir, f"{name}.json.gz")
+
+    # -----------------------------
+    # チャンク
+    # -----------------------------
+    def _executor(self):
+        if self._pool is None:
+            # uvicorn はスレッドを持つので fork ではなく spawn で起動する
+            self._pool = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def _write_chunk(self, digest: str, blob: bytes) -> int:
+        path = self._chunk_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(blob)
+        os.replace(tmp, path)
+        return len(blob)
+
+    def read_chunk(self, digest: str) -> bytes:
+        with open(self._chunk_path(digest), "rb") as f:
+            return decompress_chunk(f.read())
+
+    # -----------------------------
+    # スナップショット
+    # -----------------------------
+    def latest_manifest(self):
+        with self._db() as conn:
+            row = conn.execute("SELECT name FROM snapshots ORDER BY created DESC LIMIT 1").fetchone()
+        return self.load_manifest(row[0]) if row else None
+
+    def load_manifest(self, name: str) -> dict:
+        try:
+            with gzip.open(self._manifest_path(name), "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise SnapshotNotFound(name)
+
+    def plan(self, source_dir: str, exclude=()) -> "SnapshotPlan":
+        """
+        source_dir を走査し、前回のスナップショットから変わったファイルを洗い出す
+
+        サイズ・mtime が同じファイルは読まずにチャンク一覧を引き継ぐ。
+        """
+        previous = self.latest_manifest()
+        prev_files = {f["path"]: f for f in previous["files"]} if previous else {}
+        plan = SnapshotPlan()
+
+        for root, dirnames, filenames in os.walk(source_dir):
+            rel_root = os.path.relpath(root, source_dir)
+            if rel_root == ".":
+                dirnames[:] = [d for d in dirnames if d not in exclude]
+                filenames = [f for f in filenames if f not in exclude]
+            elif not filenames and not dirnames:
+                plan.dirs.append(rel_root)
+            dirnames.sort()
+
+            for filename in sorted(filenames):
+                rel = os.path.relpath(os.path.join(root, filename), source_dir)
+                try:
+                    st = os.stat(os.path.join(root, filename))
+                except FileNotFoundError:
+                    continue
+                prev = prev_files.get(rel)
+                if prev and prev["size"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns:
+                    plan.files.append((rel, st, prev))
+                else:
+                    plan.files.append((rel, st, None))
+        return plan
+
+    def create_snapshot(self, source_dir: str, name: str, tag: str, exclude=(),
+                        codec: str = "deflate", level: int = 6,
+                        plan: "SnapshotPlan" = None, progress=None) -> dict:
+        """
+        source_dir のスナップショットを作成して統計を返す
+
+        plan を渡した場合は走査をやり直さず、変更ファイルを source_dir
+        （凍結コピー）から読む。codec は "deflate" / "zstd" / "store"。
+        progress(files_done=, files_total=, bytes_done=, bytes_total=) で進捗を通知する。
+        """
+        if codec not in available_codecs():
+            raise ValueError(f"Unsupported codec: {codec}")
+        with self.lock:
+            start = time.perf_counter()
+            if plan is None:
+                plan = self.plan(source_dir, exclude)
+
+            with self._db() as conn:
+                known = {row[0] for row in conn.execute("SELECT hash FROM chunks")}
+
+            new_chunks = {}
+            files, dirs = [], plan.dirs
+            stats = {"files": 0, "files_reused": 0, "bytes_total": 0, "bytes_read": 0,
+                     "bytes_written": 0, "chunks_new": 0, "chunks_reused": 0,
+                     "codec": codec, "level": level}
+            writer = _ChunkWriter(self, CODECS[codec], level, new_chunks, stats)
+            files_total = len(plan.files)
+            bytes_total = sum(st.st_size for _, st, _ in plan.files)
+
+            for rel, st, prev in plan.files:
+                if prev is not None:
+                    entry = dict(prev, mode=st.st_mode & 0o7777)
+                    stats["files_reused"] += 1
+                    stats["chunks_reused"] += len(prev["chunks"])
+                else:
+                    full = os.path.join(source_dir, rel)
+                    entry = self._store_file(full, rel, st, known, new_chunks, stats, writer)
+
+                files.append(entry)
+                stats["files"] += 1
+                stats["bytes_total"] += entry["size"]
+                if progress is not None:
+                    progress(files_done=stats["files"], files_total=files_total,
+                             bytes_done=stats["bytes_total"], bytes_total=bytes_total)
+
+            writer.finish()
+
+            created = datetime.datetime.now().isoformat()
+            manifest = {"name": name, "tag": tag, "created": created, "files": files, "dirs": dirs}
+            tmp = self._manifest_path(name) + ".tmp"
+            with gzip.open(tmp, "wt", encoding="utf-8") as f:
+                json.dump(manifest, f, separators=(",", ":"))
+
+            refs = {}
+            for entry in files:
+                for digest in entry["chunks"]:
+                    refs[digest] = refs.get(digest, 0) + 1
+
+            with self._db() as conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO chunks (hash, size, stored_size, refs) VALUES (?, ?, ?, 0)",
+                    [(d, size, stored) for d, (size, stored) in new_chunks.items()]
+                )
+                conn.executemany(
+                    "UPDATE chunks SET refs = refs + ? WHERE hash = ?",
+                    [(n, d) for d, n in refs.items()]
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?)",
+                    (name, tag, created, stats["files"], stats["bytes_total"], stats["bytes_written"])
+                )
+                os.replace(tmp, self._manifest_path(name))
+
+            stats["name"] = name
+            stats["duration_sec"] = round(time.perf_counter() - start, 3)
+            return stats
+
+    def _store_file(self, full, rel, st, known, new_chunks, stats, writer) -> dict:
+        store_only = rel.lower().endswith(STORE_ONLY_SUFFIXES)
+        file_hash = hashlib.sha256()
+        chunks = []
+        size = 0
+        with open(full, "rb") as f:
+            while True:
+                data = f.read(self.chunk_size)
+                if not data:
+                    break
+                size += len(data)
+                file_hash.update(data)
+                digest = hashlib.sha256(data).hexdigest()
+                chunks.append(digest)
+                if digest in known or digest in new_chunks or digest in writer.pending:
+                    stats["chunks_reused"] += 1
+                    continue
+                writer.submit(digest, data, store_only)
+        stats["bytes_read"] += size
+        return {
+            "path": rel,
+            "size": size,
+            "mtime_ns": st.st_mtime_ns,
+            "mode": st.st_mode & 0o7777,
+            "sha256": file_hash.hexdigest(),
+            "chunks": chunks,
+        }
+
+    def list_snapshots(self, tag: str = None) -> list:
+        query = "SELECT name, tag, created, files, size, added_bytes FROM snapshots"
+        params = ()
+        if tag is not None:
+            query += " WHERE tag = ?"
+            params = (tag,)
+        with self._db() as conn:
+            rows = conn.execute(query + " ORDER BY created DESC", params).fetchall()
+        return [
+            {"name": n, "tag": t, "created": c, "files": f, "size": s, "added_bytes": a}
+            for n, t, c, f, s, a in rows
+        ]
+
+    def exists(self, name: str) -> bool:
+        with self._db() as conn:
+            return conn.execute("SELECT 1 FROM snapshots WHERE name = ?", (name,)).fetchone() is not None
+
+    def restore(self, name: str, target_dir: str, progress=None) -> dict:
+        """
+        スナップショットを target_dir に展開し、ファイルごとに SHA-256 を検証する
+
+        ファイル単位でスレッドに分けて並列に展開する（展開とハッシュ計算は GIL を解放する）。
+        """
+        manifest = self.load_manifest(name)
+        bytes_total = sum(entry["size"] for entry in manifest["files"])
+        files_total = len(manifest["files"])
+        for rel in manifest["dirs"]:
+            os.makedirs(os.path.join(target_dir, rel), exist_ok=True)
+
+        done = {"files": 0, "bytes": 0}
+        progress_lock = threading.Lock()
+
+        def restore_file(entry):
+            path = os.path.join(target_dir, entry["path"])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            file_hash = hashlib.sha256()
+            with open(path, "wb") as f:
+                for digest in entry["chunks"]:
+                    data = self.read_chunk(digest)
+                    file_hash.update(data)
+                    f.write(data)
+            if file_hash.hexdigest() != entry["sha256"]:
+                raise ChecksumMismatch(entry["path"])
+            os.chmod(path, entry["mode"])
+            os.utime(path, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+            with progress_lock:
+                done["files"] += 1
+                done["bytes"] += entry["size"]
+                if progress is not None:
+                    progress(files_done=done["files"], files_total=files_total,
+                             bytes_done=done["bytes"], bytes_total=bytes_total)
+
+        # 大きいファイルから投入して最後に 1 本だけ残るのを避ける
+        entries = sorted(manifest["files"], key=lambda e: e["size"], reverse=True)
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="restore") as pool:
+            futures = [pool.submit(restore_file, entry) for entry in entries]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        return {"files": files_total, "bytes": done["bytes"]}
+
+    def delete_snapshot(self, name: str):
+        """
+        スナップショットを削除して参照カウントを減らす（チャンクは gc() で回収）
+        """
+        with self.lock:
+            manifest = self.load_manifest(name)
+            refs = {}
+            for entry in manifest["files"]:
+                for digest in entry["chunks"]:
+                    refs[digest] = refs.get(digest, 0) + 1
+            with self._db() as conn:
+                conn.executemany(
+                    "UPDATE chunks SET refs = refs - ? WHERE hash = ?",
+                    [(n, d) for d, n in refs.items()]
+                )
+                conn.execute("DELETE FROM snapshots WHERE name = ?", (name,))
+                os.remove(self._manifest_path(name))
+
+    def gc(self) -> dict:
+        """
+        参照カウントが 0 になったチャンクを削除
+        """
+        with self.lock:
+            with self._db() as conn:
+                dead = conn.execute("SELECT hash, stored_size FROM chunks WHERE refs <= 0").fetchall()
+                for digest, _ in dead:
+                    try:
+                        os.remove(self._chunk_path(digest))
+                    except FileNotFoundError:
+                        pass
+                conn.executemany("DELETE FROM chunks WHERE hash = ?", [(d,) for d, _ in dead])
+            return {"chunks_deleted": len(dead), "bytes_freed": sum(s for _, s in dead)}
+
+    def usage(self) -> dict:
+        with self._db() as conn:
+            chunks, stored, logical = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(stored_size), 0), COALESCE(SUM(size), 0) FROM chunks"
+            ).fetchone()
+        return {"chunks": chunks, "stored_bytes": stored, "unique_bytes": logical}
+
+
+class _ChunkWriter:
+    """
+    新規チャンクをプロセスプールで圧縮し、投入順に書き出す
+
+    メモリを抑えるため、処理中のチャンク数は workers * 2 までに制限する。
+    """
+
+    def __init__(self, store: BackupStore, codec: int, level: int, new_chunks: dict, stats: dict):
+        self.store = store
+        self.codec = codec
+        self.level = level
+        self.new_chunks = new_chunks
+        self.stats = stats
+        self.pending = set()
+        self.queue = collections.deque()
+        self.max_inflight = store.workers * 2
+
+    def submit(self, digest: str, data: bytes, store_only: bool):
+        self.pending.add(digest)
+        if store_only or self.codec == CODEC_STORE:
+            blob = bytes([CODEC_STORE]) + data
+        elif self.store.workers == 1 or len(data) < INLINE_COMPRESS_BYTES:
+            blob = compress_chunk(data, self.codec, self.level)
+        else:
+            blob = self.store._executor().submit(compress_chunk, data, self.codec, self.level)
+        self.queue.append((digest, len(data), blob))
+        while len(self.queue) > self.max_inflight:
+            self._flush_one()
+
+    def _flush_one(self):
+        digest, size, blob = self.queue.popleft()
+        if not isinstance(blob, bytes):
+            blob = blob.result()
+        stored = self.store._write_chunk(digest, blob)
+        self.pending.discard(digest)
+        self.new_chunks[digest] = (size, stored)
+        self.stats["chunks_new"] += 1
+        self.stats["bytes_written"] += stored
+
+    def finish(self):
+        while self.queue:
+            self._flush_one()
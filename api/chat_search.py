@@ -0,0 +1,245 @@
+"""
+チャットログの全文検索（SQLite FTS5）
+
+chat_logs を外部コンテンツとする FTS5 テーブル chat_fts をトリガーで同期する。
+トークナイザーは trigram: 日本語のように単語を空白で区切らない文でも
+部分一致で引ける（LIKE '%...%' と同じ結果を索引で返す）。そのため 3 文字未満の語は
+索引を使えず、ほかの条件で絞った行に LIKE をかける。
+
+検索式:
+    ダイヤ 剣              両方を含む（AND）
+    "ネザー ゲート"        フレーズ
+    dia*                   前方一致（trigram では語の途中も含む部分一致と同じ）
+    ダイヤ OR エメラルド   OR / AND / NOT と括弧
+"""
+import html
+import re
+import sqlite3
+
+# 検索式の字句: フレーズ / 括弧 / それ以外の語
+QUERY_TOKEN = re.compile(r'"([^"]*)"?|([()])|([^\s()"]+)')
+OPERATORS = ("AND", "OR", "NOT")
+# trigram の索引で引ける最短の長さ
+MIN_TERM = 3
+
+SNIPPET_CHARS = 160
+MARK_START, MARK_END = "<mark>", "</mark>"
+
+FTS_TRIGGERS = {
+    "chat_fts_insert": """
+        CREATE TRIGGER chat_fts_insert AFTER INSERT ON chat_logs BEGIN
+            INSERT INTO chat_fts(rowid, message) VALUES (new.id, new.message);
+        END
+    """,
+    "chat_fts_delete": """
+        CREATE TRIGGER chat_fts_delete AFTER DELETE ON chat_logs BEGIN
+            INSERT INTO chat_fts(chat_fts, rowid, message) VALUES ('delete', old.id, old.message);
+        END
+    """,
+    "chat_fts_update": """
+        CREATE TRIGGER chat_fts_update AFTER UPDATE OF message ON chat_logs BEGIN
+            INSERT INTO chat_fts(chat_fts, rowid, message) VALUES ('delete', old.id, old.message);
+            INSERT INTO chat_fts(rowid, message) VALUES (new.id, new.message);
+        END
+    """,
+}
+
+
+class QueryError(ValueError):
+    pass
+
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def parse_query(query: str):
+    """
+    検索式を FTS5 の MATCH 式と、LIKE で調べる短い語、強調表示する語に分ける
+
+    語はすべて引用符で囲む（"player:name" などが列指定や構文エラーにならないように）。
+    戻り値: (MATCH 式 or None, LIKE で調べる語, 強調する語)
+    """
+    parts, short, terms = [], [], []
+    has_operator = False
+    for phrase, paren, word in QUERY_TOKEN.findall(query or ""):
+        if paren:
+            has_operator = True
+            parts.append(paren)
+            continue
+        if word in OPERATORS:
+            has_operator = True
+            parts.append(word)
+            continue
+        term = phrase if phrase or not word else word
+        prefix = not phrase and term.endswith("*")
+        term = term.rstrip("*") if prefix else term
+        if not term.strip():
+            continue
+        terms.append(term)
+        if len(term) < MIN_TERM:
+            short.append(term)
+            continue
+        parts.append(_quote(term) + (" *" if prefix else ""))
+    if not terms:
+        raise QueryError("Empty search query")
+    if short and has_operator:
+        # OR / NOT の中の短い語は LIKE に置き換えられない
+        raise QueryError(f"Terms combined with AND / OR / NOT must be at least {MIN_TERM} characters")
+    match = " ".join(parts) if parts else None
+    return match, short, terms
+
+
+def _like(term: str) -> str:
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def highlight(message: str, terms: list, width: int = SNIPPET_CHARS) -> str:
+    """
+    一致した部分を <mark> で囲んだ抜粋（HTML エスケープ済み）
+
+    長いメッセージは最初の一致の前後 width 文字程度に切り詰める。
+    """
+    pattern = re.compile("|".join(re.escape(t) for t in sorted(set(terms), key=len, reverse=True)), re.IGNORECASE)
+    start, end = 0, len(message)
+    if len(message) > width:
+        m = pattern.search(message)
+        center = m.start() if m else 0
+        start = max(0, min(center - width // 3, len(message) - width))
+        end = start + width
+    pieces = []
+    pos = start
+    for m in pattern.finditer(message, start, end):
+        pieces.append(html.escape(message[pos:m.start()]))
+        pieces.append(MARK_START + html.escape(m.group()) + MARK_END)
+        pos = m.end()
+    pieces.append(html.escape(message[pos:end]))
+    return ("…" if start else "") + "".join(pieces) + ("…" if end < len(message) else "")
+
+
+class ChatIndex:
+    """
+    get_db: sqlite3 接続を返す callable
+    """
+
+    def __init__(self, get_db):
+        self.get_db = get_db
+
+    def init_schema(self, conn) -> bool:
+        """
+        FTS5 テーブルとトリガーを作る。新しく作ったときは既存の chat_logs から索引を作り True を返す
+        """
+        existing = {
+            name for (name,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE name = 'chat_fts' OR name LIKE 'chat_fts_%'"
+            )
+        }
+        created = "chat_fts" not in existing
+        if created:
+            conn.execute("""
+            CREATE VIRTUAL TABLE chat_fts USING fts5(
+                message,
+                content='chat_logs',
+                content_rowid='id',
+                tokenize='trigram'
+            )
+            """)
+        for name, sql in FTS_TRIGGERS.items():
+            if name not in existing:
+                conn.execute(sql)
+        if created:
+            conn.execute("INSERT INTO chat_fts(chat_fts) VALUES ('rebuild')")
+        return created
+
+    def search(self, query: str, player_uuid: str = None, world: str = None, since: str = None,
+               until: str = None, sort: str = "newest", cursor: str = None, limit: int = 20,
+               literal: bool = False) -> dict:
+        """
+        新しい順（sort="newest"）または関連度順（sort="relevance"）に検索する
+
+        literal=True なら query を検索式として解釈せず、そのままの文字列を探す。
+        cursor は前回の next_cursor（newest は id、relevance は "スコア:id"）。
+        since / until は ISO 8601 の日時（until は含まない）。
+        relevance は一致する全行のスコアを計算するので、よく出る語では遅くなる。
+        """
+        if not literal:
+            match, short, terms = parse_query(query)
+        elif not query:
+            raise QueryError("Empty search query")
+        elif len(query) < MIN_TERM:
+            match, short, terms = None, [query], [query]
+        else:
+            match, short, terms = _quote(query), [], [query]
+        if sort not in ("newest", "relevance"):
+            raise QueryError(f"Unknown sort: {sort}")
+        if sort == "relevance" and match is None:
+            raise QueryError(f"Relevance sort needs a term of at least {MIN_TERM} characters")
+
+        conditions, params = [], []
+        for condition, value in (("c.player_uuid = ?", player_uuid), ("c.world = ?", world),
+                                 ("c.timestamp >= ?", since), ("c.timestamp < ?", until)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        for term in short:
+            conditions.append("c.message LIKE ? ESCAPE '\\'")
+            params.append(_like(term))
+
+        if match is None:
+            # 短い語だけ: 索引なしで新しい順に調べる
+            source, rowid, score = "chat_logs c", "c.id", "NULL"
+        else:
+            source = "chat_fts JOIN chat_logs c ON c.id = chat_fts.rowid"
+            # bm25 は一致する全行の件数を数えるので、新しい順では計算しない（先頭 limit 件で止まれる）
+            rowid, score = "chat_fts.rowid", "chat_fts.rank" if sort == "relevance" else "NULL"
+            conditions.insert(0, "chat_fts MATCH ?")
+            params.insert(0, match)
+
+        try:
+            if cursor is not None:
+                if sort == "newest":
+                    conditions.append(f"{rowid} < ?")
+                    params.append(int(cursor))
+                else:
+                    last_score, _, last_id = cursor.rpartition(":")
+                    last_score, last_id = float(last_score), int(last_id)
+                    conditions.append(f"({score} > ? OR ({score} = ? AND {rowid} > ?))")
+                    params += [last_score, last_score, last_id]
+        except ValueError:
+            raise QueryError(f"Invalid cursor: {cursor}")
+
+        order = f"{rowid} DESC" if sort == "newest" else f"{score}, {rowid}"
+        limit = max(1, min(limit, 200))
+        with self.get_db() as conn:
+            try:
+                rows = conn.execute(f"""
+                    SELECT c.id, c.timestamp, c.player_uuid, c.player_name, c.message, c.world, {score}
+                    FROM {source}
+                    WHERE {" AND ".join(conditions)}
+                    ORDER BY {order}
+                    LIMIT ?
+                """, (*params, limit)).fetchall()
+            except sqlite3.OperationalError as e:
+                # 括弧の対応が取れていないなど
+                if "fts5" in str(e):
+                    raise QueryError(f"Invalid search query: {e}")
+                raise
+
+        results = [
+            {
+                "id": id,
+                "timestamp": ts,
+                "player_uuid": uuid,
+                "player_name": name,
+                "message": message,
+                "world": world,
+                "snippet": highlight(message, terms),
+                "score": score,
+            }
+            for id, ts, uuid, name, message, world, score in rows
+        ]
+        next_cursor = None
+        if len(results) == limit:
+            last = results[-1]
+            next_cursor = str(last["id"]) if sort == "newest" else f"{last['score']!r}:{last['id']}"
+        return {"results": results, "next_cursor": next_cursor}
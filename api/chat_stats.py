@@ -0,0 +1,159 @@
+"""
+チャット統計の集計済みカウンター
+
+chat_logs への追加・削除をトリガーで拾い、日別×プレイヤー別と 1 時間ごとの
+メッセージ数を増減させる。/chat/stats は chat_logs を数え直さず、
+数百〜数千行のカウンター表を主キーの範囲で読むだけで答える。
+
+日・時間はメッセージの timestamp（ローカル時刻の ISO 8601）の先頭で決まる
+（"2026-10-17" が日、"2026-10-17T13" が時間）。cleanup_old_data で古い行を
+消すとトリガーで減り、0 になった行は prune() で消す。
+"""
+import datetime
+
+COUNTER_TABLES = {
+    "chat_daily_counts": """
+        CREATE TABLE chat_daily_counts (
+            day TEXT NOT NULL,
+            player_name TEXT NOT NULL,
+            messages INTEGER NOT NULL,
+            PRIMARY KEY (day, player_name)
+        ) WITHOUT ROWID
+    """,
+    "chat_hourly_counts": """
+        CREATE TABLE chat_hourly_counts (
+            hour TEXT PRIMARY KEY,
+            messages INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """,
+}
+
+# {row} は new / old、{sign} は +1 / -1
+_UPSERT = """
+    INSERT INTO chat_daily_counts (day, player_name, messages)
+    VALUES (substr({row}.timestamp, 1, 10), {row}.player_name, {sign})
+    ON CONFLICT (day, player_name) DO UPDATE SET messages = messages + excluded.messages;
+    INSERT INTO chat_hourly_counts (hour, messages)
+    VALUES (substr({row}.timestamp, 1, 13), {sign})
+    ON CONFLICT (hour) DO UPDATE SET messages = messages + excluded.messages;
+"""
+
+COUNTER_TRIGGERS = {
+    "chat_counts_insert": f"""
+        CREATE TRIGGER chat_counts_insert AFTER INSERT ON chat_logs BEGIN
+            {_UPSERT.format(row="new", sign=1)}
+        END
+    """,
+    "chat_counts_delete": f"""
+        CREATE TRIGGER chat_counts_delete AFTER DELETE ON chat_logs BEGIN
+            {_UPSERT.format(row="old", sign=-1)}
+        END
+    """,
+    "chat_counts_update": f"""
+        CREATE TRIGGER chat_counts_update AFTER UPDATE OF timestamp, player_name ON chat_logs BEGIN
+            {_UPSERT.format(row="old", sign=-1)}
+            {_UPSERT.format(row="new", sign=1)}
+        END
+    """,
+}
+
+
+class ChatStats:
+    """
+    get_db: sqlite3 接続を返す callable
+    """
+
+    def __init__(self, get_db):
+        self.get_db = get_db
+
+    def init_schema(self, conn) -> bool:
+        """
+        カウンター表とトリガーを作る。新しく作ったときは既存の chat_logs から数えて True を返す
+        """
+        existing = {
+            name for (name,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE name LIKE 'chat_%_counts' OR name LIKE 'chat_counts_%'"
+            )
+        }
+        created = not all(name in existing for name in COUNTER_TABLES)
+        if created:
+            # 片方だけ残っていた場合も数え直す
+            for name, sql in COUNTER_TABLES.items():
+                conn.execute(f"DROP TABLE IF EXISTS {name}")
+                conn.execute(sql)
+        for name, sql in COUNTER_TRIGGERS.items():
+            if name not in existing:
+                conn.execute(sql)
+        if created:
+            conn.execute("""
+            INSERT INTO chat_daily_counts (day, player_name, messages)
+            SELECT substr(timestamp, 1, 10), player_name, COUNT(*) FROM chat_logs GROUP BY 1, 2
+            """)
+            conn.execute("""
+            INSERT INTO chat_hourly_counts (hour, messages)
+            SELECT substr(timestamp, 1, 13), COUNT(*) FROM chat_logs GROUP BY 1
+            """)
+        return created
+
+    def prune(self):
+        """
+        古い行の削除で 0 になったカウンターを消す
+        """
+        with self.get_db() as conn:
+            conn.execute("DELETE FROM chat_daily_counts WHERE messages <= 0")
+            conn.execute("DELETE FROM chat_hourly_counts WHERE messages <= 0")
+
+    def summary(self, top: int = 1, days: int = 7) -> dict:
+        """
+        総数・今日の数と、直近 days 日（今日を含む）のメッセージ数上位 top 人
+        """
+        today = datetime.date.today()
+        first_day = (today - datetime.timedelta(days=days - 1)).isoformat()
+        with self.get_db() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(messages), 0) FROM chat_hourly_counts").fetchone()[0]
+            today_count = conn.execute(
+                "SELECT COALESCE(SUM(messages), 0) FROM chat_hourly_counts WHERE hour >= ?",
+                (today.isoformat(),)
+            ).fetchone()[0]
+            top_chatters = conn.execute("""
+                SELECT player_name, SUM(messages) AS count
+                FROM chat_daily_counts
+                WHERE day >= ?
+                GROUP BY player_name
+                HAVING count > 0
+                ORDER BY count DESC, player_name
+                LIMIT ?
+            """, (first_day, top)).fetchall()
+        return {
+            "total_messages": total,
+            "today_messages": today_count,
+            "top_chatters": [{"player_name": name, "message_count": count} for name, count in top_chatters],
+        }
+
+    def hourly(self, hours: int = 24, days: int = 7) -> dict:
+        """
+        直近 hours 時間の 1 時間ごとのメッセージ数（0 の時間も含む）と、
+        直近 days 日の時刻別（0〜23 時）の合計
+        """
+        now = datetime.datetime.now().replace(minute=0, second=0, microsecond=0)
+        first_hour = now - datetime.timedelta(hours=hours - 1)
+        first_day = (now - datetime.timedelta(days=days)).isoformat()[:13]
+        with self.get_db() as conn:
+            counts = dict(conn.execute(
+                "SELECT hour, messages FROM chat_hourly_counts WHERE hour >= ?",
+                (first_hour.isoformat()[:13],)
+            ).fetchall())
+            by_hour = [0] * 24
+            for hour, messages in conn.execute("""
+                SELECT CAST(substr(hour, 12, 2) AS INTEGER), SUM(messages)
+                FROM chat_hourly_counts
+                WHERE hour > ?
+                GROUP BY 1
+            """, (first_day,)):
+                if hour is not None and 0 <= hour < 24:
+                    by_hour[hour] = messages
+        series = []
+        for i in range(hours):
+            hour = first_hour + datetime.timedelta(hours=i)
+            series.append({"hour": hour.isoformat(), "messages": counts.get(hour.isoformat()[:13], 0)})
+        return {"hours": series, "by_hour_of_day": by_hour}
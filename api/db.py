@@ -0,0 +1,131 @@
+"""
+SQLite 接続の管理
+
+スレッドごとに 1 本の接続を使い回し、WAL モードと共通の PRAGMA を
+接続時に一度だけ設定する。接続を使い回すことで sqlite3 のプリペアド
+ステートメントキャッシュ（SQL 文字列ごと）も効くようになる。
+
+    with database.connection() as conn:   # 抜けるときに commit / rollback（close はしない）
+        conn.execute(...)
+
+observer を渡すと execute / executemany / コミットの所要時間を
+observer(種類, 秒) で知らせる（種類は "query" / "batch" / "commit"）。
+"""
+import sqlite3
+import threading
+import time
+
+PRAGMAS = {
+    # 読み取りが書き込みを待たない。書き込み同士は busy_timeout まで待つ
+    "journal_mode": "WAL",
+    # WAL では NORMAL でも電源断以外でデータは失われない
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    # 負の値は KiB 単位
+    "cache_size": -16000,
+    "temp_store": "MEMORY",
+    "mmap_size": 128 * 1024 * 1024,
+}
+
+
+class _TimedConnection(sqlite3.Connection):
+    """
+    文の実行とコミットの所要時間を observer に渡す接続
+    """
+    observer = None
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.observer("query", time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.observer("batch", time.perf_counter() - start)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            self.observer("commit", time.perf_counter() - start)
+
+    def __exit__(self, exc_type, exc, tb):
+        # with conn: のコミットは commit() を経由しないのでここで計る
+        if exc_type is not None or not self.in_transaction:
+            return super().__exit__(exc_type, exc, tb)
+        start = time.perf_counter()
+        try:
+            return super().__exit__(exc_type, exc, tb)
+        finally:
+            self.observer("commit", time.perf_counter() - start)
+
+
+class Database:
+    """
+    path:              DB ファイル
+    cached_statements: 接続ごとのプリペアドステートメントキャッシュの大きさ
+    observer:          (種類, 秒) -> None。None なら計測しない
+    """
+
+    def __init__(self, path: str, pragmas: dict = None, cached_statements: int = 256, observer=None):
+        self.path = path
+        self.pragmas = dict(PRAGMAS, **(pragmas or {}))
+        self.cached_statements = cached_statements
+        self.observer = observer
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.pragmas["busy_timeout"] / 1000,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+            factory=_TimedConnection if self.observer else sqlite3.Connection,
+        )
+        if self.observer:
+            conn.observer = self.observer
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        with self._lock:
+            self.connections_opened += 1
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        呼び出し元スレッド専用の接続を返す（スレッドが終われば閉じられる）
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.path != self.path:
+            conn = self._local.conn = self._open()
+            self._local.path = self.path
+        return conn
+
+    def checkpoint(self, mode: str = "PASSIVE") -> dict:
+        """
+        WAL の内容を DB 本体に書き戻す（TRUNCATE なら WAL ファイルも空にする）
+        """
+        start = time.perf_counter()
+        busy, wal_pages, checkpointed = self.connection().execute(
+            f"PRAGMA wal_checkpoint({mode})"
+        ).fetchone()
+        return {
+            "mode": mode,
+            "busy": bool(busy),
+            "wal_pages": wal_pages,
+            "checkpointed_pages": checkpointed,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+
+    def optimize(self):
+        """
+        クエリプランナーの統計を必要な分だけ更新する
+        """
+        self.connection().execute("PRAGMA optimize")
@@ -0,0 +1,225 @@
+"""
+Docker Engine API クライアント（unix ソケット直結, asyncio）
+
+docker CLI を起動せず、1 本の keep-alive 接続で Engine API を叩く。
+コンテナイベントは別接続でストリーミング受信する。
+"""
+import asyncio
+import datetime
+import json
+import urllib.parse
+
+
+class DockerError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Docker API {status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class _Response:
+    def __init__(self, status: int, headers: dict, reader):
+        self.status = status
+        self.headers = headers
+        self.reader = reader
+
+    @property
+    def chunked(self) -> bool:
+        return self.headers.get("transfer-encoding", "").lower() == "chunked"
+
+    async def iter_chunks(self):
+        """
+        chunked エンコーディングのボディをチャンク単位で返す
+        """
+        while True:
+            size_line = await self.reader.readline()
+            if not size_line:
+                raise ConnectionError("Docker API connection closed")
+            size = int(size_line.split(b";", 1)[0].strip(), 16)
+            if size == 0:
+                # 終端チャンク後のトレーラーを読み捨てる
+                while (await self.reader.readline()) not in (b"\r\n", b""):
+                    pass
+                return
+            data = await self.reader.readexactly(size)
+            await self.reader.readexactly(2)
+            yield data
+
+    async def read(self) -> bytes:
+        if self.chunked:
+            return b"".join([chunk async for chunk in self.iter_chunks()])
+        length = int(self.headers.get("content-length", "0"))
+        return await self.reader.readexactly(length) if length else b""
+
+
+class DockerEngine:
+    """
+    Engine API の最小クライアント
+    """
+
+    def __init__(self, socket_path: str = "/var/run/docker.sock", timeout: float = 90):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._lock = None
+
+    async def _connect(self):
+        return await asyncio.open_unix_connection(self.socket_path)
+
+    async def _send(self, writer, method: str, path: str, params: dict = None, body=None):
+        if params:
+            path += "?" + urllib.parse.urlencode(params)
+        data = json.dumps(body).encode() if body is not None else b""
+        head = [
+            f"{method} {path} HTTP/1.1",
+            "Host: docker",
+            f"Content-Length: {len(data)}",
+        ]
+        if body is not None:
+            head.append("Content-Type: application/json")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + data)
+        await writer.drain()
+
+    async def _read_head(self, reader) -> _Response:
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Docker API connection closed")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        return _Response(status, headers, reader)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._reader = None
+
+    async def request(self, method: str, path: str, params: dict = None, body=None):
+        """
+        keep-alive 接続でリクエストを送り (status, JSON or None) を返す
+
+        接続が切れていた場合は 1 度だけ張り直す。
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            for attempt in (0, 1):
+                if self._writer is None:
+                    self._reader, self._writer = await self._connect()
+                try:
+                    await self._send(self._writer, method, path, params, body)
+                    resp = await asyncio.wait_for(self._read_head(self._reader), self.timeout)
+                    data = await resp.read()
+                    break
+                except asyncio.TimeoutError:
+                    # TimeoutError は OSError の派生なので先に捕まえて再送しない
+                    self.close()
+                    raise
+                except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                    self.close()
+                    if attempt:
+                        raise
+                except BaseException:
+                    # キャンセル時は応答途中の接続を再利用しない
+                    self.close()
+                    raise
+            if resp.headers.get("connection", "").lower() == "close":
+                self.close()
+
+        payload = json.loads(data) if data and "json" in resp.headers.get("content-type", "") else None
+        if resp.status >= 400:
+            message = payload.get("message") if isinstance(payload, dict) else data.decode(errors="replace")
+            raise DockerError(resp.status, message or "")
+        return resp.status, payload
+
+    # -----------------------------
+    # コンテナ操作
+    # -----------------------------
+    async def inspect(self, container: str) -> dict:
+        _, payload = await self.request("GET", f"/containers/{container}/json")
+        return payload
+
+    async def start(self, container: str) -> bool:
+        """
+        起動。既に起動していた場合は False
+        """
+        status, _ = await self.request("POST", f"/containers/{container}/start")
+        return status != 304
+
+    async def stop(self, container: str, timeout: int = 30) -> bool:
+        """
+        停止。既に停止していた場合は False
+        """
+        status, _ = await self.request("POST", f"/containers/{container}/stop", {"t": timeout})
+        return status != 304
+
+    async def restart(self, container: str, timeout: int = 30):
+        await self.request("POST", f"/containers/{container}/restart", {"t": timeout})
+
+    async def stats(self, container: str) -> dict:
+        """
+        リソース使用量を 1 回だけ取得（one-shot: CPU 使用率の計算に使う前回値は含まれない）
+        """
+        _, payload = await self.request(
+            "GET", f"/containers/{container}/stats", {"stream": "false", "one-shot": "true"}
+        )
+        return payload
+
+    async def events(self, filters: dict):
+        """
+        コンテナイベントを 1 件ずつ返す非同期ジェネレータ（専用接続）
+        """
+        reader, writer = await self._connect()
+        try:
+            await self._send(writer, "GET", "/events", {"filters": json.dumps(filters)})
+            resp = await self._read_head(reader)
+            if resp.status >= 400:
+                raise DockerError(resp.status, (await resp.read()).decode(errors="replace"))
+            buf = b""
+            async for chunk in resp.iter_chunks():
+                buf += chunk
+                while b"\n" in buf:
+                    line, buf = buf.split(b"\n", 1)
+                    if line.strip():
+                        yield json.loads(line)
+        finally:
+            writer.close()
+
+
+def parse_docker_time(value: str):
+    """
+    Docker の RFC3339（ナノ秒付き）時刻を datetime に変換
+    """
+    if not value or value.startswith("0001-01-01"):
+        return None
+    main, _, frac = value.rstrip("Z").partition(".")
+    frac = (frac + "000000")[:6]
+    return datetime.datetime.fromisoformat(f"{main}.{frac}+00:00")
+
+
+def summarize_state(info: dict) -> dict:
+    """
+    inspect 結果から状態・ヘルス・稼働時間を取り出す
+    """
+    state = info.get("State", {})
+    started = parse_docker_time(state.get("StartedAt"))
+    uptime = None
+    if state.get("Running") and started:
+        uptime = int((datetime.datetime.now(datetime.timezone.utc) - started).total_seconds())
+    return {
+        "status": state.get("Status", "unknown"),
+        "running": bool(state.get("Running")),
+        "health": (state.get("Health") or {}).get("Status"),
+        "started_at": state.get("StartedAt") if started else None,
+        "finished_at": state.get("FinishedAt") if parse_docker_time(state.get("FinishedAt")) else None,
+        "uptime_seconds": uptime,
+        "exit_code": state.get("ExitCode"),
+        "restart_count": info.get("RestartCount", 0),
+    }
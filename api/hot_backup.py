@@ -0,0 +1,158 @@
+"""
+稼働中サーバーの一貫したバックアップ
+
+save-off → save-all flush でワールドの書き込みを止めている間に、
+前回から変わったファイルだけを凍結コピーし、すぐに save-on に戻す。
+アーカイブ（チャンク化・圧縮）は save-on の後に凍結コピーから行う。
+"""
+import errno
+import fcntl
+import os
+import re
+import shutil
+import time
+
+# linux/fs.h: FICLONE = _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+SAVED_PATTERN = re.compile(r"Saved the game")
+
+
+def clone_file(src: str, dst: str) -> str:
+    """
+    src を dst に複製する。reflink（CoW）が使えればそれを使う
+
+    ハードリンクは使わない。リージョンファイルはサーバーが同じ inode を
+    上書きするため、save-on 後の書き込みがコピー側にも反映されてしまう。
+    """
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            method = "reflink"
+        except OSError as e:
+            if e.errno not in (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.EBADF):
+                raise
+            shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+            method = "copy"
+    shutil.copystat(src, dst)
+    return method
+
+
+def wait_for_log_line(path: str, offset: int, pattern, timeout: float) -> bool:
+    """
+    ログの offset 以降に pattern に一致する行が出るまで待つ
+    """
+    deadline = time.monotonic() + timeout
+    buf = ""
+    while True:
+        try:
+            with open(path, encoding="utf-8", errors="ignore") as f:
+                if os.fstat(f.fileno()).st_size < offset:
+                    offset = 0  # ローテーションされた
+                f.seek(offset)
+                data = f.read()
+                offset = f.tell()
+        except FileNotFoundError:
+            data = ""
+        buf += data
+        if pattern.search(buf):
+            return True
+        buf = buf[buf.rfind("\n") + 1:]
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.05)
+
+
+class HotBackupCoordinator:
+    """
+    rcon:    コマンドを実行して応答を返す callable（接続できなければ例外）
+    running: () -> bool。コンテナが稼働中か（分からなければ例外）
+    """
+
+    def __init__(self, store, rcon, running, data_dir: str, staging_dir: str, log_file: str,
+                 exclude=(), flush_timeout: float = 60):
+        self.store = store
+        self.rcon = rcon
+        self.running = running
+        self.data_dir = data_dir
+        self.staging_dir = staging_dir
+        self.log_file = log_file
+        self.exclude = set(exclude) | {os.path.basename(staging_dir)}
+        self.flush_timeout = flush_timeout
+
+    def _log_size(self) -> int:
+        try:
+            return os.path.getsize(self.log_file)
+        except OSError:
+            return 0
+
+    def _freeze(self, plan) -> dict:
+        """
+        変更ファイルを staging_dir に凍結コピーし、plan を更新する
+        """
+        methods = {"reflink": 0, "copy": 0}
+        vanished = set()
+        for rel, _ in plan.changed():
+            try:
+                methods[clone_file(os.path.join(self.data_dir, rel),
+                                   os.path.join(self.staging_dir, rel))] += 1
+            except FileNotFoundError:
+                vanished.add(rel)
+        if vanished:
+            plan.files = [f for f in plan.files if f[0] not in vanished]
+        return methods
+
+    def run(self, name: str, tag: str, codec: str, level: int, progress=None) -> dict:
+        with self.store.lock:
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+            try:
+                self.rcon("save-off")
+                online = True
+            except Exception as e:
+                # 稼働中に直接読むと書き込み途中のワールドを保存してしまう
+                if self.running():
+                    raise RuntimeError(f"save-off failed while the server is running: {e}") from e
+                # サーバー停止中はファイルが変わらないので直接読む
+                online = False
+
+            if not online:
+                result = self.store.create_snapshot(
+                    self.data_dir, name, tag, self.exclude, codec, level, progress=progress
+                )
+                result["hot"] = False
+                return result
+
+            try:
+                offset = self._log_size()
+                reply = self.rcon("save-all flush")
+                if not SAVED_PATTERN.search(reply):
+                    if not wait_for_log_line(self.log_file, offset, SAVED_PATTERN, self.flush_timeout):
+                        raise TimeoutError("save-all flush did not complete")
+
+                frozen_at = time.perf_counter()
+                plan = self.store.plan(self.data_dir, self.exclude)
+                methods = self._freeze(plan)
+                window = time.perf_counter() - frozen_at
+            except BaseException:
+                # save-on の失敗で元の例外を隠さない
+                try:
+                    self.rcon("save-on")
+                except Exception as e:
+                    print(f"save-on failed after an aborted backup (run it manually): {e}")
+                raise
+            # ここで失敗したら自動保存が止まったままなのでジョブを失敗にする
+            self.rcon("save-on")
+
+            try:
+                result = self.store.create_snapshot(
+                    self.staging_dir, name, tag, self.exclude, codec, level,
+                    plan=plan, progress=progress
+                )
+            finally:
+                shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+            result["hot"] = True
+            result["save_off_window_sec"] = round(window, 3)
+            result["frozen_files"] = methods
+            return result
@@ -0,0 +1,280 @@
+"""
+長時間処理のジョブキュー
+
+バックアップ・リストア・アップロード展開などを HTTP リクエストの外で
+実行する。ジョブは SQLite に保存され、再起動後も続きから実行される。
+"""
+import datetime
+import json
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 進捗を DB に書き込む最短間隔（秒）
+PROGRESS_FLUSH_INTERVAL = 1.0
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """
+    実行中ジョブのハンドル（ハンドラーに渡される）
+    """
+
+    def __init__(self, manager, job_id: str, job_type: str, params: dict):
+        self.manager = manager
+        self.id = job_id
+        self.type = job_type
+        self.params = params
+        self.progress_state = {
+            "bytes_done": 0, "bytes_total": None,
+            "files_done": 0, "files_total": None,
+            "message": None,
+        }
+        self.started = time.monotonic()
+        self.cancel_requested = False
+        self._last_flush = 0.0
+
+    def progress(self, **fields):
+        """
+        進捗を更新する。キャンセル要求があれば JobCancelled を送出
+        """
+        if self.cancel_requested:
+            raise JobCancelled()
+        self.progress_state.update({k: v for k, v in fields.items() if v is not None})
+        now = time.monotonic()
+        if now - self._last_flush >= PROGRESS_FLUSH_INTERVAL:
+            self._last_flush = now
+            self.manager._save_progress(self)
+
+    def snapshot(self) -> dict:
+        state = dict(self.progress_state)
+        elapsed = time.monotonic() - self.started
+        done, total = state["bytes_done"], state["bytes_total"]
+        if total is None and state["files_total"]:
+            done, total = state["files_done"], state["files_total"]
+        state["elapsed_sec"] = round(elapsed, 1)
+        state["percent"] = round(done / total * 100, 1) if total else None
+        state["eta_sec"] = round((total - done) * elapsed / done, 1) if total and done else None
+        return state
+
+
+class JobManager:
+    """
+    get_db:  sqlite3 接続を返す callable
+    workers: ワーカースレッド数
+    """
+
+    def __init__(self, get_db, workers: int = 4):
+        self.get_db = get_db
+        self.workers = workers
+        self.handlers = {}
+        self.group_limits = {}
+        self._pending = []
+        self._running = {}
+        self._group_running = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def register(self, job_type: str, handler, group: str = None, limit: int = 1):
+        """
+        ジョブ種別を登録。同じ group のジョブは合計 limit 件まで同時に実行する
+        """
+        group = group or job_type
+        self.handlers[job_type] = (handler, group)
+        self.group_limits[group] = limit
+
+    def init_schema(self, conn):
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            status TEXT NOT NULL,
+            params TEXT,
+            progress TEXT,
+            result TEXT,
+            error TEXT,
+            submitted_by TEXT,
+            created TEXT NOT NULL,
+            started TEXT,
+            finished TEXT
+        )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created)")
+
+    def start(self):
+        """
+        ワーカーを起動し、前回終了時に残っていたジョブを再投入する
+        """
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="job")
+        with self.get_db() as conn:
+            self.init_schema(conn)
+            conn.execute("UPDATE jobs SET status = 'queued', started = NULL WHERE status = 'running'")
+            rows = conn.execute(
+                "SELECT id, type, params FROM jobs WHERE status = 'queued' ORDER BY created"
+            ).fetchall()
+        with self._lock:
+            for job_id, job_type, params in rows:
+                if job_type in self.handlers:
+                    self._pending.append(Job(self, job_id, job_type, json.loads(params or "{}")))
+        self._dispatch()
+
+    def shutdown(self):
+        with self._lock:
+            self._pending.clear()
+            for job in self._running.values():
+                job.cancel_requested = True
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def submit(self, job_type: str, params: dict = None, submitted_by: str = None) -> str:
+        """
+        submitted_by: 一覧に出す投入者の名前（一覧は誰でも読めるので API キーは渡さない）
+        """
+        if job_type not in self.handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        job_id = secrets.token_hex(8)
+        params = params or {}
+        with self.get_db() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, type, status, params, submitted_by, created) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, job_type, json.dumps(params), submitted_by, datetime.datetime.now().isoformat())
+            )
+        with self._lock:
+            self._pending.append(Job(self, job_id, job_type, params))
+        self._dispatch()
+        return job_id
+
+    def depth(self) -> dict:
+        """
+        待機中・実行中のジョブ数
+        """
+        with self._lock:
+            return {"pending": len(self._pending), "running": len(self._running)}
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        待機中のジョブは取り消し、実行中のジョブには中断を要求する
+        """
+        with self._lock:
+            for job in self._pending:
+                if job.id == job_id:
+                    self._pending.remove(job)
+                    self._finish(job, "cancelled", error="Cancelled before start")
+                    return True
+            job = self._running.get(job_id)
+            if job is not None:
+                job.cancel_requested = True
+                return True
+        return False
+
+    def _dispatch(self):
+        with self._lock:
+            for job in list(self._pending):
+                if len(self._running) >= self.workers:
+                    break
+                _, group = self.handlers[job.type]
+                if self._group_running.get(group, 0) >= self.group_limits[group]:
+                    continue
+                self._pending.remove(job)
+                self._running[job.id] = job
+                self._group_running[group] = self._group_running.get(group, 0) + 1
+                self._executor.submit(self._run, job)
+
+    def _run(self, job: Job):
+        handler, group = self.handlers[job.type]
+        job.started = time.monotonic()
+        with self.get_db() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started = ? WHERE id = ?",
+                (datetime.datetime.now().isoformat(), job.id)
+            )
+        try:
+            result = handler(job)
+            self._finish(job, "succeeded", result=result)
+        except JobCancelled:
+            self._finish(job, "cancelled", error="Cancelled")
+        except Exception as e:
+            print(f"Job {job.id} ({job.type}) failed: {e}")
+            self._finish(job, "failed", error=str(e) or e.__class__.__name__)
+        finally:
+            with self._lock:
+                self._running.pop(job.id, None)
+                self._group_running[group] -= 1
+            self._dispatch()
+
+    def _save_progress(self, job: Job):
+        with self.get_db() as conn:
+            conn.execute(
+                "UPDATE jobs SET progress = ? WHERE id = ?",
+                (json.dumps(job.snapshot()), job.id)
+            )
+
+    def _finish(self, job: Job, status: str, result=None, error: str = None):
+        with self.get_db() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, progress = ?, result = ?, error = ?, finished = ? WHERE id = ?",
+                (
+                    status,
+                    json.dumps(job.snapshot()),
+                    json.dumps(result) if result is not None else None,
+                    error,
+                    datetime.datetime.now().isoformat(),
+                    job.id
+                )
+            )
+
+    def get(self, job_id: str):
+        with self.get_db() as conn:
+            row = conn.execute("""
+                SELECT id, type, status, params, progress, result, error, submitted_by, created, started, finished
+                FROM jobs WHERE id = ?
+            """, (job_id,)).fetchone()
+        if not row:
+            return None
+        job = self._row_to_dict(row)
+        running = self._running.get(job_id)
+        if running is not None:
+            # 実行中は DB より新しいメモリ上の進捗を返す
+            job["progress"] = running.snapshot()
+        return job
+
+    def list(self, status: str = None, limit: int = 50, submitted_by: str = None) -> list:
+        query = """
+            SELECT id, type, status, params, progress, result, error, submitted_by, created, started, finished
+            FROM jobs
+        """
+        conditions, params = [], []
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if submitted_by is not None:
+            conditions.append("submitted_by = ?")
+            params.append(submitted_by)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY created DESC LIMIT ?"
+        params.append(limit)
+        with self.get_db() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    @staticmethod
+    def _row_to_dict(row) -> dict:
+        job_id, job_type, status, params, progress, result, error, by, created, started, finished = row
+        return {
+            "id": job_id,
+            "type": job_type,
+            "status": status,
+            "params": json.loads(params) if params else {},
+            "progress": json.loads(progress) if progress else None,
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "submitted_by": by,
+            "created": created,
+            "started": started,
+            "finished": finished,
+        }
@@ -0,0 +1,132 @@
+"""
+API キー検証結果のキャッシュ
+
+キーの SHA-256 をキーにして (role, player_name) を TTL 付きで保持する。
+存在しないキーも短い TTL で覚えておき、不正なキーの連打で DB を叩かせない。
+
+キーを追加・削除したプロセスではコミット後に該当エントリを捨てる。他のワーカープロセスには
+api_key_generation テーブルの世代番号で伝え、各プロセスは check_interval 秒に
+1 回だけ世代を確認して、変わっていればキャッシュを捨てる。
+"""
+import collections
+import hashlib
+import threading
+import time
+
+
+class ApiKeyCache:
+    """
+    get_db:         sqlite3 接続を返す callable
+    ttl:            有効なキーを覚えておく秒数
+    negative_ttl:   存在しないキーを覚えておく秒数
+    check_interval: 他プロセスでの変更を確認する間隔（秒）
+    max_entries:    保持する最大件数（古いものから捨てる）
+    """
+
+    def __init__(self, get_db, ttl: float = 60, negative_ttl: float = 10,
+                 check_interval: float = 1.0, max_entries: int = 10000):
+        self.get_db = get_db
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.check_interval = check_interval
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = None
+        self._checked = 0.0
+        # evict のたびに進める。DB を読んでいる間に捨てられたら結果を覚えない
+        self._epoch = 0
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    def init_schema(self, conn):
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS api_key_generation (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            generation INTEGER NOT NULL
+        )
+        """)
+        conn.execute("INSERT OR IGNORE INTO api_key_generation VALUES (1, 0)")
+
+    @staticmethod
+    def _digest(key: str) -> bytes:
+        return hashlib.sha256(key.encode()).digest()
+
+    def _check_generation(self, now: float):
+        """
+        他プロセスがキーを変更していればキャッシュを捨てる
+        """
+        if now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        with self.get_db() as conn:
+            row = conn.execute("SELECT generation FROM api_key_generation WHERE id = 1").fetchone()
+        generation = row[0] if row else 0
+        with self._lock:
+            if self._generation is not None and generation != self._generation:
+                self._entries.clear()
+                self.stats["invalidations"] += 1
+            self._generation = generation
+
+    def lookup(self, key: str):
+        """
+        (role, player_name) を返す。存在しないキーなら None
+        """
+        now = time.monotonic()
+        self._check_generation(now)
+        digest = self._digest(key)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and entry[0] > now:
+                if entry[1] is None:
+                    self.stats["negative_hits"] += 1
+                else:
+                    self.stats["hits"] += 1
+                return entry[1]
+            self.stats["misses"] += 1
+            epoch = self._epoch
+
+        with self.get_db() as conn:
+            row = conn.execute(
+                "SELECT role, player_name FROM api_keys WHERE key = ?", (key,)
+            ).fetchone()
+
+        with self._lock:
+            if epoch != self._epoch:
+                return row
+            self._entries[digest] = (now + (self.ttl if row else self.negative_ttl), row)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+        return row
+
+    def invalidate(self, conn, key: str = None):
+        """
+        キーの追加・削除と同じトランザクション内で呼ぶ。世代を進めて他プロセスに知らせる
+
+        コミット前に読まれた古い結果が覚え直されるので、コミット後に evict も呼ぶ。
+        """
+        conn.execute("UPDATE api_key_generation SET generation = generation + 1 WHERE id = 1")
+        self.evict(key)
+        with self._lock:
+            self.stats["invalidations"] += 1
+
+    def evict(self, key: str = None):
+        """
+        このプロセスのキャッシュからキー（None なら全部）を捨てる
+        """
+        with self._lock:
+            self._epoch += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(self._digest(key), None)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["negative_hits"] + self.stats["misses"]
+            return dict(
+                self.stats,
+                entries=len(self._entries),
+                hit_ratio=round((lookups - self.stats["misses"]) / lookups, 4) if lookups else None,
+            )
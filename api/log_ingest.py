@@ -0,0 +1,502 @@
+"""
+サーバーログからのイベント取り込み
+
+latest.log を前回の続きから読み、参加・退出・チャット・死亡・進捗の行を
+player_activity / player_stats / chat_logs / player_events に書き込む。
+読み取り位置（inode とバイトオフセット）は書き込みと同じトランザクションで
+保存するので、再起動しても同じ行を二重に取り込んだり読み飛ばしたりしない。
+コミットに失敗したときはメモリ上の状態（日付・UUID・セッション）も取り込み前に戻す。
+
+UUID は "UUID of player" の行と resolve_uuids から引く。どちらでも分からない名前の行は
+player_uuid を UNRESOLVED（空文字）にして player_stats には数えず、後で UUID が
+分かったときに書き換える（オンラインモードのサーバーに偽の UUID を書かない）。
+"""
+import asyncio
+import datetime
+import gzip
+import hashlib
+import os
+import re
+import uuid
+
+import log_tail
+
+# "[12:34:56] [Server thread/INFO]: message"
+LINE_PATTERN = re.compile(r"^\[(\d\d:\d\d:\d\d)\] \[[^\]]*/(?:INFO|WARN)\]: (.*)$")
+UUID_PATTERN = re.compile(r"^UUID of player (\w{1,16}) is ([0-9a-fA-F-]{36})$")
+CHAT_PATTERN = re.compile(r"^(?:\[Not Secure\] )?<(\w{1,16})> (.*)$")
+JOIN_PATTERN = re.compile(r"^(\w{1,16}) joined the game$")
+LEAVE_PATTERN = re.compile(r"^(\w{1,16}) left the game$")
+ADVANCEMENT_PATTERN = re.compile(
+    r"^(\w{1,16}) has (?:made the advancement|completed the challenge|reached the goal) \[(.+)\]$"
+)
+# 死亡メッセージ（バニラの death.* 翻訳の先頭部分）。オンラインのプレイヤー名で始まる行だけ判定する
+DEATH_PATTERN = re.compile(
+    r"^(\w{1,16}) (?:was |were |died|drowned|blew up|burned to death|went up in flames|"
+    r"went off with a bang|hit the ground too hard|fell |starved to death|suffocated|"
+    r"withered away|froze to death|experienced kinetic energy|tried to swim in lava|"
+    r"walked into |discovered the floor was lava|didn't want to live|left the confines|"
+    r"is no longer)"
+)
+STOP_PATTERN = re.compile(r"^Stopping (?:the )?server$")
+
+# 時刻が前の行よりこれ以上戻ったら日付をまたいだとみなす
+DAY_ROLLOVER = datetime.timedelta(hours=1)
+# UUID が分からないプレイヤーの行の player_uuid
+UNRESOLVED = ""
+# UNRESOLVED の行を持つテーブル
+PLAYER_TABLES = ("chat_logs", "player_events", "player_activity")
+
+
+def offline_uuid(name: str) -> str:
+    """
+    オフラインモードのサーバーと同じ UUID（"OfflinePlayer:" + 名前 の MD5, version 3）
+    """
+    digest = bytearray(hashlib.md5(f"OfflinePlayer:{name}".encode()).digest())
+    digest[6] = (digest[6] & 0x0F) | 0x30
+    digest[8] = (digest[8] & 0x3F) | 0x80
+    return str(uuid.UUID(bytes=bytes(digest)))
+
+
+class LogIngester:
+    """
+    get_db:      sqlite3 接続を返す callable
+    path:        latest.log
+    log_dir:     ローテーション済みログ（*.log.gz）のあるディレクトリ
+    ingest_chat: False ならチャットはプラグインの /chat/log に任せる
+    on_events:   参加・退出・停止を [(種類, 時刻, 名前, UUID), ...] で受け取る callable（コミット後に呼ぶ）
+    resolve_uuids: [名前] -> {名前: UUID or None}（ネットワークを使わないもの。オフラインモードの
+                   UUID の計算もここで行う）。None なら "UUID of player" の行だけを使う。
+                   取り込みのトランザクションの外で呼ぶ（同じスレッドの接続を使ってコミットしてよい）
+    """
+
+    SOURCE = "latest.log"
+
+    def __init__(self, get_db, path: str, log_dir: str, ingest_chat: bool = True,
+                 read_bytes: int = log_tail.READ_LIMIT, on_events=None, resolve_uuids=None):
+        self.get_db = get_db
+        self.path = path
+        self.log_dir = log_dir
+        self.ingest_chat = ingest_chat
+        self.on_events = on_events
+        self.resolve_uuids = resolve_uuids
+        self.read_bytes = read_bytes
+        self.file_id = None
+        self.offset = 0
+        self.last_ts = None
+        self.uuids = {}
+        self.sessions = {}
+        # UNRESOLVED の行がある名前
+        self.unresolved = set()
+        self.stats = {"lines": 0, "events": 0, "batches": 0, "unresolved": 0, "rollbacks": 0}
+
+    # -----------------------------
+    # 状態
+    # -----------------------------
+    def init_schema(self, conn):
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS log_checkpoints (
+            source TEXT PRIMARY KEY,
+            file_id INTEGER,
+            offset INTEGER NOT NULL,
+            last_ts TEXT,
+            updated TEXT NOT NULL
+        )
+        """)
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS player_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            player_uuid TEXT NOT NULL,
+            player_name TEXT NOT NULL,
+            type TEXT NOT NULL,
+            detail TEXT
+        )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_player_events_player ON player_events(player_uuid, timestamp)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_activity_open ON player_activity(logout_time) WHERE logout_time IS NULL")
+
+    def load_state(self):
+        """
+        チェックポイント・既知の UUID・ログイン中のセッションを DB から復元する
+        """
+        with self.get_db() as conn:
+            self.init_schema(conn)
+            row = conn.execute(
+                "SELECT file_id, offset, last_ts FROM log_checkpoints WHERE source = ?", (self.SOURCE,)
+            ).fetchone()
+            if row:
+                self.file_id, self.offset = row[0], row[1]
+                self.last_ts = datetime.datetime.fromisoformat(row[2]) if row[2] else None
+            self.uuids = dict(conn.execute("SELECT player_name, player_uuid FROM player_stats"))
+            for activity_id, player_uuid, name, login in conn.execute(
+                "SELECT id, player_uuid, player_name, login_time FROM player_activity WHERE logout_time IS NULL"
+            ):
+                self.sessions[name] = (activity_id, player_uuid, datetime.datetime.fromisoformat(login))
+            self.unresolved = {
+                name for (name,) in conn.execute(" UNION ".join(
+                    f"SELECT player_name FROM {table} WHERE player_uuid = ''" for table in PLAYER_TABLES
+                ))
+            }
+
+    def _state(self):
+        return self.last_ts, dict(self.uuids), dict(self.sessions), set(self.unresolved)
+
+    def _restore(self, state):
+        self.last_ts, self.uuids, self.sessions, self.unresolved = state
+        self.stats["rollbacks"] += 1
+
+    def _learn(self, conn, name: str, player_uuid: str):
+        """
+        UUID が分かった: 以前 UNRESOLVED で書いた行を書き換え、その分を player_stats に足す
+        """
+        self.uuids[name] = player_uuid
+        session = self.sessions.get(name)
+        if session and session[1] == UNRESOLVED:
+            self.sessions[name] = (session[0], player_uuid, session[2])
+        if name not in self.unresolved:
+            return
+        # 書き換える前に数える（すでに UUID で書いた行は player_stats に入っている）
+        sessions, playtime, first_join, last_join = conn.execute("""
+            SELECT COUNT(*), COALESCE(SUM(session_duration), 0), MIN(login_time), MAX(login_time)
+            FROM player_activity WHERE player_uuid = '' AND player_name = ?
+        """, (name,)).fetchone()
+        (chats,) = conn.execute(
+            "SELECT COUNT(*) FROM chat_logs WHERE player_uuid = '' AND player_name = ?", (name,)
+        ).fetchone()
+        deaths, advancements = conn.execute("""
+            SELECT COALESCE(SUM(type = 'death'), 0), COALESCE(SUM(type = 'advancement'), 0)
+            FROM player_events WHERE player_uuid = '' AND player_name = ?
+        """, (name,)).fetchone()
+        for table in PLAYER_TABLES:
+            conn.execute(
+                f"UPDATE {table} SET player_uuid = ? WHERE player_uuid = '' AND player_name = ?",
+                (player_uuid, name)
+            )
+        if sessions or chats or deaths or advancements:
+            conn.execute("""
+                INSERT INTO player_stats (player_uuid, player_name, total_playtime, total_sessions,
+                                          first_join, last_join, chat_messages, deaths, advancements)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(player_uuid) DO UPDATE SET
+                    total_playtime = total_playtime + excluded.total_playtime,
+                    total_sessions = total_sessions + excluded.total_sessions,
+                    first_join = MIN(COALESCE(first_join, excluded.first_join), COALESCE(excluded.first_join, first_join)),
+                    last_join = MAX(COALESCE(last_join, excluded.last_join), COALESCE(excluded.last_join, last_join)),
+                    chat_messages = chat_messages + excluded.chat_messages,
+                    deaths = deaths + excluded.deaths,
+                    advancements = advancements + excluded.advancements
+            """, (player_uuid, name, playtime, sessions, first_join, last_join, chats, deaths, advancements))
+        self.unresolved.discard(name)
+
+    def _resolve(self, events: list) -> dict:
+        """
+        このバッチで UUID の分からない名前を resolve_uuids で引く（トランザクションの前に呼ぶ）
+        """
+        if self.resolve_uuids is None:
+            return {}
+        learned = {name for kind, _, name, _ in events if kind == "uuid"}
+        names = {
+            name for kind, _, name, _ in events
+            if kind in ("chat", "death", "advancement", "join")
+            and name not in self.uuids and name not in learned
+        }
+        return self.resolve_uuids(sorted(names)) if names else {}
+
+    def _uuid(self, conn, name: str, resolved: dict):
+        """
+        名前の UUID。分からなければ None（resolved は _resolve() の結果）
+        """
+        player_uuid = self.uuids.get(name)
+        if player_uuid is None:
+            player_uuid = resolved.get(name)
+            if player_uuid is not None:
+                self._learn(conn, name, player_uuid)
+        if player_uuid is None:
+            self.unresolved.add(name)
+            self.stats["unresolved"] += 1
+        return player_uuid
+
+    def _timestamp(self, clock: str, anchor: float) -> datetime.datetime:
+        """
+        ログの時刻（時分秒のみ）に日付を補う
+
+        直前の行の日付を引き継ぎ、時刻が大きく戻ったら翌日とする。最初の行は
+        ファイルの更新時刻より未来にならない日付にする。
+        """
+        h, m, s = int(clock[0:2]), int(clock[3:5]), int(clock[6:8])
+        if self.last_ts is None:
+            ref = datetime.datetime.fromtimestamp(anchor)
+            ts = ref.replace(hour=h, minute=m, second=s, microsecond=0)
+            if ts > ref + datetime.timedelta(minutes=1):
+                ts -= datetime.timedelta(days=1)
+        else:
+            ts = self.last_ts.replace(hour=h, minute=m, second=s, microsecond=0)
+            if ts < self.last_ts - DAY_ROLLOVER:
+                ts += datetime.timedelta(days=1)
+        self.last_ts = ts
+        return ts
+
+    # -----------------------------
+    # 解析と書き込み
+    # -----------------------------
+    def parse(self, lines, anchor: float) -> list:
+        """
+        行を (種類, 時刻, 名前, 詳細) のイベント列に変換する
+        """
+        events = []
+        line_match = LINE_PATTERN.match
+        # 同じ秒の行が続くことが多いので時刻の変換結果を使い回す
+        last_clock, ts = None, None
+        for line in lines:
+            m = line_match(line)
+            if m is None:
+                continue
+            msg = m.group(2)
+            head = msg[:1]
+            if head == "<" or head == "[":
+                if not self.ingest_chat:
+                    continue
+                c = CHAT_PATTERN.match(msg)
+                if c is None:
+                    continue
+                kind, name, detail = "chat", c.group(1), c.group(2)
+            elif msg.endswith(" joined the game"):
+                c = JOIN_PATTERN.match(msg)
+                if c is None:
+                    continue
+                kind, name, detail = "join", c.group(1), None
+            elif msg.endswith(" left the game"):
+                c = LEAVE_PATTERN.match(msg)
+                if c is None:
+                    continue
+                kind, name, detail = "leave", c.group(1), None
+            elif msg.startswith("UUID of player "):
+                c = UUID_PATTERN.match(msg)
+                if c is not None:
+                    # 時刻は使わない
+                    events.append(("uuid", None, c.group(1), c.group(2).lower()))
+                continue
+            elif " has " in msg and msg.endswith("]"):
+                c = ADVANCEMENT_PATTERN.match(msg)
+                if c is None:
+                    continue
+                kind, name, detail = "advancement", c.group(1), c.group(2)
+            elif msg.startswith("Stopping"):
+                if STOP_PATTERN.match(msg) is None:
+                    continue
+                kind, name, detail = "stop", None, None
+            else:
+                # 死亡メッセージはオンラインのプレイヤー名で始まる行だけを調べる
+                name = msg.split(" ", 1)[0]
+                if name not in self.sessions or DEATH_PATTERN.match(msg) is None:
+                    continue
+                kind, detail = "death", msg
+            clock = m.group(1)
+            if clock != last_clock:
+                last_clock, ts = clock, self._timestamp(clock, anchor)
+            events.append((kind, ts, name, detail))
+            if kind == "join":
+                # 同じバッチ内の死亡判定のため、セッションは先に仮登録する
+                self.sessions.setdefault(name, None)
+        return events
+
+    def _close_session(self, conn, name: str, ts: datetime.datetime):
+        session = self.sessions.pop(name, None)
+        if not session:
+            return
+        activity_id, player_uuid, login = session
+        duration = max(0, int((ts - login).total_seconds()))
+        conn.execute(
+            "UPDATE player_activity SET logout_time = ?, session_duration = ? WHERE id = ?",
+            (ts.isoformat(), duration, activity_id)
+        )
+        conn.execute(
+            "UPDATE player_stats SET total_playtime = total_playtime + ? WHERE player_uuid = ?",
+            (duration, player_uuid)
+        )
+
+    def apply(self, conn, events: list, resolved: dict = None):
+        """
+        イベントを 1 トランザクション内で書き込み、player_stats を差分で更新する
+        """
+        chats, player_events = [], []
+        counters = {}
+        resolved = resolved or {}
+
+        def count(player_uuid, name, column):
+            if player_uuid is None:
+                return
+            key = (player_uuid, name)
+            c = counters.setdefault(key, {"chat_messages": 0, "deaths": 0, "advancements": 0})
+            c[column] += 1
+
+        for kind, ts, name, detail in events:
+            if kind == "uuid":
+                self._learn(conn, name, detail)
+            elif kind == "chat":
+                player_uuid = self._uuid(conn, name, resolved)
+                chats.append((ts.isoformat(), player_uuid or UNRESOLVED, name, detail, None))
+                count(player_uuid, name, "chat_messages")
+            elif kind == "death" or kind == "advancement":
+                player_uuid = self._uuid(conn, name, resolved)
+                player_events.append((ts.isoformat(), player_uuid or UNRESOLVED, name, kind, detail))
+                count(player_uuid, name, "deaths" if kind == "death" else "advancements")
+            elif kind == "join":
+                self._close_session(conn, name, ts)
+                player_uuid = self._uuid(conn, name, resolved)
+                iso = ts.isoformat()
+                if player_uuid is None:
+                    cur = conn.execute(
+                        "INSERT INTO player_activity (player_uuid, player_name, login_time) VALUES (?, ?, ?)",
+                        (UNRESOLVED, name, iso)
+                    )
+                    self.sessions[name] = (cur.lastrowid, UNRESOLVED, ts)
+                    continue
+                conn.execute("""
+                    INSERT INTO player_stats (player_uuid, player_name, total_playtime, total_sessions, first_join, last_join)
+                    VALUES (?, ?, 0, 1, ?, ?)
+                    ON CONFLICT(player_uuid) DO UPDATE SET
+                        player_name = excluded.player_name,
+                        total_sessions = total_sessions + 1,
+                        last_join = excluded.last_join
+                """, (player_uuid, name, iso, iso))
+                cur = conn.execute(
+                    "INSERT INTO player_activity (player_uuid, player_name, login_time) VALUES (?, ?, ?)",
+                    (player_uuid, name, iso)
+                )
+                self.sessions[name] = (cur.lastrowid, player_uuid, ts)
+            elif kind == "leave":
+                self._close_session(conn, name, ts)
+            elif kind == "stop":
+                for online in list(self.sessions):
+                    self._close_session(conn, online, ts)
+
+        if chats:
+            conn.executemany(
+                "INSERT INTO chat_logs (timestamp, player_uuid, player_name, message, world) VALUES (?, ?, ?, ?, ?)",
+                chats
+            )
+        if player_events:
+            conn.executemany(
+                "INSERT INTO player_events (timestamp, player_uuid, player_name, type, detail) VALUES (?, ?, ?, ?, ?)",
+                player_events
+            )
+        if counters:
+            conn.executemany("""
+                INSERT INTO player_stats (player_uuid, player_name, chat_messages, deaths, advancements)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(player_uuid) DO UPDATE SET
+                    chat_messages = chat_messages + excluded.chat_messages,
+                    deaths = deaths + excluded.deaths,
+                    advancements = advancements + excluded.advancements
+            """, [
+                (player_uuid, name, c["chat_messages"], c["deaths"], c["advancements"])
+                for (player_uuid, name), c in counters.items()
+            ])
+
+    def _commit(self, lines: list, anchor: float, file_id, offset: int):
+        # 失敗したら同じ行を読み直すので、状態も取り込み前に戻す
+        state = self._state()
+        try:
+            events = self.parse(lines, anchor)
+            # resolve_uuids は同じスレッドの接続で自分のトランザクションをコミットするので、
+            # 取り込みのトランザクションを始める前に済ませる（途中までの行がコミットされないように）
+            resolved = self._resolve(events)
+            with self.get_db() as conn:
+                self.apply(conn, events, resolved)
+                conn.execute("""
+                    INSERT OR REPLACE INTO log_checkpoints (source, file_id, offset, last_ts, updated)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (
+                    self.SOURCE, file_id, offset,
+                    self.last_ts.isoformat() if self.last_ts else None,
+                    datetime.datetime.now().isoformat()
+                ))
+        except BaseException:
+            self._restore(state)
+            raise
+        self.file_id, self.offset = file_id, offset
+        self.stats["lines"] += len(lines)
+        self.stats["events"] += len(events)
+        self.stats["batches"] += 1
+        if self.on_events is not None:
+            presence = [
+                (kind, ts, name, self.uuids.get(name))
+                for kind, ts, name, _ in events if kind in ("join", "leave", "stop")
+            ]
+            if presence:
+                self.on_events(presence)
+
+    def _recover_rotated(self):
+        """
+        停止中にローテーションされた場合、最新の .log.gz から前回の続きを取り込む
+        """
+        archives = log_tail.list_archives(self.log_dir)
+        if not archives or self.offset == 0:
+            return
+        path = os.path.join(self.log_dir, archives[0]["name"])
+        with gzip.open(path, "rb") as f:
+            skipped = 0
+            while skipped < self.offset:
+                data = f.read(min(self.read_bytes, self.offset - skipped))
+                if not data:
+                    return  # 別のファイル
+                skipped += len(data)
+            lines = f.read().decode("utf-8", errors="replace").splitlines()
+        self._commit(lines, archives[0]["modified"], self.file_id, self.offset)
+
+    def step(self) -> int:
+        """
+        読める分をすべて取り込み、取り込んだ行数を返す（スレッドから呼ぶ）
+        """
+        total = 0
+        while True:
+            chunk = log_tail.read_from(self.path, self.file_id, self.offset, self.read_bytes)
+            if chunk["file_id"] is None:
+                return total
+            if chunk["reset"]:
+                if chunk["file_id"] != self.file_id:
+                    self._recover_rotated()
+                # サーバーが再起動した: 開いたままのセッションを閉じる
+                if self.sessions and self.last_ts is not None:
+                    state = self._state()
+                    try:
+                        with self.get_db() as conn:
+                            for name in list(self.sessions):
+                                self._close_session(conn, name, self.last_ts)
+                    except BaseException:
+                        self._restore(state)
+                        raise
+                    if self.on_events is not None:
+                        self.on_events([("stop", self.last_ts, None, None)])
+                self.last_ts = None
+            if chunk["lines"] or chunk["reset"] or chunk["file_id"] != self.file_id:
+                self._commit(chunk["lines"], chunk["modified"], chunk["file_id"], chunk["offset"])
+                total += len(chunk["lines"])
+            if not chunk["more"]:
+                return total
+
+    async def run(self, follower, flush_interval: float = 0.5):
+        """
+        follower の通知で起き、flush_interval ごとにまとめて取り込む（キャンセルで終了）
+
+        先に load_state() を呼んでおくこと。
+        """
+        queue = follower.subscribe()
+        try:
+            while True:
+                try:
+                    await asyncio.to_thread(self.step)
+                except Exception as e:
+                    print(f"Log ingestion error: {e}")
+                try:
+                    await asyncio.wait_for(queue.get(), 5)
+                except asyncio.TimeoutError:
+                    continue
+                # 通知は起床のためだけに使い、行はファイルから読む
+                while not queue.empty():
+                    queue.get_nowait()
+                await asyncio.sleep(flush_interval)
+        finally:
+            follower.unsubscribe(queue)
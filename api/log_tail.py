@@ -0,0 +1,351 @@
+"""
+サーバーログの差分読み出しと追従
+
+カーソルは "<inode>:<byte offset>"。inode が変わっていればローテーション、
+ファイルが offset より短ければ切り詰めとみなして先頭から読み直す。
+追従は logs ディレクトリを inotify で監視し（使えなければポーリング）、
+1 つの読み取りタスクが購読者全員に行を配る。
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import gzip
+import os
+import re
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# "[12:34:56] [Server thread/INFO]: ..." のレベル部分
+LEVEL_PATTERN = re.compile(r"^\[[^\]]*\] \[[^\]]*/(TRACE|DEBUG|INFO|WARN|ERROR|FATAL)\]")
+LEVELS = {"TRACE": 0, "DEBUG": 1, "INFO": 2, "WARN": 3, "ERROR": 4, "FATAL": 5}
+
+READ_LIMIT = 1024 * 1024
+
+# 切り詰め後にすぐ元の長さ以上まで書かれた場合に備え、先頭の内容でも同一性を見る
+HEAD_BYTES = 64
+
+# LogFollower の購読者の Queue があふれて行を捨てたことを示す印（行の代わりに入る）
+GAP = None
+
+
+def make_cursor(file_id: int, offset: int) -> str:
+    return f"{file_id}:{offset}"
+
+
+def parse_cursor(cursor: str):
+    """
+    カーソル文字列を (file_id, offset) に。数値だけならバイトオフセットとして扱う
+    """
+    file_id, _, offset = cursor.rpartition(":")
+    return (int(file_id) if file_id else None), int(offset)
+
+
+class LineFilter:
+    """
+    level: この重要度以上の行だけを通す（WARN なら WARN/ERROR/FATAL）
+    pattern: 正規表現（re.error は呼び出し側で扱う）
+    """
+
+    def __init__(self, level: str = None, pattern: str = None):
+        self.min_level = LEVELS[level.upper()] if level else None
+        self.regex = re.compile(pattern) if pattern else None
+        self._last_level = None
+
+    @property
+    def active(self) -> bool:
+        return self.min_level is not None or self.regex is not None
+
+    def match(self, line: str) -> bool:
+        if self.min_level is not None:
+            m = LEVEL_PATTERN.match(line)
+            # スタックトレースなどレベルのない行は直前の行に従う
+            if m:
+                self._last_level = LEVELS[m.group(1)]
+            if self._last_level is None or self._last_level < self.min_level:
+                return False
+        if self.regex is not None and not self.regex.search(line):
+            return False
+        return True
+
+
+def read_from(path: str, file_id: int = None, offset: int = 0, max_bytes: int = READ_LIMIT) -> dict:
+    """
+    path を offset から読み、完結した行だけを返す
+
+    file_id が現在のファイルと違う（ローテーション）か、ファイルが offset より
+    短い（切り詰め）場合は先頭から読む。
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return {"lines": [], "file_id": None, "offset": 0, "cursor": None, "reset": False, "more": False}
+    with f:
+        st = os.fstat(f.fileno())
+        reset = (file_id is not None and file_id != st.st_ino) or offset > st.st_size
+        if reset:
+            offset = 0
+        f.seek(offset)
+        data = f.read(max_bytes)
+    more = len(data) == max_bytes
+    end = data.rfind(b"\n") + 1
+    if end == 0 and more:
+        end = len(data)  # 改行のない巨大な行は途中で切る
+    data = data[:end]
+    offset += len(data)
+    return {
+        "lines": data.decode("utf-8", errors="replace").splitlines(),
+        "file_id": st.st_ino,
+        "offset": offset,
+        "cursor": make_cursor(st.st_ino, offset),
+        "reset": reset,
+        "more": more,
+        "modified": st.st_mtime,
+    }
+
+
+def tail(path: str, lines: int, block: int = 64 * 1024) -> dict:
+    """
+    末尾から lines 行を読む（ファイル全体は読まない）
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return {"lines": [], "file_id": None, "offset": 0, "cursor": None, "reset": False, "more": False}
+    with f:
+        st = os.fstat(f.fileno())
+        # 書き込み途中の最終行は含めない
+        pos, buf = st.st_size, b""
+        while pos > 0 and buf.count(b"\n") <= lines:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+    complete = buf[:buf.rfind(b"\n") + 1]
+    offset = pos + len(complete)
+    result = complete.decode("utf-8", errors="replace").splitlines()[-lines:] if lines else []
+    return {
+        "lines": result,
+        "file_id": st.st_ino,
+        "offset": offset,
+        "cursor": make_cursor(st.st_ino, offset),
+        "reset": False,
+        "more": False,
+    }
+
+
+def list_archives(log_dir: str) -> list:
+    """
+    ローテーション済みの *.log.gz を新しい順に
+    """
+    try:
+        names = [n for n in os.listdir(log_dir) if n.endswith(".log.gz")]
+    except FileNotFoundError:
+        return []
+    archives = []
+    for name in names:
+        st = os.stat(os.path.join(log_dir, name))
+        archives.append({"name": name, "size": st.st_size, "modified": st.st_mtime})
+    archives.sort(key=lambda a: (a["modified"], a["name"]), reverse=True)
+    return archives
+
+
+def search_file(path: str, line_filter: LineFilter, limit: int):
+    """
+    ファイルを 1 行ずつ読み、一致した (行番号, 行) を返す。.gz は展開しながら読む
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.rstrip("\n")
+            if line_filter.match(line):
+                yield lineno, line
+                limit -= 1
+                if limit <= 0:
+                    return
+
+
+class _Inotify:
+    """
+    ディレクトリの変更を待つための最小限の inotify ラッパー
+    """
+
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed: {directory}")
+
+    def drain(self):
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        os.close(self.fd)
+
+
+class LogFollower:
+    """
+    latest.log を追従して新しい行を購読者の Queue に配る
+
+    Queue には (file_id, 行末オフセット, 行) が入る。ローテーション時は
+    古いファイルの残りを読み切ってから新しいファイルの先頭に移る。
+
+    購読者の Queue があふれたら中身を捨て、代わりに (file_id, offset, GAP) を 1 つ入れる。
+    file_id / offset はその時点の読み取り位置で、購読者は自分が処理した位置から
+    そこまでをファイルから読み直せる。
+    """
+
+    def __init__(self, path: str, poll_interval: float = 1.0, queue_size: int = 10000):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.file_id = None
+        self.offset = 0
+        self.dropped = 0
+        self.gaps = 0
+        self.inotify = False
+        self._file = None
+        self._partial = b""
+        self._head = b""
+        self._wakeup = None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(self.queue_size)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def _publish(self, lines: list):
+        for queue in list(self.subscribers):
+            for item in lines:
+                try:
+                    queue.put_nowait(item)
+                except asyncio.QueueFull:
+                    # 遅い購読者のために読み取りを止めない。黙って捨てずに、どこまで
+                    # 読み飛ばしたかを知らせる（この batch の残りも通知の位置に含まれる）
+                    while not queue.empty():
+                        queue.get_nowait()
+                        self.dropped += 1
+                    queue.put_nowait((self.file_id, self.offset, GAP))
+                    self.gaps += 1
+                    break
+
+    def _open(self, from_end: bool):
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        self._file = f
+        self.file_id = os.fstat(f.fileno()).st_ino
+        self.offset = f.seek(0, os.SEEK_END) if from_end else 0
+        self._partial = b""
+        self._head = b""
+
+    def _truncated(self) -> bool:
+        fd = self._file.fileno()
+        if os.fstat(fd).st_size < self.offset + len(self._partial):
+            return True
+        head = os.pread(fd, HEAD_BYTES, 0)
+        if not head.startswith(self._head):
+            return True
+        self._head = head
+        return False
+
+    def _read_available(self) -> list:
+        """
+        開いているファイルから読めるだけ読み、完結した行を返す
+        """
+        lines = []
+        while True:
+            data = self._file.read(READ_LIMIT)
+            if not data:
+                return lines
+            data = self._partial + data
+            end = data.rfind(b"\n") + 1
+            self._partial = data[end:]
+            pos = self.offset
+            for raw in data[:end].splitlines(keepends=True):
+                pos += len(raw)
+                lines.append((self.file_id, pos, raw.rstrip(b"\r\n").decode("utf-8", errors="replace")))
+            self.offset = pos
+
+    def poll(self) -> list:
+        """
+        ファイルの状態を確認して新しい行を返す（ローテーション・切り詰め対応）
+        """
+        if self._file is None:
+            self._open(from_end=False)
+            if self._file is None:
+                return []
+        lines = []
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        if self._truncated():
+            self._file.seek(0)
+            self.offset = 0
+            self._partial = b""
+            self._head = b""
+        lines += self._read_available()
+        if st is not None and st.st_ino != self.file_id:
+            # ローテーションされた: 古いファイルは読み切ったので新しいファイルへ
+            self._file.close()
+            self._file = None
+            self._open(from_end=False)
+            if self._file is not None:
+                lines += self._read_available()
+        return lines
+
+    async def run(self):
+        """
+        イベントループ上で追従し続ける（キャンセルで終了）
+        """
+        loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        watcher = None
+        self._open(from_end=True)
+        try:
+            while True:
+                if watcher is None:
+                    try:
+                        watcher = _Inotify(os.path.dirname(self.path))
+                        loop.add_reader(watcher.fd, self._wakeup.set)
+                        self.inotify = True
+                    except (OSError, AttributeError):
+                        watcher = None
+                        self.inotify = False
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                if watcher is not None:
+                    watcher.drain()
+                lines = self.poll()
+                if lines:
+                    self._publish(lines)
+        finally:
+            if watcher is not None:
+                loop.remove_reader(watcher.fd)
+                watcher.close()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
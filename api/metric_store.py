@@ -0,0 +1,360 @@
+"""
+パフォーマンスメトリクスの列指向ストア
+
+時刻は UNIX エポックのミリ秒（整数）。新しいサンプルはまず performance_head
+（1 サンプル 1 行）に入り、時間枠（既定 1 時間）が閉じたら seal() で
+performance_blocks の 1 行にまとめる。ブロックは列ごとに
+
+    差分（前の値との差）→ 値の範囲に合う最小の array 型 → zlib
+
+で符号化する。1 秒間隔のサンプルなら時刻の差分はほぼ一定なので 1 バイト型に
+収まり、よく圧縮される。読み出しは必要な列だけ展開し、
+itertools.accumulate で差分を戻す。
+
+小数の列（tps など）は 1/1000 単位の整数で保存する（小数点以下 3 桁まで）。
+値のない列（None）も扱える。列はブロックの末尾に追加していく（古いブロックには
+後から追加した列がないので None として読む）。
+"""
+import bisect
+import datetime
+import itertools
+import struct
+import time
+import zlib
+from array import array
+
+COLUMNS = (
+    "tps", "memory_used", "memory_total", "memory_percent", "entities", "chunks", "players",
+    # v4.6: 内蔵サンプラー（io_* はバイト/秒）
+    "mspt", "cpu_percent", "io_read", "io_write",
+)
+# 旧 performance_metrics にある列
+LEGACY_COLUMNS = COLUMNS[:7]
+# 小数の列は整数に直して保存する
+SCALE = {"tps": 1000, "memory_percent": 1000, "mspt": 1000, "cpu_percent": 1000}
+
+INSERT = f"""
+    INSERT INTO performance_head (ts, {", ".join(COLUMNS)})
+    VALUES (?, {", ".join("?" for _ in COLUMNS)})
+"""
+
+# 差分が収まる最小の型
+TYPECODES = [("b", 1 << 7), ("h", 1 << 15), ("i", 1 << 31), ("q", 1 << 63)]
+
+HEADER = struct.Struct("<BI")  # バージョン, サンプル数
+SEGMENT = struct.Struct("<cI")  # array の型, 圧縮後の長さ
+VERSION = 1
+# 列の前に置く None の位置のセグメントと、すべて None の列
+NULLS = b"N"
+ALL_NULL = b"n"
+
+
+def to_ms(value: datetime.datetime) -> int:
+    """
+    datetime（タイムゾーンなしはローカル時刻）をエポックミリ秒に
+    """
+    return int(round(value.timestamp() * 1000))
+
+
+def iso(ms: int) -> str:
+    """
+    エポックミリ秒をローカル時刻の ISO 8601 に（API の応答・ロールアップのバケット用）
+    """
+    return datetime.datetime.fromtimestamp(ms / 1000).isoformat()
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _encode_column(values: list) -> bytes:
+    nulls = [i for i, v in enumerate(values) if v is None]
+    if len(nulls) == len(values):
+        return SEGMENT.pack(ALL_NULL, 0)
+    prefix = b""
+    if nulls:
+        data = zlib.compress(array("I", nulls).tobytes(), 6)
+        prefix = SEGMENT.pack(NULLS, len(data)) + data
+        # None は直前の値で埋めて差分を 0 にする
+        filled, last = [], 0
+        for v in values:
+            last = last if v is None else v
+            filled.append(last)
+        values = filled
+    deltas = [b - a for a, b in zip(itertools.chain((0,), values), values)]
+    low, high = min(deltas), max(deltas)
+    for typecode, limit in TYPECODES:
+        if -limit <= low and high < limit:
+            break
+    data = zlib.compress(array(typecode, deltas).tobytes(), 6)
+    return prefix + SEGMENT.pack(typecode.encode(), len(data)) + data
+
+
+def encode_block(ts: list, columns: dict) -> bytes:
+    """
+    時刻順に並んだ ts と列ごとの値（SCALE 適用前）を 1 ブロックに
+    """
+    parts = [HEADER.pack(VERSION, len(ts)), _encode_column(ts)]
+    for name in COLUMNS:
+        scale = SCALE.get(name)
+        values = [
+            None if v is None else int(round(v * scale)) if scale else int(v)
+            for v in columns[name]
+        ]
+        parts.append(_encode_column(values))
+    return b"".join(parts)
+
+
+def decode_block(data: bytes, columns=COLUMNS) -> dict:
+    """
+    ブロックから ts と指定した列だけを展開する
+    """
+    version, count = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise ValueError(f"Unknown metric block version: {version}")
+    wanted = set(columns)
+    result = {}
+    pos = HEADER.size
+    for name in ("ts",) + COLUMNS:
+        if pos >= len(data):
+            # このブロックより後に追加された列
+            if name in wanted:
+                result[name] = [None] * count
+            continue
+        nulls = None
+        typecode, length = SEGMENT.unpack_from(data, pos)
+        pos += SEGMENT.size
+        if typecode == NULLS:
+            if name in wanted:
+                nulls = array("I")
+                nulls.frombytes(zlib.decompress(data[pos:pos + length]))
+            pos += length
+            typecode, length = SEGMENT.unpack_from(data, pos)
+            pos += SEGMENT.size
+        if typecode == ALL_NULL:
+            if name in wanted:
+                result[name] = [None] * count
+        elif name == "ts" or name in wanted:
+            deltas = array(typecode.decode())
+            deltas.frombytes(zlib.decompress(data[pos:pos + length]))
+            values = list(itertools.accumulate(deltas))
+            scale = SCALE.get(name)
+            if scale:
+                values = [v / scale for v in values]
+            if nulls:
+                for i in nulls:
+                    values[i] = None
+            result[name] = values
+        pos += length
+    if len(result["ts"]) != count:
+        raise ValueError("Corrupt metric block")
+    return result
+
+
+class MetricStore:
+    """
+    get_db:   sqlite3 接続を返す callable
+    block_ms: 1 ブロックの時間枠（ミリ秒、UTC で区切る）
+    grace_ms: 時間枠が閉じてから seal するまでの猶予（書き込みキューの遅れ分）
+    """
+
+    def __init__(self, get_db, block_ms: int = 3600 * 1000, grace_ms: int = 10 * 1000):
+        self.get_db = get_db
+        self.block_ms = block_ms
+        self.grace_ms = grace_ms
+        self.stats = {"sealed_blocks": 0, "sealed_rows": 0, "migrated_rows": 0, "last_seal_ms": None}
+
+    def init_schema(self, conn):
+        columns = ",\n".join(f"            {name} {self._type(name)}" for name in COLUMNS)
+        conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS performance_head (
+            ts INTEGER NOT NULL,
+{columns}
+        )
+        """)
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(performance_head)")}
+        for name in COLUMNS:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE performance_head ADD COLUMN {name} {self._type(name)}")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_perf_head_ts ON performance_head(ts)")
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS performance_blocks (
+            start INTEGER PRIMARY KEY,
+            last INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            data BLOB NOT NULL
+        )
+        """)
+
+    @staticmethod
+    def _type(name: str) -> str:
+        return "REAL" if name in SCALE else "INTEGER"
+
+    def migrate(self, conn) -> int:
+        """
+        旧 performance_metrics（ISO 文字列の時刻）を head に移して削除する
+
+        init_db のトランザクション内で呼ぶ。途中で失敗すれば旧テーブルは残る。
+        移した行は次の seal() でブロックになる。
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'performance_metrics'"
+        ).fetchone()
+        if not exists:
+            return 0
+        cur = conn.execute(f"SELECT timestamp, {', '.join(LEGACY_COLUMNS)} FROM performance_metrics ORDER BY id")
+        missing = (None,) * (len(COLUMNS) - len(LEGACY_COLUMNS))
+        migrated = 0
+        while True:
+            rows = cur.fetchmany(10000)
+            if not rows:
+                break
+            conn.executemany(INSERT, [
+                (to_ms(datetime.datetime.fromisoformat(row[0])), *row[1:], *missing)
+                for row in rows
+            ])
+            migrated += len(rows)
+        conn.execute("DROP TABLE performance_metrics")
+        self.stats["migrated_rows"] += migrated
+        print(f"Migrated {migrated} performance samples to the metric store")
+        return migrated
+
+    def seal(self, now: int = None) -> int:
+        """
+        閉じた時間枠の head の行をブロックにまとめる。書いたブロック数を返す
+
+        既にブロックがある時間枠に遅れて届いた行は、既存のブロックと合わせて作り直す。
+        """
+        started = time.perf_counter()
+        now = now_ms() if now is None else now
+        # これより前に始まる時間枠は閉じている
+        limit = (now - self.grace_ms) // self.block_ms * self.block_ms
+        written = 0
+        with self.get_db() as conn:
+            rows = conn.execute(f"""
+                SELECT ts, {", ".join(COLUMNS)} FROM performance_head
+                WHERE ts < ? ORDER BY ts
+            """, (limit,)).fetchall()
+            for start, group in itertools.groupby(rows, key=lambda row: row[0] // self.block_ms * self.block_ms):
+                group = list(group)
+                ts = [row[0] for row in group]
+                columns = {name: [row[i] for row in group] for i, name in enumerate(COLUMNS, 1)}
+                existing = conn.execute(
+                    "SELECT data FROM performance_blocks WHERE start = ?", (start,)
+                ).fetchone()
+                if existing:
+                    ts, columns = self._merge(decode_block(existing[0]), ts, columns)
+                conn.execute(
+                    "INSERT OR REPLACE INTO performance_blocks (start, last, count, data) VALUES (?, ?, ?, ?)",
+                    (start, ts[-1], len(ts), encode_block(ts, columns))
+                )
+                written += 1
+            conn.execute("DELETE FROM performance_head WHERE ts < ?", (limit,))
+        self.stats["sealed_blocks"] += written
+        self.stats["sealed_rows"] += len(rows)
+        self.stats["last_seal_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return written
+
+    @staticmethod
+    def _merge(block: dict, ts: list, columns: dict):
+        combined = block["ts"] + ts
+        order = sorted(range(len(combined)), key=combined.__getitem__)
+        merged_ts = [combined[i] for i in order]
+        merged = {}
+        for name in COLUMNS:
+            values = block[name] + columns[name]
+            merged[name] = [values[i] for i in order]
+        return merged_ts, merged
+
+    def range(self, start: int, end: int = None, columns=COLUMNS) -> dict:
+        """
+        start <= ts < end のサンプルを列ごとのリストで返す（{"ts": [...], 列名: [...]}、時刻順）
+        """
+        end = end if end is not None else now_ms() + self.block_ms
+        result = {name: [] for name in ("ts",) + tuple(columns)}
+        with self.get_db() as conn:
+            # ブロックと head を同じスナップショットで読む（途中で seal されても重複・欠落しない）
+            conn.execute("BEGIN")
+            blocks = conn.execute("""
+                SELECT data FROM performance_blocks
+                WHERE start > ? AND start < ? AND last >= ?
+                ORDER BY start
+            """, (start - self.block_ms, end, start)).fetchall()
+            head = conn.execute(f"""
+                SELECT ts, {", ".join(columns)} FROM performance_head
+                WHERE ts >= ? AND ts < ? ORDER BY ts
+            """, (start, end)).fetchall()
+        for (data,) in blocks:
+            block = decode_block(data, columns)
+            lo = bisect.bisect_left(block["ts"], start)
+            hi = bisect.bisect_left(block["ts"], end)
+            for name in result:
+                result[name] += block[name][lo:hi] if lo or hi < len(block["ts"]) else block[name]
+        if head:
+            merge_needed = result["ts"] and head[0][0] < result["ts"][-1]
+            for i, name in enumerate(result):
+                result[name] += [row[i] for row in head]
+            if merge_needed:
+                # seal 前の遅れて届いた行がブロックより古い
+                order = sorted(range(len(result["ts"])), key=result["ts"].__getitem__)
+                result = {name: [values[i] for i in order] for name, values in result.items()}
+        return result
+
+    def count(self, start: int, limit: int = None) -> int:
+        """
+        start 以降のサンプル数（start をまたぐブロックは全体を数えるので概数）
+        """
+        with self.get_db() as conn:
+            blocks = conn.execute(
+                "SELECT COALESCE(SUM(count), 0) FROM performance_blocks WHERE start > ? AND last >= ?",
+                (start - self.block_ms, start)
+            ).fetchone()[0]
+            if limit is not None and blocks > limit:
+                return blocks
+            head = conn.execute(
+                "SELECT COUNT(*) FROM performance_head WHERE ts >= ?", (start,)
+            ).fetchone()[0]
+        return blocks + head
+
+    def first_ts(self, start: int = 0):
+        """
+        start 以降で最も古いサンプルの時刻
+        """
+        with self.get_db() as conn:
+            head = conn.execute("SELECT MIN(ts) FROM performance_head WHERE ts >= ?", (start,)).fetchone()[0]
+            row = conn.execute("""
+                SELECT start, data FROM performance_blocks
+                WHERE start > ? AND last >= ? ORDER BY start LIMIT 1
+            """, (start - self.block_ms, start)).fetchone()
+        if row:
+            ts = decode_block(row[1], ())["ts"]
+            first = ts[bisect.bisect_left(ts, start)]
+            head = first if head is None else min(head, first)
+        return head
+
+    def latest(self):
+        """
+        最新のサンプルを {"ts": ..., 列名: ...} で返す（なければ None）
+        """
+        with self.get_db() as conn:
+            conn.execute("BEGIN")
+            head = conn.execute(f"""
+                SELECT ts, {", ".join(COLUMNS)} FROM performance_head ORDER BY ts DESC LIMIT 1
+            """).fetchone()
+            block = conn.execute(
+                "SELECT last, data FROM performance_blocks ORDER BY start DESC LIMIT 1"
+            ).fetchone()
+        if block and (head is None or block[0] > head[0]):
+            decoded = decode_block(block[1])
+            return {name: values[-1] for name, values in decoded.items()}
+        if head:
+            return dict(zip(("ts",) + COLUMNS, head))
+        return None
+
+    def prune(self, before: int):
+        """
+        before より古いサンプルを削除する（before をまたぐブロックは残す）
+        """
+        with self.get_db() as conn:
+            conn.execute("DELETE FROM performance_blocks WHERE last < ?", (before,))
+            conn.execute("DELETE FROM performance_head WHERE ts < ?", (before,))
@@ -0,0 +1,320 @@
+"""
+NBT の読み取り: SNBT（data get entity の出力）とバイナリ NBT（playerdata/<uuid>.dat）
+
+どちらも同じ Python の値にする（compound は dict、list と配列は list、
+byte / short / int / long は int、float / double は float、文字列は str）。
+型の接尾辞（1b, 2.0f など）は JSON にそのまま出せるように落とす。
+
+select() は "Pos"、"Inventory[0].id"、"Inventory[*].id" の形のパスで値を取り出す。
+"""
+import array
+import gzip
+import io
+import re
+import struct
+import sys
+
+# -----------------------------
+# SNBT
+# -----------------------------
+# 空白 / 記号 / 引用符付き文字列 / それ以外の語（数値・真偽値・引用符なしの文字列）
+SNBT_TOKEN = re.compile(r"""
+    \s*(?:
+        ([{}\[\],:;])
+      | "((?:[^"\\]|\\.)*)"
+      | '((?:[^'\\]|\\.)*)'
+      | ([-+0-9A-Za-z_.]+)
+      | (\S)
+    )""", re.VERBOSE | re.DOTALL)
+# 整数（b / s / l の接尾辞）と小数（f / d の接尾辞）
+NUMBER = re.compile(r"([-+]?(?:0|[1-9][0-9]*))[bBsSlL]?\Z|([-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?)[fFdD]?\Z")
+ESCAPE = re.compile(r"\\(.)", re.DOTALL)
+ARRAY_TYPES = ("B", "I", "L")
+
+# 各入れ子の状態: キー待ち / 値待ち（list）/ 区切り待ち。compound で値待ちのときはキーの文字列
+_KEY, _VALUE, _SEP = object(), object(), object()
+
+
+class NBTError(ValueError):
+    pass
+
+
+def _bare(word: str):
+    """
+    引用符のない語を数値・真偽値・文字列に変換する
+    """
+    m = NUMBER.match(word)
+    if m:
+        return int(m.group(1)) if m.group(1) is not None else float(m.group(2))
+    if word == "true":
+        return True
+    if word == "false":
+        return False
+    return word
+
+
+def _unescape(text: str) -> str:
+    return ESCAPE.sub(r"\1", text) if "\\" in text else text
+
+
+def parse_snbt(text: str):
+    """
+    SNBT を Python の値にする
+
+    正規表現で字句を切り出し、再帰せずスタックで組み立てる（深い入れ子でも再帰上限に当たらない）。
+    """
+    # スタックの要素: [コンテナ, 状態]
+    stack = []
+    root = None
+    tokens = SNBT_TOKEN.finditer(text)
+    for m in tokens:
+        punct, dq, sq, word, junk = m.groups()
+        if junk is not None:
+            raise NBTError(f"Unexpected {junk!r} at {m.start(5)}")
+
+        if stack:
+            frame = stack[-1]
+            state = frame[1]
+            is_compound = isinstance(frame[0], dict)
+            closer = "}" if is_compound else "]"
+            if punct == closer and state is (_KEY if is_compound else _VALUE):
+                # 空の {} / [] と末尾のカンマ
+                state = _SEP
+            if state is _SEP:
+                if punct == ",":
+                    frame[1] = _KEY if is_compound else _VALUE
+                    continue
+                if punct != closer:
+                    raise NBTError(f"Expected ',' or closing bracket at {m.start(0)}")
+                stack.pop()
+                if not stack:
+                    _expect_end(tokens)
+                    return root
+                continue
+            if state is _KEY:
+                if punct is not None:
+                    raise NBTError(f"Expected a key at {m.start(0)}")
+                key = word if word is not None else _unescape(dq if dq is not None else sq)
+                colon = next(tokens, None)
+                if colon is None or colon.group(1) != ":":
+                    raise NBTError(f"Expected ':' after key {key!r}")
+                frame[1] = key
+                continue
+
+        # ここからは値
+        if punct == "{":
+            value = {}
+            child = _KEY
+        elif punct == "[":
+            value = []
+            child = _VALUE
+            # [B; ...] / [I; ...] / [L; ...] の型付き配列
+            head = SNBT_TOKEN.match(text, m.end())
+            if head is not None and head.group(4) in ARRAY_TYPES:
+                semicolon = SNBT_TOKEN.match(text, head.end())
+                if semicolon is not None and semicolon.group(1) == ";":
+                    next(tokens)
+                    next(tokens)
+        elif punct is None:
+            value = _bare(word) if word is not None else _unescape(dq if dq is not None else sq)
+            child = None
+        else:
+            raise NBTError(f"Unexpected {punct!r} at {m.start(0)}")
+
+        if stack:
+            frame = stack[-1]
+            if isinstance(frame[0], dict):
+                frame[0][frame[1]] = value
+            else:
+                frame[0].append(value)
+            frame[1] = _SEP
+        elif child is None:
+            _expect_end(tokens)
+            return value
+        else:
+            root = value
+        if child is not None:
+            stack.append([value, child])
+    raise NBTError("Unexpected end of SNBT")
+
+
+def _expect_end(tokens):
+    extra = next(tokens, None)
+    if extra is not None:
+        raise NBTError(f"Trailing data at {extra.start(0)}")
+
+
+def parse_entity_data(output: str):
+    """
+    "Steve has the following entity data: {...}" から値を取り出す。エンティティがなければ None
+    """
+    head, sep, body = output.partition(" data: ")
+    if not sep:
+        return None
+    return parse_snbt(body)
+
+
+# -----------------------------
+# バイナリ NBT
+# -----------------------------
+_STRUCTS = {1: struct.Struct(">b"), 2: struct.Struct(">h"), 3: struct.Struct(">i"),
+            4: struct.Struct(">q"), 5: struct.Struct(">f"), 6: struct.Struct(">d")}
+_ARRAYS = {7: "b", 11: "i", 12: "q"}
+_USHORT = struct.Struct(">H")
+_INT = struct.Struct(">i")
+_BIG_ENDIAN = sys.byteorder == "big"
+
+
+def _read(f, n: int) -> bytes:
+    data = f.read(n)
+    if len(data) != n:
+        raise NBTError("Unexpected end of NBT data")
+    return data
+
+
+def _string(f) -> str:
+    data = _read(f, _USHORT.unpack(_read(f, 2))[0])
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        # Java の修正 UTF-8（NUL は C0 80、BMP 外はサロゲートペア）
+        text = data.replace(b"\xc0\x80", b"\x00").decode("utf-8", "surrogatepass")
+        return text.encode("utf-16", "surrogatepass").decode("utf-16")
+
+
+def _array(f, typecode: str) -> list:
+    values = array.array(typecode)
+    values.frombytes(_read(f, _INT.unpack(_read(f, 4))[0] * values.itemsize))
+    if not _BIG_ENDIAN and values.itemsize > 1:
+        values.byteswap()
+    return values.tolist()
+
+
+def _payload(f, tag: int):
+    if tag in _STRUCTS:
+        s = _STRUCTS[tag]
+        return s.unpack(_read(f, s.size))[0]
+    if tag == 8:
+        return _string(f)
+    if tag in _ARRAYS:
+        return _array(f, _ARRAYS[tag])
+    raise NBTError(f"Unknown NBT tag {tag}")
+
+
+def read_nbt(f):
+    """
+    非圧縮のバイナリ NBT をファイルから順に読み、ルートの compound を返す
+
+    gzip.open() の戻り値をそのまま渡せば展開しながら読む。
+    """
+    tag = _read(f, 1)[0]
+    if tag != 10:
+        raise NBTError(f"Root tag must be a compound, got {tag}")
+    _string(f)
+    root = {}
+    # スタックの要素: (コンテナ, list なら要素の型 / compound なら None, list の残り要素数)
+    stack = [[root, None, 0]]
+    while stack:
+        frame = stack[-1]
+        container, item_tag, remaining = frame
+        if item_tag is None:
+            tag = _read(f, 1)[0]
+            if tag == 0:
+                stack.pop()
+                continue
+            key = _string(f)
+        else:
+            if remaining == 0:
+                stack.pop()
+                continue
+            frame[2] -= 1
+            tag = item_tag
+
+        if tag == 10:
+            value = {}
+            child = [value, None, 0]
+        elif tag == 9:
+            value = []
+            list_tag = _read(f, 1)[0]
+            count = _INT.unpack(_read(f, 4))[0]
+            child = [value, list_tag, count] if count > 0 else None
+            if list_tag == 0 and count > 0:
+                raise NBTError("List of TAG_End with elements")
+        else:
+            value = _payload(f, tag)
+            child = None
+
+        if item_tag is None:
+            container[key] = value
+        else:
+            container.append(value)
+        if child is not None:
+            stack.append(child)
+    return root
+
+
+def read_nbt_file(path: str) -> dict:
+    """
+    playerdata/<uuid>.dat などを読む（gzip でも非圧縮でもよい）
+
+    GzipFile.read() は呼ぶたびの手間が大きく、数バイトずつ読むと展開より遅い。
+    プレイヤーのファイルは小さいので、まとめて展開してからメモリ上で読む。
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:2] == b"\x1f\x8b":
+        data = gzip.decompress(data)
+    return read_nbt(io.BytesIO(data))
+
+
+# -----------------------------
+# パスで選ぶ
+# -----------------------------
+PATH_STEP = re.compile(r"\.?([^.\[\]]+)|\[(\*|-?\d+)\]")
+_MISSING = object()
+
+
+def parse_path(path: str) -> list:
+    steps, pos = [], 0
+    while pos < len(path):
+        m = PATH_STEP.match(path, pos)
+        if m is None or m.end() == pos:
+            raise NBTError(f"Invalid path: {path}")
+        if m.group(1) is not None:
+            steps.append(m.group(1))
+        else:
+            steps.append("*" if m.group(2) == "*" else int(m.group(2)))
+        pos = m.end()
+    if not steps:
+        raise NBTError("Empty path")
+    return steps
+
+
+def _walk(value, steps: list):
+    for i, step in enumerate(steps):
+        if step == "*":
+            if not isinstance(value, list):
+                return _MISSING
+            results = [_walk(item, steps[i + 1:]) for item in value]
+            return [r for r in results if r is not _MISSING]
+        if isinstance(step, int):
+            if not isinstance(value, list) or not -len(value) <= step < len(value):
+                return _MISSING
+            value = value[step]
+        else:
+            if not isinstance(value, dict) or step not in value:
+                return _MISSING
+            value = value[step]
+    return value
+
+
+def select(data, paths) -> dict:
+    """
+    パスごとの値（見つからないパスは含めない）
+    """
+    result = {}
+    for path in paths:
+        value = _walk(data, parse_path(path))
+        if value is not _MISSING:
+            result[path] = value
+    return result
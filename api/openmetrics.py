@@ -0,0 +1,199 @@
+"""
+OpenMetrics（Prometheus のテキスト形式）の最小限の実装
+
+Counter と Histogram は値を持ち、ホットパスから observe() / inc() する
+（ロック 1 回と bisect だけ）。その時点の値を読めばよいもの（キューの深さ・
+サーバーの TPS など）は add_collector() で登録した関数がスクレイプのたびに返す。
+
+ラベルの組み合わせが max_series を超えたら、それ以降は "other" にまとめる
+（/exec の任意コマンド名などで系列が増え続けないように）。
+
+RequestMetrics は HTTP リクエストのレイテンシを記録する ASGI ミドルウェア。
+"""
+import bisect
+import math
+import threading
+import time
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# 秒単位のレイテンシ用（1ms〜60s）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# SQLite の 1 文・コミット用（10µs〜1s）
+FAST_BUCKETS = (0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help: str, labelnames=(), max_series: int = 200):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series
+        self._series = {}
+        self._lock = threading.Lock()
+        self._other = tuple("other" for _ in self.labelnames)
+
+    def _key(self, labels: tuple) -> tuple:
+        # ロックの内側で呼ぶ
+        if labels not in self._series and len(self._series) >= self.max_series:
+            return self._other
+        return labels
+
+    def header(self) -> list:
+        return [f"# TYPE {self.name} {self.kind}", f"# HELP {self.name} {_escape(self.help)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        with self._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            series = sorted(self._series.items())
+        lines = self.header()
+        for labels, value in series:
+            lines.append(f"{self.name}_total{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS, max_series: int = 200):
+        super().__init__(name, help, labelnames, max_series)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, labels: tuple = ()):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            key = self._key(labels)
+            series = self._series.get(key)
+            if series is None:
+                # バケットごとの件数（累積しない。最後は +Inf）, 合計
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def render(self) -> list:
+        with self._lock:
+            series = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+        lines = self.header()
+        for labels, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_number(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, *args, **kwargs) -> Counter:
+        metric = Counter(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, func):
+        """
+        func() は (名前, "gauge" か "counter", 説明, ラベル名, [(ラベル値のタプル, 値), ...]) を返す
+        （値が None の系列は出さない）
+        """
+        self._collectors.append(func)
+        return func
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for collect in self._collectors:
+            try:
+                families = list(collect())
+            except Exception as e:
+                print(f"Metrics collector {collect.__name__} failed: {e}")
+                continue
+            for name, kind, help, labelnames, samples in families:
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"# HELP {name} {_escape(help)}")
+                suffix = "_total" if kind == "counter" else ""
+                for labels, value in samples:
+                    if value is not None:
+                        lines.append(f"{name}{suffix}{_labels(labelnames, labels)} {_number(value)}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+class RequestMetrics:
+    """
+    HTTP リクエストの件数とレイテンシを記録する ASGI ミドルウェア
+
+    レイテンシはレスポンスヘッダーを送るまで（SSE などのストリームの接続時間は含めない）。
+    ラベルの route はパスそのものではなくルートのパターン（"/backup/{filename}"）。
+    """
+
+    def __init__(self, app, duration: Histogram, requests: Counter):
+        self.app = app
+        self.duration = duration
+        self.requests = requests
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = None
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                self._record(scope, status, time.perf_counter() - start)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if status is None:
+                # 応答を返す前に例外で終わった
+                self._record(scope, 500, time.perf_counter() - start)
+
+    def _record(self, scope, status: int, elapsed: float):
+        route = scope.get("route")
+        path = getattr(route, "path", None) or "unmatched"
+        self.duration.observe(elapsed, (scope["method"], path))
+        self.requests.inc((scope["method"], path, str(status)))
@@ -0,0 +1,222 @@
+"""
+コンテナ / RCON 操作の非同期実行レイヤー
+
+操作を種類ごとのセマフォで同時実行数を制限し、タイムアウトと
+キャンセルを扱い、操作ごとのレイテンシを記録する。
+"""
+import asyncio
+import collections
+import os
+import threading
+import time
+
+
+class OperationTimeout(Exception):
+    pass
+
+
+class OperationStats:
+    """
+    操作 1 種類分のレイテンシ統計
+    """
+
+    def __init__(self, window: int = 512):
+        self.count = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = collections.deque(maxlen=window)
+
+    def record(self, elapsed: float, outcome: str):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.recent.append(elapsed)
+        if outcome == "error":
+            self.errors += 1
+        elif outcome == "timeout":
+            self.timeouts += 1
+        elif outcome == "cancelled":
+            self.cancelled += 1
+
+    def snapshot(self) -> dict:
+        recent = sorted(self.recent)
+
+        def pct(p):
+            if not recent:
+                return None
+            return round(recent[min(len(recent) - 1, int(len(recent) * p))] * 1000, 2)
+
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+            "avg_ms": round(self.total / self.count * 1000, 2) if self.count else None,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+
+class AsyncOps:
+    """
+    操作クラスごとの同時実行制限付き実行器
+
+    limits:   {"container": 2, "rcon": 8, ...} の形式
+    timeouts: 操作クラスごとの既定タイムアウト（秒）
+    observer: (op_class, name, 秒, outcome) -> None。操作が終わるたびに呼ばれる
+    """
+
+    def __init__(self, limits: dict, timeouts: dict = None, observer=None):
+        self.limits = dict(limits)
+        self.timeouts = dict(timeouts or {})
+        self.observer = observer
+        self._semaphores = {}
+        self._stats = collections.defaultdict(OperationStats)
+        self._inflight = collections.Counter()
+        self._lock = threading.Lock()
+        self.loop = None
+
+    def bind_loop(self, loop):
+        """
+        スレッドから call() するためのイベントループを登録
+        """
+        self.loop = loop
+
+    def _semaphore(self, op_class: str) -> asyncio.Semaphore:
+        sem = self._semaphores.get(op_class)
+        if sem is None:
+            sem = self._semaphores[op_class] = asyncio.Semaphore(self.limits.get(op_class, 4))
+        return sem
+
+    def _record(self, key: str, elapsed: float, outcome: str):
+        with self._lock:
+            self._stats[key].record(elapsed, outcome)
+
+    async def run(self, op_class: str, name: str, awaitable, timeout: float = None):
+        """
+        awaitable を op_class の枠内で実行する
+        """
+        if timeout is None:
+            timeout = self.timeouts.get(op_class)
+        key = f"{op_class}.{name}"
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            async with self._semaphore(op_class):
+                self._inflight[op_class] += 1
+                try:
+                    return await asyncio.wait_for(awaitable, timeout)
+                finally:
+                    self._inflight[op_class] -= 1
+        except asyncio.TimeoutError as e:
+            outcome = "timeout"
+            raise OperationTimeout(f"{key} timed out after {timeout}s") from e
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            if asyncio.iscoroutine(awaitable) and outcome != "ok":
+                awaitable.close()
+            self._finish(op_class, name, start, outcome)
+
+    def _finish(self, op_class: str, name: str, start: float, outcome: str):
+        elapsed = time.perf_counter() - start
+        self._record(f"{op_class}.{name}", elapsed, outcome)
+        if self.observer is not None:
+            self.observer(op_class, name, elapsed, outcome)
+
+    async def subprocess(self, op_class: str, args: list, timeout: float = None,
+                         name: str = None):
+        """
+        サブプロセスを実行して (returncode, stdout, stderr) を返す
+
+        タイムアウトやキャンセル時はプロセスを kill する。
+        """
+        async def _run():
+            proc = await asyncio.create_subprocess_exec(
+                *args,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                out, err = await proc.communicate()
+            except BaseException:
+                if proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+                raise
+            return (
+                proc.returncode,
+                out.decode("utf-8", errors="replace"),
+                err.decode("utf-8", errors="replace")
+            )
+
+        return await self.run(op_class, name or os.path.basename(args[0]), _run(), timeout)
+
+    async def to_thread(self, op_class: str, name: str, func, *args, timeout: float = None):
+        """
+        ブロッキング処理をスレッドで実行する
+
+        タイムアウトやキャンセル時は結果を待たずに戻るが、スレッドは止められないので
+        枠はスレッドが終わるまで返さない（返すと op_class の上限を超えてスレッドが溜まる）。
+        """
+        if timeout is None:
+            timeout = self.timeouts.get(op_class)
+        sem = self._semaphore(op_class)
+        start = time.perf_counter()
+        outcome = "ok"
+
+        def release(task):
+            self._inflight[op_class] -= 1
+            sem.release()
+            # 待つのをやめたスレッドの例外は誰も受け取らないのでここで読み捨てる
+            if not task.cancelled():
+                task.exception()
+
+        try:
+            await sem.acquire()
+            self._inflight[op_class] += 1
+            task = asyncio.ensure_future(asyncio.to_thread(func, *args))
+            task.add_done_callback(release)
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError as e:
+            outcome = "timeout"
+            raise OperationTimeout(f"{op_class}.{name} timed out after {timeout}s") from e
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            self._finish(op_class, name, start, outcome)
+
+    def call(self, coro, timeout: float = None):
+        """
+        スケジューラーなど別スレッドからコルーチンを実行して結果を待つ
+        """
+        if self.loop is None:
+            coro.close()
+            raise RuntimeError("Event loop is not bound")
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            operations = {key: s.snapshot() for key, s in sorted(self._stats.items())}
+        return {
+            "limits": self.limits,
+            "inflight": {k: v for k, v in self._inflight.items() if v},
+            "operations": operations,
+        }
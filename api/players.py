@@ -0,0 +1,349 @@
+"""
+オンラインプレイヤーのレジストリ
+
+ログ取り込み（LogIngester）の参加・退出・停止イベントで更新し、
+低頻度の `list uuids` で取りこぼしを補正する。/players などの読み取りは
+メモリ上の状態を返すだけで RCON を使わない。
+
+参加・退出は subscribe() したキューに {"type": "join" | "leave", ...} で届く。
+
+補正との競合: list を送った後に届いたログのイベントの方が新しいので、
+list の結果で消す・足すのはそれより前に更新されたプレイヤーだけにする。
+
+SnapshotCache は /players/{name} の NBT を短い時間だけ持つ。
+"""
+import asyncio
+import datetime
+import json
+import os
+import re
+import threading
+import time
+
+# "There are 2 of a max of 20 players online: Steve (069a79f4-...), Alex (...)"
+LIST_ENTRY = re.compile(r"(\w{1,16})(?: \(([0-9a-fA-F-]{36})\))?")
+COLOR_CODE = re.compile(r"§[0-9a-fk-orx]", re.IGNORECASE)
+
+
+def parse_list(output: str):
+    """
+    list / list uuids の出力を [(名前, UUID or None), ...] にする。list の出力でなければ None
+    """
+    output = COLOR_CODE.sub("", output or "")
+    if "players online" not in output:
+        return None
+    names = output.split(":", 1)[1].strip() if ":" in output else ""
+    players = []
+    for item in names.split(","):
+        m = LIST_ENTRY.match(item.strip())
+        if m:
+            players.append((m.group(1), m.group(2).lower() if m.group(2) else None))
+    return players
+
+
+class PlayerRegistry:
+    """
+    command:            async (cmd) -> 出力（補正用の RCON）
+    status:             () -> {"running": bool, ...}（コンテナの状態キャッシュ）
+    reconcile_interval: list で補正する間隔（秒）
+    """
+
+    def __init__(self, command, status, reconcile_interval: float = 300, queue_size: int = 256):
+        self.command = command
+        self.status = status
+        self.reconcile_interval = reconcile_interval
+        self.queue_size = queue_size
+        self._online = {}
+        # 名前 -> 最後に状態を変えた時刻（time.monotonic）。退出したプレイヤーも残す
+        self._updated = {}
+        self._lock = threading.Lock()
+        self._listeners = set()
+        self._loop = None
+        self.stats = {"events": 0, "reconciles": 0, "corrections": 0, "rcon_errors": 0, "dropped": 0}
+
+    def bind_loop(self, loop):
+        self._loop = loop
+
+    # -----------------------------
+    # 読み取り
+    # -----------------------------
+    def count(self) -> int:
+        return len(self._online)
+
+    def get(self, name: str):
+        """
+        オンラインなら {"name", "uuid", "joined", "source"} のコピー、いなければ None
+        """
+        with self._lock:
+            player = self._online.get(name)
+            return dict(player) if player is not None else None
+
+    def snapshot(self) -> list:
+        """
+        オンラインのプレイヤー（参加が古い順）とセッションの長さ（秒）
+        """
+        now = datetime.datetime.now()
+        with self._lock:
+            players = sorted(self._online.values(), key=lambda p: p["joined"])
+        return [
+            {
+                "name": p["name"],
+                "uuid": p["uuid"],
+                "joined_at": p["joined"].isoformat(),
+                "session_seconds": max(0, int((now - p["joined"]).total_seconds())),
+                "source": p["source"],
+            }
+            for p in players
+        ]
+
+    # -----------------------------
+    # 通知
+    # -----------------------------
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._listeners.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._listeners.discard(queue)
+
+    def _offer(self, change: dict):
+        for queue in list(self._listeners):
+            try:
+                queue.put_nowait(change)
+            except asyncio.QueueFull:
+                self.stats["dropped"] += 1
+
+    def _publish(self, changes: list):
+        if not changes or self._loop is None or not self._listeners:
+            return
+        for change in changes:
+            self._loop.call_soon_threadsafe(self._offer, change)
+
+    # -----------------------------
+    # 更新
+    # -----------------------------
+    def _join(self, name: str, uuid, joined: datetime.datetime, source: str):
+        # ロックの内側で呼ぶ
+        self._updated[name] = time.monotonic()
+        current = self._online.get(name)
+        if current is not None:
+            # list で先に見つけていた: ログの参加時刻で置き換える（通知済みなので送らない）
+            if source == "log":
+                current.update(joined=joined, source=source, uuid=uuid or current["uuid"])
+            return None
+        self._online[name] = {"name": name, "uuid": uuid, "joined": joined, "source": source}
+        return {"type": "join", "name": name, "uuid": uuid, "timestamp": joined.isoformat(),
+                "online": len(self._online)}
+
+    def _leave(self, name: str, ts: datetime.datetime):
+        # ロックの内側で呼ぶ
+        self._updated[name] = time.monotonic()
+        player = self._online.pop(name, None)
+        if player is None:
+            return None
+        return {"type": "leave", "name": name, "uuid": player["uuid"], "timestamp": ts.isoformat(),
+                "session_seconds": max(0, int((ts - player["joined"]).total_seconds())),
+                "online": len(self._online)}
+
+    def seed(self, sessions: dict):
+        """
+        起動時にログ取り込みのセッション（名前 -> (活動 ID, UUID, 参加時刻)）から復元する
+        """
+        with self._lock:
+            for name, session in sessions.items():
+                if session:
+                    self._join(name, session[1], session[2], "log")
+
+    def apply_events(self, events: list):
+        """
+        ログ取り込みのイベント [(種類, 時刻, 名前, UUID), ...] を反映する（スレッドから呼ばれる）
+        """
+        changes = []
+        with self._lock:
+            for kind, ts, name, uuid in events:
+                if kind == "join":
+                    changes.append(self._join(name, uuid, ts, "log"))
+                elif kind == "leave":
+                    changes.append(self._leave(name, ts))
+                elif kind == "stop":
+                    changes += [self._leave(online, ts) for online in list(self._online)]
+                else:
+                    continue
+                self.stats["events"] += 1
+        self._publish([c for c in changes if c])
+
+    def clear(self):
+        """
+        サーバーが止まった: 全員を退出させる
+        """
+        now = datetime.datetime.now()
+        with self._lock:
+            changes = [self._leave(name, now) for name in list(self._online)]
+        self._publish([c for c in changes if c])
+
+    async def reconcile(self) -> int:
+        """
+        list uuids の結果と突き合わせて直し、直した人数を返す
+        """
+        sent = time.monotonic()
+        output = await self.command("list uuids")
+        players = parse_list(output)
+        if players is None:
+            # list uuids がない古いサーバー
+            players = parse_list(await self.command("list"))
+            if players is None:
+                raise ValueError(f"Unexpected list output: {output[:100]}")
+        listed = dict(players)
+        now = datetime.datetime.now()
+        changes = []
+        with self._lock:
+            for name in list(self._online):
+                if name not in listed and self._updated.get(name, 0) < sent:
+                    changes.append(self._leave(name, now))
+            for name, uuid in listed.items():
+                if name not in self._online and self._updated.get(name, 0) < sent:
+                    changes.append(self._join(name, uuid, now, "list"))
+                elif name in self._online and uuid and not self._online[name]["uuid"]:
+                    self._online[name]["uuid"] = uuid
+            # 退出済みの古い記録は捨てる
+            for name in [n for n, t in self._updated.items() if n not in self._online and t < sent - 3600]:
+                del self._updated[name]
+        changes = [c for c in changes if c]
+        self.stats["reconciles"] += 1
+        self.stats["corrections"] += len(changes)
+        self._publish(changes)
+        return len(changes)
+
+    async def run(self, status_events: asyncio.Queue):
+        """
+        稼働中は reconcile_interval ごとに補正し、停止したら空にする（キャンセルで終了）
+        """
+        while True:
+            running = self.status().get("running")
+            if running:
+                try:
+                    corrected = await self.reconcile()
+                    if corrected:
+                        print(f"Player registry: corrected {corrected} player(s) from list")
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.stats["rcon_errors"] += 1
+                    print(f"Player registry: list failed: {e}")
+            else:
+                self.clear()
+            deadline = time.monotonic() + self.reconcile_interval
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    status = await asyncio.wait_for(status_events.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if status.get("running") != running:
+                    break
+
+
+class PlayerListFile:
+    """
+    whitelist.json / ops.json などを読む（更新時刻とサイズが変わるまで前回の内容を返す）
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._key = None
+        self._entries = []
+
+    def entries(self) -> list:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+        key = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if key != self._key:
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except ValueError:
+                # サーバーが書き込んでいる途中: 前回の内容を返し、次回読み直す
+                return self._entries
+            self._key = key
+        return self._entries
+
+    def save(self, entries: list):
+        """
+        一時ファイルに書いて rename で置き換える（サーバーが書きかけを読まないように）
+
+        所有者とパーミッションは元のファイルに合わせる（サーバーが後で書き込めるように）。
+        """
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entries, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            st = os.stat(self.path)
+            os.chmod(tmp, st.st_mode & 0o7777)
+            os.chown(tmp, st.st_uid, st.st_gid)
+        except FileNotFoundError:
+            pass
+        except PermissionError as e:
+            print(f"Could not keep the owner of {self.path}: {e}")
+        os.replace(tmp, self.path)
+        self._key = None
+
+
+class SnapshotCache:
+    """
+    プレイヤーごとの NBT スナップショットを ttl 秒だけ持つ
+
+    同じキーを取得中に来た要求は、その取得の完了を待って同じ結果を使う
+    （RCON やファイルの読み取りは 1 回だけ）。fetch が None を返したときは持たない。
+    """
+
+    def __init__(self, ttl: float = 5, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # キー -> (期限 time.monotonic, 取得時刻, 値)
+        self._entries = {}
+        self._pending = {}
+        self.stats = {"hits": 0, "misses": 0, "shared": 0}
+
+    async def get(self, key, fetch):
+        """
+        fetch: async () -> 値 or None
+        戻り値: (値, 取得時刻 datetime, キャッシュ・ほかの要求の結果を使ったか)
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.stats["hits"] += 1
+            return entry[2], entry[1], True
+        task = self._pending.get(key)
+        shared = task is not None
+        if shared:
+            self.stats["shared"] += 1
+        else:
+            self.stats["misses"] += 1
+            task = self._pending[key] = asyncio.ensure_future(fetch())
+            task.add_done_callback(lambda t: self._store(key, t))
+        # 待っている要求がキャンセルされても取得は続ける（ほかの要求が待っている）
+        value = await asyncio.shield(task)
+        entry = self._entries.get(key)
+        fetched_at = entry[1] if entry is not None else datetime.datetime.now()
+        return value, fetched_at, shared
+
+    def _store(self, key, task):
+        self._pending.pop(key, None)
+        if task.cancelled() or task.exception() is not None or task.result() is None:
+            return
+        now = time.monotonic()
+        if len(self._entries) >= self.max_entries:
+            for old in [k for k, e in self._entries.items() if e[0] <= now]:
+                del self._entries[old]
+            while len(self._entries) >= self.max_entries:
+                del self._entries[next(iter(self._entries))]
+        self._entries.pop(key, None)
+        self._entries[key] = (now + self.ttl, datetime.datetime.now(), task.result())
@@ -0,0 +1,299 @@
+"""
+プレイヤー名 ⇔ UUID の解決
+
+名前は次の順に探す（大文字・小文字は区別しない）。
+  1. usercache.json（サーバーが持つ名前と UUID の対応）
+  2. player_stats（このサーバーに入ったことのあるプレイヤー）
+  3. オフラインモードなら "OfflinePlayer:" + 名前 から計算
+  4. player_profiles（プロフィール API の結果の保存。ttl 秒まで使う）
+  5. プロフィール API（名前のリストを POST して [{"id", "name"}, ...] を受け取る。
+     Mojang の bulk API 互換で、batch_size 件ずつまとめて問い合わせる）
+
+1〜4 はネットワークを使わない。API で見つからなかった名前も negative_ttl 秒だけ
+保存する（存在しない名前で API を叩き続けないように）。API に届かないとき・
+429 で待たされているときは、期限切れの保存内容があればそれを使う。
+
+API の呼び出しは同期（urllib）で 1 本ずつしか行わないので、待ってよい呼び出し元
+（管理者の操作）だけが resolve(network=True) で結果を待つ。network=False では
+ローカルで分からない名前を None で返し、裏のスレッドで API に問い合わせておく
+（次の呼び出しでは 4 で見つかる）。
+"""
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid as uuid_module
+from concurrent.futures import ThreadPoolExecutor
+
+from log_ingest import offline_uuid
+
+PROFILE_TABLE = """
+    CREATE TABLE IF NOT EXISTS player_profiles (
+        name_lower TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        uuid TEXT,
+        resolved_at REAL NOT NULL
+    ) WITHOUT ROWID
+"""
+# 429 で Retry-After がないときに待つ秒数
+DEFAULT_BACKOFF = 60
+# 裏で問い合わせる名前の上限（これを超えた分は問い合わせない）
+MAX_DEFERRED = 1000
+
+
+class UuidResolver:
+    """
+    get_db:       sqlite3 接続を返す callable
+    usercache:    usercache.json の PlayerListFile
+    offline_mode: () -> bool（server.properties の online-mode=false）
+    api_url:      プロフィール API の URL（空なら使わない）
+    """
+
+    def __init__(self, get_db, usercache, offline_mode, api_url: str, batch_size: int = 10,
+                 ttl: float = 7 * 86400, negative_ttl: float = 3600, timeout: float = 5):
+        self.get_db = get_db
+        self.usercache = usercache
+        self.offline_mode = offline_mode
+        self.api_url = api_url
+        self.batch_size = max(1, batch_size)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        # API の呼び出しは 1 本ずつ（レート制限があるので並べない）
+        self._api_lock = threading.Lock()
+        self._blocked_until = 0.0
+        # (usercache.json の entries, 小文字の名前 -> (名前, UUID))
+        self._usercache = (None, {})
+        # 裏で問い合わせ中・待ちの名前（小文字）
+        self._deferred = set()
+        self._deferred_lock = threading.Lock()
+        self._executor = None
+        self.stats = {"usercache": 0, "known": 0, "offline": 0, "cached": 0, "api": 0,
+                      "not_found": 0, "api_requests": 0, "api_errors": 0, "stale": 0, "deferred": 0}
+
+    def init_schema(self, conn):
+        conn.execute(PROFILE_TABLE)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_profiles_uuid ON player_profiles(uuid)")
+
+    # -----------------------------
+    # ローカルの情報源
+    # -----------------------------
+    def _usercache_index(self) -> dict:
+        entries = self.usercache.entries()
+        if entries is not self._usercache[0]:
+            index = {}
+            for entry in entries:
+                if isinstance(entry, dict) and entry.get("name") and entry.get("uuid"):
+                    index[str(entry["name"]).lower()] = (entry["name"], str(entry["uuid"]).lower())
+            self._usercache = (entries, index)
+        return self._usercache[1]
+
+    @staticmethod
+    def _placeholders(items) -> str:
+        return ",".join("?" * len(items))
+
+    # -----------------------------
+    # 名前 -> UUID
+    # -----------------------------
+    def resolve(self, names: list, network: bool = True) -> dict:
+        """
+        名前 -> UUID（見つからなければ None）。キーは渡された名前のまま
+
+        network=False なら API の応答を待たない（分からない名前は裏で問い合わせる）。
+        """
+        wanted = {}
+        for name in names:
+            wanted.setdefault(name.lower(), name)
+        found = {}
+
+        index = self._usercache_index()
+        for key in list(wanted):
+            if key in index:
+                found[key] = index[key][1]
+                self.stats["usercache"] += 1
+        pending = [key for key in wanted if key not in found]
+
+        stale = {}
+        if pending:
+            with self.get_db() as conn:
+                known = conn.execute(f"""
+                    SELECT player_name, player_uuid FROM player_stats
+                    WHERE player_name COLLATE NOCASE IN ({self._placeholders(pending)})
+                """, pending).fetchall()
+                for name, player_uuid in known:
+                    found[name.lower()] = player_uuid
+                    self.stats["known"] += 1
+                pending = [key for key in pending if key not in found]
+
+                if pending and self.offline_mode():
+                    # 名前の表記どおりに計算する（オフラインモードのサーバーと同じ）
+                    for key in pending:
+                        found[key] = offline_uuid(wanted[key])
+                    self.stats["offline"] += len(pending)
+                    pending = []
+
+                if pending:
+                    now = time.time()
+                    for key, player_uuid, resolved_at in conn.execute(f"""
+                        SELECT name_lower, uuid, resolved_at FROM player_profiles
+                        WHERE name_lower IN ({self._placeholders(pending)})
+                    """, pending):
+                        ttl = self.ttl if player_uuid else self.negative_ttl
+                        if resolved_at + ttl > now:
+                            found[key] = player_uuid
+                            self.stats["cached"] += 1
+                        else:
+                            stale[key] = player_uuid
+                    pending = [key for key in pending if key not in found]
+
+        if pending:
+            if network:
+                fetched = self._lookup([wanted[key] for key in pending])
+            else:
+                fetched = {}
+                self.resolve_later([wanted[key] for key in pending])
+            for key in pending:
+                if key in fetched:
+                    found[key] = fetched[key]
+                elif key in stale:
+                    found[key] = stale[key]
+                    self.stats["stale"] += 1
+
+        return {name: found.get(key) for key, name in wanted.items()}
+
+    def resolve_one(self, name: str, network: bool = True):
+        return self.resolve([name], network)[name]
+
+    def resolve_later(self, names: list) -> list:
+        """
+        裏のスレッドで API に問い合わせて保存する。受け付けた名前を返す
+        """
+        if not self.api_url:
+            return []
+        with self._deferred_lock:
+            accepted = []
+            for name in names:
+                key = name.lower()
+                if key in self._deferred or len(self._deferred) >= MAX_DEFERRED:
+                    continue
+                self._deferred.add(key)
+                accepted.append(name)
+            if not accepted:
+                return []
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(1, thread_name_prefix="profiles")
+            self.stats["deferred"] += len(accepted)
+        self._executor.submit(self._lookup_deferred, accepted)
+        return accepted
+
+    def _lookup_deferred(self, names: list):
+        try:
+            self._lookup(names)
+        except Exception as e:
+            print(f"Profile lookup failed: {e}")
+        finally:
+            with self._deferred_lock:
+                self._deferred.difference_update(name.lower() for name in names)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _lookup(self, names: list) -> dict:
+        """
+        プロフィール API で調べて保存する。戻り値は小文字の名前 -> UUID or None（調べられなかった名前は含めない）
+        """
+        if not self.api_url:
+            return {}
+        # (小文字の名前, 名前, UUID or None)
+        rows = []
+        results = {}
+        with self._api_lock:
+            # 待っている間にほかのスレッドが調べた名前は問い合わせない
+            with self.get_db() as conn:
+                for key, player_uuid in conn.execute(f"""
+                    SELECT name_lower, uuid FROM player_profiles
+                    WHERE name_lower IN ({self._placeholders(names)}) AND resolved_at > ?
+                """, [name.lower() for name in names] + [time.time() - self.negative_ttl]):
+                    results[key] = player_uuid
+            names = [name for name in names if name.lower() not in results]
+            for start in range(0, len(names), self.batch_size):
+                batch = names[start:start + self.batch_size]
+                if time.monotonic() < self._blocked_until:
+                    break
+                try:
+                    profiles = self._fetch(batch)
+                except (OSError, ValueError) as e:
+                    # URLError / HTTPError / タイムアウト / 壊れた JSON
+                    self.stats["api_errors"] += 1
+                    print(f"Profile lookup failed: {e}")
+                    break
+                for name in batch:
+                    name, player_uuid = profiles.get(name.lower(), (name, None))
+                    rows.append((name.lower(), name, player_uuid))
+        if not rows:
+            return results
+        now = time.time()
+        with self.get_db() as conn:
+            conn.executemany("""
+                INSERT INTO player_profiles (name_lower, name, uuid, resolved_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (name_lower) DO UPDATE SET
+                    name = excluded.name, uuid = excluded.uuid, resolved_at = excluded.resolved_at
+            """, [(*row, now) for row in rows])
+        found = sum(1 for row in rows if row[2])
+        self.stats["api"] += found
+        self.stats["not_found"] += len(rows) - found
+        results.update((key, player_uuid) for key, _, player_uuid in rows)
+        return results
+
+    def _fetch(self, batch: list) -> dict:
+        """
+        小文字の名前 -> (API の表記の名前, UUID)
+        """
+        self.stats["api_requests"] += 1
+        request = urllib.request.Request(
+            self.api_url,
+            data=json.dumps(batch).encode("utf-8"),
+            headers={"Content-Type": "application/json", "Accept": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = response.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 429:
+                retry_after = e.headers.get("Retry-After", "")
+                wait = int(retry_after) if retry_after.isdigit() else DEFAULT_BACKOFF
+                self._blocked_until = time.monotonic() + wait
+            raise
+        profiles = json.loads(body) if body.strip() else []
+        return {
+            str(profile["name"]).lower(): (str(profile["name"]), str(uuid_module.UUID(profile["id"])))
+            for profile in profiles
+            if isinstance(profile, dict) and profile.get("id") and profile.get("name")
+        }
+
+    # -----------------------------
+    # UUID -> 名前
+    # -----------------------------
+    def names(self, uuids: list) -> dict:
+        """
+        UUID -> 名前（ローカルの情報源だけを使う。見つからなければ None）
+        """
+        wanted = {str(u).lower(): u for u in uuids}
+        found = {}
+        for name, player_uuid in self._usercache_index().values():
+            if player_uuid in wanted:
+                found[player_uuid] = name
+        pending = [u for u in wanted if u not in found]
+        if pending:
+            with self.get_db() as conn:
+                for sql in ("SELECT player_uuid, player_name FROM player_stats WHERE player_uuid IN ({})",
+                            "SELECT uuid, name FROM player_profiles WHERE uuid IN ({})"):
+                    if not pending:
+                        break
+                    for player_uuid, name in conn.execute(sql.format(self._placeholders(pending)), pending):
+                        found.setdefault(player_uuid, name)
+                    pending = [u for u in pending if u not in found]
+        return {original: found.get(key) for key, original in wanted.items()}
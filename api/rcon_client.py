@@ -0,0 +1,299 @@
+"""
+Minecraft RCON クライアント（asyncio）
+
+docker exec rcon-cli を毎回起動する代わりに、RCON ポートへの
+認証済み TCP 接続をプールして使い回す。
+"""
+import asyncio
+import itertools
+import socket
+import struct
+from contextlib import asynccontextmanager
+
+SERVERDATA_AUTH = 3
+SERVERDATA_EXECCOMMAND = 2
+SERVERDATA_RESPONSE_VALUE = 0
+
+# Minecraft はこれより大きいコマンドを受け付けない
+MAX_COMMAND_BYTES = 1446
+# 応答は 4096 文字ごとに分割されて届く（UTF-8 なので最大 4 倍）
+RESPONSE_CHUNK_CHARS = 4096
+MAX_PACKET_BYTES = RESPONSE_CHUNK_CHARS * 4 + 10
+# pipeline() で応答を待たずに送るコマンド数（送りっぱなしで双方のバッファが詰まらないように）
+PIPELINE_WINDOW = 64
+# Linux のみ
+TCP_QUICKACK = getattr(socket, "TCP_QUICKACK", None)
+
+
+class RconError(Exception):
+    pass
+
+
+class RconAuthError(RconError):
+    pass
+
+
+def encode_packet(req_id: int, ptype: int, body: str) -> bytes:
+    payload = struct.pack("<ii", req_id, ptype) + body.encode("utf-8") + b"\x00\x00"
+    return struct.pack("<i", len(payload)) + payload
+
+
+def decode_payload(payload: bytes):
+    """
+    長さフィールドを除いたパケット本体を (id, type, body) に分解
+    """
+    if len(payload) < 10:
+        raise RconError("Malformed RCON packet")
+    req_id, ptype = struct.unpack_from("<ii", payload)
+    body = payload[8:-2].decode("utf-8", errors="replace")
+    return req_id, ptype, body
+
+
+class RconConnection:
+    """
+    認証済みの RCON 接続 1 本
+    """
+
+    def __init__(self, host: str, port: int, password: str, timeout: float = 5.0):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self._ids = itertools.count(1)
+        # 受信したパケット数と、プールから借りられた回数（再試行の判断に使う）
+        self.received = 0
+        self.borrowed = 0
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port),
+            self.timeout
+        )
+        sock = self.writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            auth_id = self._next_id()
+            self._send(auth_id, SERVERDATA_AUTH, self.password)
+            await asyncio.wait_for(self._auth_reply(auth_id), self.timeout)
+        except BaseException:
+            self.close()
+            raise
+
+    async def _auth_reply(self, auth_id: int):
+        # 実装によっては認証応答の前に空の RESPONSE_VALUE が届く
+        while True:
+            req_id, ptype, _ = await self._recv()
+            if req_id == -1:
+                raise RconAuthError("RCON authentication failed")
+            if req_id == auth_id and ptype == SERVERDATA_EXECCOMMAND:
+                return
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self.reader = None
+
+    def _next_id(self) -> int:
+        # int32 の範囲で循環させる（-1 は認証失敗に予約）
+        return next(self._ids) & 0x7FFFFFFF
+
+    def _send(self, req_id: int, ptype: int, body: str):
+        self.writer.write(encode_packet(req_id, ptype, body))
+
+    async def _recv(self):
+        try:
+            (length,) = struct.unpack("<i", await self.reader.readexactly(4))
+            if length < 10 or length > MAX_PACKET_BYTES:
+                raise RconError(f"Invalid RCON packet length: {length}")
+            packet = decode_payload(await self.reader.readexactly(length))
+            self.received += 1
+            return packet
+        except asyncio.IncompleteReadError as e:
+            raise RconError("RCON connection closed by server") from e
+
+    async def command(self, cmd: str) -> str:
+        """
+        コマンドを実行して応答を返す
+
+        応答が分割上限ちょうどの長さだった場合は続きがあり得るので、
+        番兵パケットを送り、その応答が返るまでの本文を連結する。
+        """
+        if len(cmd.encode("utf-8")) > MAX_COMMAND_BYTES:
+            raise RconError("Command too long for RCON")
+
+        cmd_id = self._next_id()
+        self._send(cmd_id, SERVERDATA_EXECCOMMAND, cmd)
+        await self.writer.drain()
+
+        body = await self._recv_for(cmd_id)
+        if len(body) < RESPONSE_CHUNK_CHARS:
+            return body
+
+        # Minecraft は同一接続のパケットを順番に処理するので、
+        # 番兵への応答より前に届いたものがすべて本文の続き
+        sentinel_id = self._next_id()
+        self._send(sentinel_id, SERVERDATA_RESPONSE_VALUE, "")
+        await self.writer.drain()
+        parts = [body]
+        while True:
+            req_id, _, body = await self._recv()
+            if req_id == cmd_id:
+                parts.append(body)
+            elif req_id == sentinel_id:
+                return "".join(parts)
+
+    async def pipeline(self, cmds: list, timeout: float) -> list:
+        """
+        複数のコマンドを応答を待たずに続けて送り、応答を順に返す
+
+        PIPELINE_WINDOW 件ごとに最後へ番兵パケットを付けて送り、番兵への応答が届くまでを
+        読む（Minecraft は同一接続のパケットを順番に処理する）。同じ ID のパケットが
+        続いたら分割された応答の続き。往復は件数ではなく window ごとに 1 回になる。
+        timeout は window ごと。
+        """
+        for cmd in cmds:
+            if len(cmd.encode("utf-8")) > MAX_COMMAND_BYTES:
+                raise RconError(f"Command too long for RCON: {cmd[:50]}")
+        outputs = []
+        for start in range(0, len(cmds), PIPELINE_WINDOW):
+            window = cmds[start:start + PIPELINE_WINDOW]
+            ids = [self._next_id() for _ in window]
+            for cmd_id, cmd in zip(ids, window):
+                self._send(cmd_id, SERVERDATA_EXECCOMMAND, cmd)
+            sentinel_id = self._next_id()
+            self._send(sentinel_id, SERVERDATA_RESPONSE_VALUE, "")
+            await self.writer.drain()
+            outputs += await asyncio.wait_for(self._recv_window(ids, sentinel_id), timeout)
+        return outputs
+
+    def _quickack(self):
+        # サーバー（Java の RCON は Nagle が有効）は前の応答の ACK が届くまで次の応答を
+        # 溜めるので、遅延 ACK（約 40ms）を待たせない
+        sock = self.writer.get_extra_info("socket") if self.writer is not None else None
+        if sock is not None and TCP_QUICKACK is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, TCP_QUICKACK, 1)
+
+    async def _recv_window(self, ids: list, sentinel_id: int) -> list:
+        parts = {cmd_id: [] for cmd_id in ids}
+        while True:
+            # 遅延 ACK に戻ることがあるので毎回立てる
+            self._quickack()
+            req_id, _, body = await self._recv()
+            if req_id == sentinel_id:
+                return ["".join(parts[cmd_id]) for cmd_id in ids]
+            if req_id in parts:
+                parts[req_id].append(body)
+
+    async def _recv_for(self, req_id: int) -> str:
+        while True:
+            got_id, _, body = await self._recv()
+            if got_id == req_id:
+                return body
+            # それ以外の ID は以前のコマンドの残骸なので読み捨てる
+
+
+class RconPool:
+    """
+    認証済み RCON 接続のプール
+
+    password には文字列か、接続時に評価される callable を渡せる。
+    """
+
+    def __init__(self, host: str, port: int, password, size: int = 4,
+                 timeout: float = 5.0, retries: int = 1):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.size = size
+        self.timeout = timeout
+        self.retries = retries
+        self._idle = []
+        self._slots = None
+
+    async def _open(self) -> RconConnection:
+        password = self.password() if callable(self.password) else self.password
+        conn = RconConnection(self.host, self.port, password or "", self.timeout)
+        await conn.connect()
+        return conn
+
+    @asynccontextmanager
+    async def connection(self):
+        """
+        プールから接続を 1 本借りる。例外やキャンセル時の接続は破棄して戻さない
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else await self._open()
+            conn.borrowed += 1
+            try:
+                yield conn
+            except BaseException:
+                conn.close()
+                raise
+            self._idle.append(conn)
+
+    @staticmethod
+    def _can_retry(conn, received: int) -> bool:
+        """
+        張り直して再送しても二重に実行されないか: 接続できなかった（まだ送っていない）か、
+        置いてあった接続がすでに切れていて応答が 1 つも来なかった
+        """
+        return conn is None or (conn.borrowed > 1 and conn.received == received)
+
+    async def command(self, cmd: str, timeout: float = None) -> str:
+        """
+        コマンドを実行。置いてあった接続が切れていた場合は張り直して再試行する
+
+        実行済みかもしれないコマンド（新しい接続で送った後に切れた・応答を受け取り始めた・
+        タイムアウトした）は再送しない。give や op が二重に実行されるため。
+        """
+        attempt = 0
+        while True:
+            conn, received = None, 0
+            try:
+                async with self.connection() as conn:
+                    received = conn.received
+                    return await asyncio.wait_for(conn.command(cmd), timeout or self.timeout)
+            except asyncio.TimeoutError as e:
+                raise RconError("RCON command timed out") from e
+            except RconAuthError:
+                raise
+            except (OSError, RconError) as e:
+                attempt += 1
+                if attempt > self.retries or not self._can_retry(conn, received):
+                    if isinstance(e, RconError):
+                        raise
+                    raise RconError(str(e) or e.__class__.__name__) from e
+
+    async def pipeline(self, cmds: list, timeout: float = None) -> list:
+        """
+        コマンドを 1 本の接続で続けて実行し、応答のリストを返す
+
+        再試行の条件は command() と同じ（途中まで実行されたコマンドは再送しない）。
+        """
+        attempt = 0
+        while True:
+            conn, received = None, 0
+            try:
+                async with self.connection() as conn:
+                    received = conn.received
+                    return await conn.pipeline(cmds, timeout or self.timeout)
+            except asyncio.TimeoutError as e:
+                raise RconError("RCON pipeline timed out") from e
+            except RconAuthError:
+                raise
+            except (OSError, RconError) as e:
+                attempt += 1
+                if attempt > self.retries or not self._can_retry(conn, received):
+                    if isinstance(e, RconError):
+                        raise
+                    raise RconError(str(e) or e.__class__.__name__) from e
+
+    def close(self):
+        while self._idle:
+            self._idle.pop().close()
@@ -0,0 +1,140 @@
+"""
+ダウンタイムの短いリストア
+
+サーバー稼働中にバックアップを別ディレクトリへ並列展開・検証しておき、
+停止中に行うのはディレクトリの入れ替え（rename）だけにする。
+入れ替えで外した現行ワールドはそのまま残し、再起動後に
+pre_restore スナップショットとして取り込む。
+"""
+import os
+import shutil
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+
+def extract_zip(zip_path: str, target_dir: str, workers: int = 4, progress=None) -> dict:
+    """
+    ZIP を target_dir に並列展開する
+
+    各スレッドが自分の ZipFile を開き、サイズで均等に分けたメンバーを展開する。
+    zipfile は読み終わりに CRC-32 を照合するので、壊れたメンバーは BadZipFile になる。
+    """
+    with zipfile.ZipFile(zip_path) as zipf:
+        members = zipf.infolist()
+    bytes_total = sum(m.file_size for m in members)
+
+    buckets = [[] for _ in range(max(1, min(workers, len(members))))]
+    loads = [0] * len(buckets)
+    for member in sorted(members, key=lambda m: m.file_size, reverse=True):
+        i = loads.index(min(loads))
+        buckets[i].append(member)
+        loads[i] += member.file_size
+
+    done = {"files": 0, "bytes": 0}
+    progress_lock = threading.Lock()
+
+    def extract_bucket(bucket):
+        with zipfile.ZipFile(zip_path) as zipf:
+            for member in bucket:
+                zipf.extract(member, target_dir)
+                with progress_lock:
+                    done["files"] += 1
+                    done["bytes"] += member.file_size
+                    if progress is not None:
+                        progress(files_done=done["files"], files_total=len(members),
+                                 bytes_done=done["bytes"], bytes_total=bytes_total)
+
+    with ThreadPoolExecutor(len(buckets), thread_name_prefix="unzip") as pool:
+        for future in [pool.submit(extract_bucket, b) for b in buckets]:
+            future.result()
+    return {"files": len(members), "bytes": done["bytes"]}
+
+
+class RestoreCoordinator:
+    """
+    data_dir:     ワールドのあるディレクトリ（バインドマウントなのでこれ自体は rename できない）
+    staging_dir:  展開先（data_dir と同じファイルシステムに置く）
+    previous_dir: 入れ替えで外した現行データの置き場
+    keep:         入れ替え対象から外す data_dir 直下のエントリ名
+    """
+
+    def __init__(self, store, data_dir: str, staging_dir: str, previous_dir: str,
+                 keep=(), workers: int = None):
+        self.store = store
+        self.data_dir = data_dir
+        self.staging_dir = staging_dir
+        self.previous_dir = previous_dir
+        self.keep = set(keep) | {os.path.basename(staging_dir), os.path.basename(previous_dir)}
+        self.workers = workers or store.workers
+
+    def stage(self, backup: str, progress=None) -> dict:
+        """
+        バックアップを staging_dir に展開して検証する（サーバーは止めない）
+        """
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        os.makedirs(self.staging_dir)
+        start = time.perf_counter()
+        try:
+            if self.store.exists(backup):
+                result = self.store.restore(backup, self.staging_dir, progress)
+            else:
+                result = extract_zip(backup, self.staging_dir, self.workers, progress)
+        except BaseException:
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+            raise
+        result["duration_sec"] = round(time.perf_counter() - start, 3)
+        return result
+
+    def _entries(self, path: str) -> list:
+        return sorted(name for name in os.listdir(path) if name not in self.keep)
+
+    def swap(self) -> dict:
+        """
+        data_dir の中身を previous_dir へ、staging_dir の中身を data_dir へ移す
+
+        どちらも同じファイルシステム上の rename なので、ワールドの大きさに
+        関係なく一瞬で終わる。途中で失敗した場合は元に戻す。
+        """
+        start = time.perf_counter()
+        if os.path.isdir(self.previous_dir):
+            # 取り込み損ねた旧データは消さない（空でなければ OSError）
+            os.rmdir(self.previous_dir)
+        os.makedirs(self.previous_dir)
+        moved_out, moved_in = [], []
+        try:
+            for name in self._entries(self.data_dir):
+                os.rename(os.path.join(self.data_dir, name), os.path.join(self.previous_dir, name))
+                moved_out.append(name)
+            for name in self._entries(self.staging_dir):
+                os.rename(os.path.join(self.staging_dir, name), os.path.join(self.data_dir, name))
+                moved_in.append(name)
+        except BaseException:
+            for name in reversed(moved_in):
+                os.rename(os.path.join(self.data_dir, name), os.path.join(self.staging_dir, name))
+            for name in reversed(moved_out):
+                os.rename(os.path.join(self.previous_dir, name), os.path.join(self.data_dir, name))
+            raise
+        # 古い ZIP バックアップから展開された logs/ など、keep に当たるエントリは入れ替えずに捨てる
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        return {"entries": len(moved_in), "swap_sec": round(time.perf_counter() - start, 3)}
+
+    def archive_previous(self, name: str, tag: str, codec: str, level: int, exclude=()) -> dict:
+        """
+        外した現行データをスナップショットへ取り込み、削除する
+
+        直前のスナップショットとサイズ・更新時刻が同じファイルは既存チャンクを
+        参照するだけなので、ワールド全体を圧縮し直すことはない。
+        取り込みに失敗したときは previous_dir を残す（次のリストアの前に取り込み直す）。
+        """
+        try:
+            result = self.store.create_snapshot(self.previous_dir, name, tag, exclude, codec, level)
+        except BaseException as e:
+            print(f"Could not archive the previous world, kept at {self.previous_dir}: {e!r}")
+            raise
+        shutil.rmtree(self.previous_dir, ignore_errors=True)
+        return result
+
+    def discard(self):
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
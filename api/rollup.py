@@ -0,0 +1,245 @@
+"""
+パフォーマンスメトリクスのロールアップ（1 分・1 時間・1 日）
+
+メトリクスストアの生データを閉じたバケットごとに集計し、
+min / max / avg / p95 を performance_rollups に保存する。p95 を正確に出すため
+どの解像度も生データから集計する（生データの保存期間内のバケットだけが対象）。
+
+バケットはローカル時刻の ISO 8601 文字列で表し、先頭の桁数で
+決まる（"2026-10-17T12:34" が 1 分、"2026-10-17T12" が 1 時間）。
+解像度ごとに「次に集計するバケットの開始時刻」を rollup_state に保存し、
+過去の時刻で書き込まれたデータ（一括取り込み）があれば invalidate() で巻き戻す。
+"""
+import bisect
+import datetime
+import math
+import time
+
+from metric_store import iso, to_ms
+
+METRICS = ("tps", "memory_percent", "entities", "chunks", "players", "mspt", "cpu_percent")
+AGGREGATES = ("min", "max", "avg", "p95")
+
+# 名前: (秒数, バケットを決める ISO 文字列の桁数, 桁数以降を埋める文字列)
+RESOLUTIONS = {
+    "1m": (60, 16, ":00"),
+    "1h": (3600, 13, ":00:00"),
+    "1d": (86400, 10, "T00:00:00"),
+}
+
+# 1 回のクエリで読む範囲（メモリを抑える）
+CHUNK = datetime.timedelta(days=1)
+
+COLUMNS = [f"{metric}_{agg}" for metric in METRICS for agg in AGGREGATES]
+
+
+def bucket_start(timestamp: str, resolution: str) -> str:
+    _, width, fill = RESOLUTIONS[resolution]
+    return timestamp[:width] + fill
+
+
+def percentile(values: list, p: float):
+    """
+    最近傍順位法のパーセンタイル（values はソート済み）
+    """
+    if not values:
+        return None
+    return values[max(0, math.ceil(p * len(values)) - 1)]
+
+
+def summarize(columns: dict, lo: int, hi: int) -> dict:
+    """
+    列ごとの生データ（MetricStore.range の結果）の [lo, hi) からバケット 1 つ分の集計値を作る
+    """
+    result = {"samples": hi - lo}
+    for metric in METRICS:
+        values = sorted(v for v in columns[metric][lo:hi] if v is not None)
+        result[f"{metric}_min"] = values[0] if values else None
+        result[f"{metric}_max"] = values[-1] if values else None
+        result[f"{metric}_avg"] = sum(values) / len(values) if values else None
+        result[f"{metric}_p95"] = percentile(values, 0.95)
+    return result
+
+
+def merge(points: list) -> dict:
+    """
+    連続するバケットをまとめる（max_points に収めるため）
+
+    min / max / avg は正確。p95 は元のバケットの p95 の最大値（上側の近似）。
+    """
+    samples = sum(p["samples"] for p in points)
+    result = {"timestamp": points[0]["timestamp"], "samples": samples}
+    for metric in METRICS:
+        present = [p for p in points if p[metric] is not None]
+        if not present:
+            result.update({metric: None, f"{metric}_min": None, f"{metric}_max": None, f"{metric}_p95": None})
+            continue
+        weight = sum(p["samples"] for p in present)
+        result[metric] = sum(p[metric] * p["samples"] for p in present) / weight
+        result[f"{metric}_min"] = min(p[f"{metric}_min"] for p in present)
+        result[f"{metric}_max"] = max(p[f"{metric}_max"] for p in present)
+        result[f"{metric}_p95"] = max(p[f"{metric}_p95"] for p in present)
+    return result
+
+
+class MetricRollup:
+    """
+    store:          生データを持つ MetricStore
+    get_db:         sqlite3 接続を返す callable
+    raw_days:       生データの保存日数（これより古いバケットは集計し直さない）
+    retention_days: 解像度ごとのロールアップの保存日数
+    lag:            バケットが閉じてから集計するまでの猶予（秒）。書き込みキューの遅れ分
+    """
+
+    def __init__(self, store, get_db, raw_days: int = 7, retention_days: dict = None, lag: float = 10):
+        self.store = store
+        self.get_db = get_db
+        self.raw_days = raw_days
+        self.retention_days = dict({"1m": 30, "1h": 365, "1d": 365}, **(retention_days or {}))
+        self.lag = lag
+        self.stats = {"runs": 0, "buckets": 0, "rows_read": 0, "last_run_ms": None}
+
+    def init_schema(self, conn):
+        columns = ",\n".join(f"            {name} REAL" for name in COLUMNS)
+        conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS performance_rollups (
+            resolution TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            samples INTEGER NOT NULL,
+{columns},
+            PRIMARY KEY (resolution, bucket)
+        ) WITHOUT ROWID
+        """)
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(performance_rollups)")}
+        for name in COLUMNS:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE performance_rollups ADD COLUMN {name} REAL")
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            resolution TEXT PRIMARY KEY,
+            next_bucket TEXT NOT NULL
+        )
+        """)
+
+    def _raw_cutoff(self, now: datetime.datetime, resolution: str) -> str:
+        """
+        生データが揃っている最初のバケット（保存期間の境目をまたぐバケットは除く）
+        """
+        cutoff = (now - datetime.timedelta(days=self.raw_days)).isoformat()
+        start = bucket_start(cutoff, resolution)
+        if start < cutoff:
+            start = self._next(start, resolution)
+        return start
+
+    @staticmethod
+    def _next(bucket: str, resolution: str) -> str:
+        seconds = RESOLUTIONS[resolution][0]
+        return (datetime.datetime.fromisoformat(bucket) + datetime.timedelta(seconds=seconds)).isoformat()
+
+    def invalidate(self, since: str):
+        """
+        since 以降のバケットを次回集計し直す（過去の時刻のデータを書き込んだとき）
+        """
+        now = datetime.datetime.now()
+        with self.get_db() as conn:
+            for resolution in RESOLUTIONS:
+                start = max(bucket_start(since, resolution), self._raw_cutoff(now, resolution))
+                conn.execute(
+                    "UPDATE rollup_state SET next_bucket = MIN(next_bucket, ?) WHERE resolution = ?",
+                    (start, resolution)
+                )
+
+    def run(self) -> int:
+        """
+        閉じたバケットをすべて集計する。書き込んだバケット数を返す
+        """
+        started = time.perf_counter()
+        now = datetime.datetime.now()
+        written = 0
+        for resolution in RESOLUTIONS:
+            written += self._rollup(resolution, now)
+        self.stats["runs"] += 1
+        self.stats["buckets"] += written
+        self.stats["last_run_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return written
+
+    def _rollup(self, resolution: str, now: datetime.datetime) -> int:
+        # 現在のバケット（まだ閉じていない）の開始時刻まで
+        end = bucket_start((now - datetime.timedelta(seconds=self.lag)).isoformat(), resolution)
+        floor = self._raw_cutoff(now, resolution)
+        with self.get_db() as conn:
+            row = conn.execute(
+                "SELECT next_bucket FROM rollup_state WHERE resolution = ?", (resolution,)
+            ).fetchone()
+        if row is None:
+            first = self.store.first_ts(to_ms(datetime.datetime.fromisoformat(floor)))
+            start = bucket_start(iso(first), resolution) if first is not None else end
+        else:
+            start = max(row[0], floor)
+
+        insert = f"""
+            INSERT OR REPLACE INTO performance_rollups (resolution, bucket, samples, {", ".join(COLUMNS)})
+            VALUES (?, ?, ?, {", ".join("?" for _ in COLUMNS)})
+        """
+        written = 0
+        while start < end:
+            # バケットの境目で区切って少しずつ読む
+            chunk_end = min(end, (datetime.datetime.fromisoformat(start) + CHUNK).isoformat())
+            columns = self.store.range(
+                to_ms(datetime.datetime.fromisoformat(start)),
+                to_ms(datetime.datetime.fromisoformat(chunk_end)),
+                METRICS
+            )
+            ts = columns["ts"]
+            params = []
+            lo = 0
+            while lo < len(ts):
+                bucket = bucket_start(iso(ts[lo]), resolution)
+                bucket_end = to_ms(datetime.datetime.fromisoformat(self._next(bucket, resolution)))
+                hi = bisect.bisect_left(ts, bucket_end, lo)
+                summary = summarize(columns, lo, hi)
+                params.append((resolution, bucket, summary["samples"], *(summary[c] for c in COLUMNS)))
+                lo = hi
+            with self.get_db() as conn:
+                conn.executemany(insert, params)
+                conn.execute(
+                    "INSERT OR REPLACE INTO rollup_state (resolution, next_bucket) VALUES (?, ?)",
+                    (resolution, chunk_end)
+                )
+            self.stats["rows_read"] += len(ts)
+            written += len(params)
+            start = chunk_end
+        return written
+
+    def prune(self):
+        """
+        保存期間を過ぎたロールアップを削除する
+        """
+        now = datetime.datetime.now()
+        with self.get_db() as conn:
+            for resolution, days in self.retention_days.items():
+                cutoff = (now - datetime.timedelta(days=days)).isoformat()
+                conn.execute(
+                    "DELETE FROM performance_rollups WHERE resolution = ? AND bucket < ?",
+                    (resolution, cutoff)
+                )
+
+    def query(self, resolution: str, since: str) -> list:
+        """
+        since を含むバケット以降の集計値を古い順に
+        """
+        with self.get_db() as conn:
+            cur = conn.execute(f"""
+                SELECT bucket, samples, {", ".join(COLUMNS)}
+                FROM performance_rollups
+                WHERE resolution = ? AND bucket >= ?
+                ORDER BY bucket
+            """, (resolution, bucket_start(since, resolution)))
+            points = []
+            for row in cur:
+                point = {"timestamp": row[0], "samples": row[1]}
+                for name, value in zip(COLUMNS, row[2:]):
+                    # avg は指標名そのままで返す（生データと同じキー）
+                    point[name[:-4] if name.endswith("_avg") else name] = value
+                points.append(point)
+        return points
@@ -0,0 +1,271 @@
+"""
+サーバーのパフォーマンスを定期的に計測する内蔵サンプラー
+
+RCON で TPS / MSPT（Paper の tps / mspt、Paper でなければ tick query）、
+エンティティ数（execute if entity @e）、読み込み済みチャンク数（paper chunkinfo）、
+プレイヤー数（list）を取り、Docker の stats API からコンテナの CPU・メモリ・
+ディスク I/O を取る。
+
+間隔はサーバーの状態で変える:
+    停止中      RCON も stats も呼ばず、起動の通知を待つ（stopped_interval ごとに確認）
+    0 人        idle_interval
+    プレイ中    interval
+RCON が続けて失敗するときは interval から倍々に延ばす（idle_interval まで）。
+"""
+import asyncio
+import re
+import time
+
+COLOR_CODE = re.compile(r"§[0-9a-fk-orx]", re.IGNORECASE)
+NUMBER = re.compile(r"\d+(?:\.\d+)?")
+# mspt: "◴ 1.2/0.5/3.4, ..."（avg/min/max を 5s, 10s, 1m の順）
+MSPT_TRIPLE = re.compile(r"(\d+(?:\.\d+)?)/(\d+(?:\.\d+)?)/(\d+(?:\.\d+)?)")
+# tick query: "Average time per tick: 3.2ms (Target: 50.0ms)"
+TICK_AVERAGE = re.compile(r"Average time per tick: (\d+(?:\.\d+)?)\s*ms")
+TICK_RATE = re.compile(r"Target tick rate: (\d+(?:\.\d+)?)")
+# execute if entity @e: "Test passed, count: 123"
+ENTITY_COUNT = re.compile(r"count: (\d+)")
+# paper chunkinfo: "Chunks in world:" の次の行に "Total: 1234 Inactive: ..."
+CHUNK_TOTAL = re.compile(r"Chunks in (.+?):\s*Total: (\d+)")
+PLAYER_COUNT = re.compile(r"There are (\d+)")
+
+MIB = 1024 * 1024
+
+
+def strip_colors(text: str) -> str:
+    return COLOR_CODE.sub("", text)
+
+
+def parse_tps(output: str):
+    """
+    Paper の tps（直近 1 分の値）。Paper の出力でなければ None
+    """
+    if not output or "TPS" not in output or ":" not in output:
+        return None
+    numbers = NUMBER.findall(output.split(":", 1)[1])
+    return float(numbers[0]) if numbers else None
+
+
+def parse_mspt(output: str):
+    """
+    Paper の mspt（直近 5 秒の平均）
+    """
+    m = MSPT_TRIPLE.search(output or "")
+    return float(m.group(1)) if m else None
+
+
+def parse_tick_query(output: str) -> dict:
+    """
+    バニラの tick query から mspt と tps（目標レートが上限）を求める
+    """
+    m = TICK_AVERAGE.search(output or "")
+    if not m:
+        return {}
+    mspt = float(m.group(1))
+    rate = TICK_RATE.search(output)
+    target = float(rate.group(1)) if rate else 20.0
+    return {"mspt": mspt, "tps": min(target, 1000 / mspt) if mspt > 0 else target}
+
+
+def parse_entity_count(output: str):
+    if not output:
+        return None
+    m = ENTITY_COUNT.search(output)
+    if m:
+        return int(m.group(1))
+    return 0 if "Test failed" in output else None
+
+
+def parse_chunkinfo(output: str):
+    """
+    全ワールドの読み込み済みチャンク数（"all listed worlds" の行があればそれを使う）
+    """
+    totals = CHUNK_TOTAL.findall(output or "")
+    if not totals:
+        return None
+    for name, total in totals:
+        if name.startswith("all listed worlds"):
+            return int(total)
+    return sum(int(total) for _, total in totals)
+
+
+def parse_player_count(output: str):
+    m = PLAYER_COUNT.search(output or "")
+    return int(m.group(1)) if m else None
+
+
+def container_usage(stats: dict, previous: dict = None, now: float = None) -> dict:
+    """
+    Docker の stats からメモリ（MiB）と、前回の値との差から CPU 使用率・I/O（バイト/秒）を求める
+
+    戻り値の _ で始まるキーは次回の計算用の累計値。
+    """
+    now = time.monotonic() if now is None else now
+    memory = stats.get("memory_stats") or {}
+    detail = memory.get("stats") or {}
+    usage = memory.get("usage")
+    # docker stats と同じくページキャッシュ（inactive_file）は除く
+    cache = detail.get("inactive_file", detail.get("total_inactive_file", 0))
+    limit = memory.get("limit")
+    cpu = stats.get("cpu_stats") or {}
+    cpu_usage = cpu.get("cpu_usage") or {}
+    io = {"read": 0, "write": 0}
+    for entry in (stats.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []:
+        op = entry.get("op", "").lower()
+        if op in io:
+            io[op] += entry.get("value", 0)
+
+    result = {
+        "_time": now,
+        "_cpu": cpu_usage.get("total_usage"),
+        "_system": cpu.get("system_cpu_usage"),
+        "_io_read": io["read"],
+        "_io_write": io["write"],
+    }
+    if usage is not None:
+        used = usage - cache
+        result["memory_used"] = used // MIB
+        if limit:
+            result["memory_total"] = limit // MIB
+            result["memory_percent"] = round(used / limit * 100, 2)
+    if previous:
+        cpus = cpu.get("online_cpus") or len(cpu_usage.get("percpu_usage") or ()) or 1
+        if None not in (result["_cpu"], result["_system"], previous["_cpu"], previous["_system"]):
+            system_delta = result["_system"] - previous["_system"]
+            if system_delta > 0:
+                result["cpu_percent"] = round((result["_cpu"] - previous["_cpu"]) / system_delta * cpus * 100, 2)
+        elapsed = now - previous["_time"]
+        if elapsed > 0:
+            result["io_read"] = max(0, int((result["_io_read"] - previous["_io_read"]) / elapsed))
+            result["io_write"] = max(0, int((result["_io_write"] - previous["_io_write"]) / elapsed))
+    return result
+
+
+class PerformanceSampler:
+    """
+    command:         async (cmd) -> 出力。失敗時は例外
+    container_stats: async () -> Docker の stats。失敗時は例外
+    status:          () -> {"running": bool, ...}（コンテナの状態キャッシュ）
+    write:           (エポックミリ秒, サンプルの dict) -> None
+    """
+
+    def __init__(self, command, container_stats, status, write,
+                 interval: float = 10, idle_interval: float = 60, stopped_interval: float = 300):
+        self.command = command
+        self.container_stats = container_stats
+        self.status = status
+        self.write = write
+        self.interval = interval
+        self.idle_interval = idle_interval
+        self.stopped_interval = stopped_interval
+        # None = まだ判定していない
+        self.paper = None
+        self.latest = None
+        self._usage = None
+        self._failures = 0
+        self.stats = {"samples": 0, "rcon_errors": 0, "stats_errors": 0, "state": None, "interval": None}
+
+    async def _rcon_sample(self) -> dict:
+        commands = {"players": "list", "entities": "execute if entity @e"}
+        if self.paper is False:
+            commands["tick"] = "tick query"
+        else:
+            commands.update(tps="tps", mspt="mspt", chunks="paper chunkinfo *")
+        results = await asyncio.gather(*(self.command(c) for c in commands.values()), return_exceptions=True)
+        outputs = {}
+        for key, result in zip(commands, results):
+            if isinstance(result, asyncio.CancelledError):
+                raise result
+            outputs[key] = None if isinstance(result, Exception) else strip_colors(result)
+        if all(output is None for output in outputs.values()):
+            raise next(r for r in results if isinstance(r, Exception))
+
+        sample = {
+            "players": parse_player_count(outputs["players"]),
+            "entities": parse_entity_count(outputs["entities"]),
+        }
+        if self.paper is False:
+            sample.update(parse_tick_query(outputs["tick"]))
+            return sample
+        tps = parse_tps(outputs["tps"])
+        if tps is None and outputs["tps"] is not None:
+            # Paper ではない（tps コマンドがない）: 次回からバニラの tick query を使う
+            self.paper = False
+            print("Sampler: Paper tps command not available, using tick query")
+            return sample
+        if tps is not None:
+            self.paper = True
+        sample.update(tps=tps, mspt=parse_mspt(outputs["mspt"]), chunks=parse_chunkinfo(outputs["chunks"]))
+        return sample
+
+    async def sample(self) -> float:
+        """
+        1 回計測して書き込み、次の計測までの秒数を返す
+        """
+        if not self.status().get("running"):
+            # 再起動でサーバーが入れ替わることがあるので判定し直す
+            self.paper = None
+            self._usage = None
+            self.stats["state"] = "stopped"
+            return self.stopped_interval
+
+        ts = int(time.time() * 1000)
+        sample = {}
+        try:
+            sample.update(await self._rcon_sample())
+            self._failures = 0
+        except Exception as e:
+            self._failures += 1
+            self.stats["rcon_errors"] += 1
+            if self._failures == 1:
+                print(f"Sampler: RCON failed: {e}")
+        try:
+            usage = container_usage(await self.container_stats(), self._usage)
+            self._usage = {k: v for k, v in usage.items() if k.startswith("_")}
+            sample.update((k, v) for k, v in usage.items() if not k.startswith("_"))
+        except Exception as e:
+            self.stats["stats_errors"] += 1
+            self._usage = None
+            print(f"Sampler: container stats failed: {e}")
+
+        if any(v is not None for v in sample.values()):
+            self.write(ts, sample)
+            self.latest = dict(sample, timestamp=ts)
+            self.stats["samples"] += 1
+
+        if self._failures:
+            self.stats["state"] = "unreachable"
+            return min(self.idle_interval, self.interval * 2 ** self._failures)
+        if sample.get("players") == 0:
+            self.stats["state"] = "idle"
+            return self.idle_interval
+        self.stats["state"] = "active"
+        return self.interval
+
+    async def run(self, status_events: asyncio.Queue):
+        """
+        イベントループ上で計測し続ける（キャンセルで終了）
+
+        status_events にコンテナの状態が届き、起動・停止が変わったら待ちを切り上げる。
+        """
+        while True:
+            try:
+                interval = await self.sample()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Sampler error: {e}")
+                interval = self.idle_interval
+            self.stats["interval"] = interval
+            running = self.status().get("running")
+            deadline = time.monotonic() + interval
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    status = await asyncio.wait_for(status_events.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if status.get("running") != running:
+                    break
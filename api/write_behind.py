@@ -0,0 +1,169 @@
+"""
+書き込みのまとめ実行（グループコミット）
+
+高頻度の INSERT をキューに積み、書き込みスレッドが interval 秒ごと
+または max_rows 行ごとに 1 トランザクションでまとめて書き込む。
+キューが一杯のときは呼び出し側を待たせ（バックプレッシャー）、
+wait=True の呼び出しはコミットが終わるまで戻らない。完了を待っている
+行がある場合は interval を待たず、その時点で積まれている分をコミットする
+（コミット中に積まれた行が次のバッチになる）。
+"""
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+_STOP = object()
+
+
+class QueueFull(Exception):
+    pass
+
+
+class WriteBehindQueue:
+    """
+    get_db:   sqlite3 接続を返す callable（書き込みスレッドから呼ばれる）
+    max_rows: 1 トランザクションの最大行数
+    interval: 最初の行が積まれてからコミットするまでの最大待ち時間（秒）
+    capacity: キューに積める最大行数
+    """
+
+    def __init__(self, get_db, max_rows: int = 500, interval: float = 0.05, capacity: int = 10000):
+        self.get_db = get_db
+        self.max_rows = max_rows
+        self.interval = interval
+        self._queue = queue.Queue(capacity)
+        self._thread = None
+        self._closed = False
+        self.stats = {"rows": 0, "batches": 0, "failed": 0, "rejected": 0, "max_batch": 0, "max_depth": 0}
+        # stats は書き込みスレッドと submit() を呼ぶ各スレッドが更新する
+        self._stats_lock = threading.Lock()
+
+    def start(self):
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def close(self, timeout: float = 30):
+        """
+        積まれている行をすべて書き込んでから書き込みスレッドを止める
+        """
+        if self._thread is None:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def snapshot(self) -> dict:
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def submit(self, sql: str, params, wait: bool = False, timeout: float = 5.0):
+        """
+        行を積む。wait=True ならコミットされるまで待ち、失敗すれば例外を送出する
+
+        キューが timeout 秒空かなければ QueueFull。
+        """
+        if self._thread is None or self._closed:
+            # 書き込みスレッドがない（起動前・停止後）ときはその場で書く
+            with self.get_db() as conn:
+                conn.execute(sql, params)
+            return
+        future = Future() if wait else None
+        try:
+            self._queue.put((sql, params, future), timeout=timeout)
+        except queue.Full:
+            with self._stats_lock:
+                self.stats["rejected"] += 1
+            raise QueueFull("Write queue is full")
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            if depth > self.stats["max_depth"]:
+                self.stats["max_depth"] = depth
+        if future is not None:
+            future.result()
+
+    def flush(self, timeout: float = None):
+        """
+        ここまでに積まれた行がコミットされるまで待つ
+        """
+        if self._thread is None or self._closed:
+            return
+        future = Future()
+        self._queue.put((None, None, future), timeout=timeout)
+        future.result(timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            waiting = item[2] is not None
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.max_rows:
+                remaining = deadline - time.monotonic()
+                try:
+                    # 完了を待っている呼び出しがあれば、今ある分だけでコミットする
+                    if remaining > 0 and not waiting:
+                        item = self._queue.get(timeout=remaining)
+                    else:
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                waiting = waiting or item[2] is not None
+            self._write(batch)
+        # 停止要求の後に積まれた分も書き切る
+        rest = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                rest.append(item)
+        if rest:
+            self._write(rest)
+
+    def _write(self, batch: list):
+        rows = [item for item in batch if item[0] is not None]
+        errors = {}
+        try:
+            with self.get_db() as conn:
+                # 同じ SQL が続く部分は executemany でまとめる
+                for sql, group in itertools.groupby(rows, key=lambda item: item[0]):
+                    conn.executemany(sql, [params for _, params, _ in group])
+        except Exception:
+            # 1 行ずつやり直し、失敗した行だけを呼び出し側に返す
+            for i, (sql, params, _) in enumerate(rows):
+                try:
+                    with self.get_db() as conn:
+                        conn.execute(sql, params)
+                except Exception as e:
+                    errors[i] = e
+                    print(f"Write-behind row failed: {e}")
+        with self._stats_lock:
+            self.stats["rows"] += len(rows) - len(errors)
+            self.stats["failed"] += len(errors)
+            self.stats["batches"] += 1
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(rows))
+
+        for i, (_, _, future) in enumerate(rows):
+            if future is not None:
+                if i in errors:
+                    future.set_exception(errors[i])
+                else:
+                    future.set_result(None)
+        for sql, _, future in batch:
+            if sql is None:
+                future.set_result(None)
@@ -0,0 +1,36 @@
+"""
+api.py をベンチマーク用に読み込む
+
+RCON・Docker・プロフィール API には繋がず、DB は指定したファイルを使う。
+api.py は読み込み時に /data と /backups を作るので、それができる環境
+（root で動かす開発環境や、bench/ もマウントした mc-api コンテナなど）で実行する。
+"""
+import os
+import sys
+
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api")
+sys.path.insert(0, API_DIR)
+
+
+def import_api(**env):
+    """
+    env は api.py の環境変数（WRITE_BATCH_MS など）。import の前に設定する
+    """
+    os.environ.setdefault("RCON_PORT", "1")
+    os.environ.setdefault("PROFILE_API_URL", "")
+    os.environ.setdefault("SAMPLER_ENABLED", "false")
+    for name, value in env.items():
+        os.environ[name] = str(value)
+    import api
+    return api
+
+
+def use_db(api, db_path: str):
+    api.DB_PATH = db_path
+    api.database.path = db_path
+    api.init_db()
+    return api
+
+
+def load_api(db_path: str, **env):
+    return use_db(import_api(**env), db_path)
@@ -0,0 +1,76 @@
+"""
+API キー検証のリクエストあたりの時間: verify_api_key() を直接呼ぶ
+
+api_keys に --keys 件を入れ、有効なキー・存在しないキーそれぞれで計る。
+--legacy でキャッシュを通さず毎回 api_keys を引く（以前の動作）。
+
+    python bench/auth_bench.py --calls 200000 --threads 8
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+from api_env import load_api
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--keys", type=int, default=2000)
+    parser.add_argument("--calls", type=int, default=200_000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--legacy", action="store_true")
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="auth_bench_")
+    try:
+        api = load_api(os.path.join(work, "api.db"))
+        with api.get_db() as conn:
+            conn.executemany(
+                "INSERT INTO api_keys VALUES (?, 'player', ?, datetime('now'))",
+                [(f"bench-key-{i}", f"Player{i}") for i in range(args.keys)]
+            )
+        if args.legacy:
+            def lookup(key):
+                with api.get_db() as conn:
+                    return conn.execute("SELECT role, player_name FROM api_keys WHERE key = ?", (key,)).fetchone()
+            api.key_cache.lookup = lookup
+
+        request = SimpleNamespace(client=SimpleNamespace(host="127.0.0.1"))
+
+        def run(keys, calls):
+            for i in range(calls):
+                try:
+                    api.verify_api_key(request, keys[i % len(keys)])
+                except api.HTTPException:
+                    pass
+
+        valid = [f"bench-key-{i}" for i in range(0, args.keys, 7)]
+        label = "legacy" if args.legacy else "cached"
+        for name, keys in (("valid key", valid), ("invalid key", ["no-such-key"])):
+            start = time.perf_counter()
+            run(keys, args.calls)
+            elapsed = time.perf_counter() - start
+            print(f"{label} {name:12} {elapsed / args.calls * 1e6:6.2f} us/call")
+
+        per_thread = args.calls // args.threads
+        threads = [threading.Thread(target=run, args=(valid[i::args.threads], per_thread))
+                   for i in range(args.threads)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        print(f"{label} {args.threads} threads  {per_thread * args.threads / elapsed:,.0f} calls/s")
+        if not args.legacy:
+            print(f"cache: {api.key_cache.snapshot()}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+バックアップの所要時間と書き込み量: 以前の zip 全体バックアップ vs BackupStore
+
+合成ワールドで 1 回目（全体）と、region の 1% を書き換えた後の 2 回目を比べる。
+
+    python bench/backup_store_bench.py --regions 64 --region-mb 4
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import synthetic_world
+from synthetic_world import mib
+
+from backup_store import BackupStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--regions", type=int, default=64)
+    parser.add_argument("--region-mb", type=float, default=4)
+    parser.add_argument("--churn", type=float, default=0.01, help="2 回目までに書き換える region の割合")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--codec", default="deflate")
+    parser.add_argument("--dir", default=None, help="作業ディレクトリ（既定は一時ディレクトリ）")
+    args = parser.parse_args()
+
+    work = args.dir or tempfile.mkdtemp(prefix="backup_bench_")
+    world = os.path.join(work, "world_src")
+    repo = os.path.join(work, "repo")
+    try:
+        total = synthetic_world.make_world(world, args.regions, args.region_mb)
+        print(f"world: {mib(total)}")
+        print(f"{'':24} {'sec':>8} {'written':>12}")
+
+        store = BackupStore(repo, workers=args.workers)
+        for run in ("full", "after churn"):
+            if run != "full":
+                changed = synthetic_world.churn(world, args.churn)
+                print(f"churn: {mib(changed)}")
+            start = time.perf_counter()
+            written = synthetic_world.zip_backup(world, os.path.join(work, "backup.zip"))
+            print(f"{'zip ' + run:24} {time.perf_counter() - start:8.2f} {mib(written):>12}")
+
+            start = time.perf_counter()
+            stats = store.create_snapshot(world, run.replace(" ", "-"), "bench", codec=args.codec)
+            print(f"{'snapshot ' + run:24} {time.perf_counter() - start:8.2f} {mib(stats['bytes_written']):>12}"
+                  f"  (chunks new {stats['chunks_new']}, reused {stats['chunks_reused']})")
+
+        start = time.perf_counter()
+        store.restore("after-churn", os.path.join(work, "restored"))
+        print(f"{'restore':24} {time.perf_counter() - start:8.2f}")
+        store.close()
+        print(f"repository: {mib(store.usage()['stored_bytes'])}")
+    finally:
+        if args.dir is None:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+チャット 100 万件の検索: 以前の LIKE '%語%' vs ChatIndex（FTS5 trigram）
+
+英語と日本語（分かち書きなしを含む）のメッセージを 30 日分作って比べる。
+索引の作成時間と、トリガーによる INSERT の増分も表示する。
+
+    python bench/chat_search_bench.py --messages 1000000
+"""
+import argparse
+import datetime
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+import api_env  # noqa: F401  api/ を sys.path に入れる
+
+from chat_search import ChatIndex
+from db import Database
+
+SCHEMA = """
+CREATE TABLE chat_logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    player_uuid TEXT NOT NULL,
+    player_name TEXT NOT NULL,
+    message TEXT NOT NULL,
+    world TEXT
+)
+"""
+INSERT = "INSERT INTO chat_logs (timestamp, player_uuid, player_name, message, world) VALUES (?, ?, ?, ?, ?)"
+
+EN = ("the a to is it you i and diamond iron gold netherite creeper zombie base house farm trade villager "
+      "nether portal end dragon elytra mending enchant redstone hopper chest lag server restart tps build "
+      "castle bridge wheat sheep lol ok yes no thanks help where come here home spawn").split()
+JA = ("こんにちは おはよう ありがとう ダイヤ 鉄 金 ネザー ゲート 村人 交易 拠点 建築 畑 羊 ラグ 重い 再起動 "
+      "エンドラ 討伐 エリトラ 修繕 エンチャント レッドストーン ホッパー チェスト 行きます 来て 家 帰る "
+      "東京 大阪 わかった 了解 すごい 草 w").split()
+WORLDS = ("world", "world_nether", "world_the_end")
+
+
+def messages(count: int, players: int = 200, days: int = 30, seed: int = 20):
+    rnd = random.Random(seed)
+    start = datetime.datetime.now() - datetime.timedelta(days=days)
+    step = days * 86400 / count
+    for i in range(count):
+        player = rnd.randrange(players)
+        vocab = JA if rnd.random() < 0.5 else EN
+        sep = "" if vocab is JA and rnd.random() < 0.6 else " "
+        message = sep.join(rnd.choice(vocab) for _ in range(rnd.randint(2, 12)))
+        yield ((start + datetime.timedelta(seconds=i * step)).isoformat(), f"uuid-{player:04}",
+               f"Player{player}", message, rnd.choice(WORLDS))
+
+
+def median_ms(func, runs: int = 5):
+    times, result = [], None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="chat_search_bench_")
+    try:
+        database = Database(os.path.join(work, "api.db"))
+        conn = database.connection()
+        with conn:
+            conn.execute(SCHEMA)
+            conn.execute("CREATE INDEX idx_chat_timestamp ON chat_logs(timestamp)")
+            conn.execute("CREATE INDEX idx_chat_player ON chat_logs(player_uuid)")
+            conn.executemany(INSERT, messages(args.messages))
+
+        def like(term, extra="", params=()):
+            return conn.execute(f"""
+                SELECT timestamp, player_name, message, world FROM chat_logs
+                WHERE message LIKE ? {extra} ORDER BY timestamp DESC LIMIT 20
+            """, (f"%{term}%", *params)).fetchall()
+
+        # 索引を作る前に LIKE を計る（以前の /chat/search と同じ条件）
+        legacy = {}
+        for term in ("netherite", "エリトラ", "東京", "elytra mending", "zzzz"):
+            legacy[term] = median_ms(lambda: like(term))
+        legacy["player"] = median_ms(lambda: like("netherite", "AND player_uuid = ?", ("uuid-0007",)))
+
+        index = ChatIndex(database.connection)
+        start = time.perf_counter()
+        with conn:
+            index.init_schema(conn)
+        print(f"{args.messages:,} messages, index built in {time.perf_counter() - start:.1f}s")
+        print(f"{'':36} {'LIKE':>10} {'FTS':>10} {'hits':>6}")
+
+        for term in ("netherite", "エリトラ", "東京", "elytra mending", "zzzz"):
+            fts_ms, result = median_ms(lambda: index.search(term))
+            print(f"{term:36} {legacy[term][0]:8.2f}ms {fts_ms:8.2f}ms {len(result['results']):6}")
+        fts_ms, result = median_ms(lambda: index.search("netherite", player_uuid="uuid-0007"))
+        print(f"{'netherite, one player':36} {legacy['player'][0]:8.2f}ms {fts_ms:8.2f}ms {len(result['results']):6}")
+
+        since = (datetime.datetime.now() - datetime.timedelta(days=3)).isoformat()
+        for label, kwargs in (
+            ("relevance netherite", {"query": "netherite", "sort": "relevance"}),
+            ('phrase "elytra mending"', {"query": '"elytra mending"'}),
+            ("(ダイヤ OR エリトラ) NOT ネザーゲート", {"query": "(ダイヤ OR エリトラ) NOT ネザーゲート"}),
+            ("prefix enchan*", {"query": "enchan*"}),
+            ("netherite, last 3 days", {"query": "netherite", "since": since}),
+        ):
+            fts_ms, result = median_ms(lambda: index.search(**kwargs))
+            print(f"{label:36} {'':>10} {fts_ms:8.2f}ms {len(result['results']):6}")
+
+        first = index.search("netherite", limit=50)
+        fts_ms, _ = median_ms(lambda: index.search("netherite", limit=50, cursor=first["next_cursor"]))
+        print(f"{'next page (cursor)':36} {'':>10} {fts_ms:8.2f}ms")
+
+        # 索引の作成直後は FTS5 のセグメントのマージが走るので、続けて何回か計る
+        rows = list(messages(20000, seed=21))
+        for label in ("with index", "with index", "with index", "without index"):
+            if label == "without index":
+                with conn:
+                    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+                        conn.execute(f"DROP TRIGGER {name}")
+            start = time.perf_counter()
+            with conn:
+                conn.executemany(INSERT, rows)
+            print(f"insert 20k {label}: {(time.perf_counter() - start) * 1000:.0f} ms")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+チャンク圧縮の並列化: 以前の zipfile（1 スレッドで deflate）vs BackupStore の workers 数・codec 別
+
+圧縮の効くテキストと、再圧縮しない region ファイルを混ぜた合成データで 1 回目の
+スナップショット（全チャンクが新規）を作る。
+
+    python bench/compression_bench.py --workers 1,4 --codecs deflate,zstd
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import synthetic_world
+from synthetic_world import mib
+
+from backup_store import BackupStore, available_codecs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--text-files", type=int, default=40)
+    parser.add_argument("--file-mb", type=float, default=4)
+    parser.add_argument("--regions", type=int, default=16)
+    parser.add_argument("--workers", default=f"1,{os.cpu_count() or 1}")
+    parser.add_argument("--codecs", default=",".join(c for c in ("deflate", "zstd") if c in available_codecs()))
+    parser.add_argument("--dir", default=None, help="作業ディレクトリ（既定は一時ディレクトリ）")
+    args = parser.parse_args()
+
+    work = args.dir or tempfile.mkdtemp(prefix="compression_bench_")
+    world = os.path.join(work, "world_src")
+    try:
+        total = synthetic_world.make_text_files(world, args.text_files, args.file_mb)
+        total += synthetic_world.make_world(world, args.regions, 4, data_files=0)
+        print(f"data: {mib(total)} (cpu {os.cpu_count()})")
+        print(f"{'':20} {'sec':>8} {'MiB/s':>8} {'written':>12}")
+
+        start = time.perf_counter()
+        written = synthetic_world.zip_backup(world, os.path.join(work, "backup.zip"))
+        elapsed = time.perf_counter() - start
+        print(f"{'zipfile':20} {elapsed:8.2f} {total / elapsed / 2**20:8.1f} {mib(written):>12}")
+
+        for codec in args.codecs.split(","):
+            level = 6 if codec == "deflate" else 3
+            for workers in sorted({int(w) for w in args.workers.split(",")}):
+                repo = os.path.join(work, f"repo_{codec}_{workers}")
+                store = BackupStore(repo, workers=workers)
+                try:
+                    start = time.perf_counter()
+                    stats = store.create_snapshot(world, "bench", "bench", codec=codec, level=level)
+                    elapsed = time.perf_counter() - start
+                finally:
+                    store.close()
+                label = f"{codec}-{level} x{workers}"
+                print(f"{label:20} {elapsed:8.2f} {total / elapsed / 2**20:8.1f} {mib(stats['bytes_written']):>12}")
+                shutil.rmtree(repo, ignore_errors=True)
+    finally:
+        if args.dir is None:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+HTTP の同時実行性能: uvicorn を別プロセスで起動し、keep-alive の複数クライアントで叩く
+
+--mix mixed は書き込み（/performance/record・/chat/log）6 割と読み取り 4 割。
+player ロールのキーを使うので、毎回 API キーの検証も通る。
+--mix write は書き込みだけ。--wait を付けると書き込みは ?wait=true（コミットまで待つ）。
+以前の動作に戻して比べるには
+  --legacy-connections: get_db() が呼ぶたびに PRAGMA なしで接続を開く
+  --legacy-writes:      書き込みをまとめず、リクエストごとにその場でコミットする
+
+    python bench/http_bench.py --clients 16 --duration 15
+    python bench/http_bench.py --legacy-connections
+    python bench/http_bench.py --mix write --legacy-writes
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import api_env
+
+PERFORMANCE = {"tps": 20, "memory_used": 1, "memory_total": 2, "memory_percent": 50,
+               "entities": 1, "chunks": 1, "players": 1}
+
+# (割合, メソッド, パス, 本文)
+MIXES = {
+    "mixed": [
+        (0.3, "POST", "/performance/record", PERFORMANCE),
+        (0.3, "POST", "/chat/log", {"player_uuid": "u", "player_name": "P", "message": "hi", "world": "w"}),
+        (0.2, "GET", "/chat/recent?limit=30", None),
+        (0.1, "GET", "/performance/current", None),
+        (0.1, "GET", "/stats/players", None),
+    ],
+    "write": [
+        (0.5, "POST", "/performance/record", PERFORMANCE),
+        (0.5, "POST", "/chat/log", {"player_uuid": "u", "player_name": "P", "message": "hi", "world": "w"}),
+    ],
+}
+
+
+def serve(args):
+    """
+    --serve: api を読み込んで uvicorn を起動する（子プロセス側）
+    """
+    api = api_env.import_api()
+    if args.legacy_connections:
+        # 以前の get_db(): 呼ぶたびに新しい接続（WAL・busy_timeout などの PRAGMA なし）
+        api.database.connection = lambda: sqlite3.connect(args.db)
+    if args.legacy_writes:
+        # 書き込みスレッドを起動しなければ submit() はその場で書いてコミットする
+        api.write_queue.start = lambda: None
+    api_env.use_db(api, args.db)
+    import uvicorn
+    uvicorn.run(api.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port: int, proc, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("server exited")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/docs")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def run_clients(port: int, key: str, mix: list, clients: int, duration: float, query: str = "") -> dict:
+    results = {"ok": 0, "errors": {}, "latency": []}
+    lock = threading.Lock()
+
+    def client(seed):
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        rnd = random.Random(seed)
+        headers = {"x-api-key": key, "content-type": "application/json"}
+        end = time.monotonic() + duration
+        latency, ok, errors = [], 0, {}
+        while time.monotonic() < end:
+            r = rnd.random()
+            for share, method, path, body in mix:
+                r -= share
+                if r < 0:
+                    break
+            if method == "POST" and query:
+                path += query
+            start = time.perf_counter()
+            conn.request(method, path, body=json.dumps(body) if body else None, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            latency.append(time.perf_counter() - start)
+            if response.status < 300:
+                ok += 1
+            else:
+                errors[response.status] = errors.get(response.status, 0) + 1
+        conn.close()
+        with lock:
+            results["ok"] += ok
+            results["latency"] += latency
+            for status, n in errors.items():
+                results["errors"][status] = results["errors"].get(status, 0) + n
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def report(label: str, results: dict, duration: float):
+    latency = sorted(results["latency"])
+    n = len(latency)
+
+    def pct(p):
+        return latency[min(n - 1, int(n * p))] * 1000
+
+    print(f"{label}: {n / duration:,.0f} req/s  p50 {pct(0.5):.1f} ms  p95 {pct(0.95):.1f} ms  "
+          f"p99 {pct(0.99):.1f} ms  ok {results['ok']}  errors {results['errors'] or 0}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--wait", action="store_true", help="書き込みをコミットまで待つ（?wait=true）")
+    parser.add_argument("--legacy-connections", action="store_true")
+    parser.add_argument("--legacy-writes", action="store_true")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--db", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        return serve(args)
+
+    work = tempfile.mkdtemp(prefix="http_bench_")
+    db = os.path.join(work, "api.db")
+    port = free_port()
+    cmd = [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port), "--db", db]
+    legacy = [flag for flag in ("legacy_connections", "legacy_writes") if getattr(args, flag)]
+    cmd += ["--" + flag.replace("_", "-") for flag in legacy]
+    server = subprocess.Popen(cmd)
+    try:
+        wait_ready(port, server)
+        key = "bench-player-key"
+        with sqlite3.connect(db) as conn:
+            conn.execute("INSERT INTO api_keys VALUES (?, 'player', 'Bench', datetime('now'))", (key,))
+        results = run_clients(port, key, MIXES[args.mix], args.clients, args.duration,
+                              "?wait=true" if args.wait else "")
+        label = " ".join([f"{args.mix} x{args.clients}"] + (["wait"] if args.wait else [])
+                         + [flag.replace("_", "-") for flag in legacy])
+        report(label, results, args.duration)
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+latest.log の取り込み速度: 合成ログ（既定 200 万行）を LogIngester.step() で一度に取り込む
+
+チャット・参加 / 退出・死亡・実績・プラグインの出力・スタックトレースを混ぜる。
+再起動後に読み直さないこと、追記分だけを読むことも確かめる。
+
+    python bench/log_ingest_bench.py --lines 3000000
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from api_env import load_api
+
+from log_ingest import LogIngester
+
+
+def write_log(path: str, lines: int, players: int = 50, seed: int = 1) -> int:
+    """
+    1 秒に 1 行のログを書き、行数（スタックトレースの行を含む）を返す
+    """
+    rnd = random.Random(seed)
+    names = [f"Player{i}" for i in range(players)]
+    online = set()
+    written = 0
+    with open(path, "w") as f:
+        for i in range(lines):
+            clock = f"[{(i // 3600) % 24:02}:{(i // 60) % 60:02}:{i % 60:02}]"
+            r = rnd.random()
+            if r < 0.55:
+                out = f"{clock} [Server thread/INFO]: [SomePlugin] tick {i}\n"
+            elif r < 0.85:
+                out = f"{clock} [Async Chat Thread - #0/INFO]: <{rnd.choice(names)}> hello world message {i}\n"
+            elif r < 0.95:
+                out = f"{clock} [Server thread/WARN]: Some warning {i}\n\tat com.example.Foo(Foo.java:1)\n"
+            elif r < 0.97:
+                name = rnd.choice(names)
+                if name in online:
+                    online.discard(name)
+                    out = f"{clock} [Server thread/INFO]: {name} left the game\n"
+                else:
+                    online.add(name)
+                    uuid = f"00000000-0000-4000-8000-{names.index(name):012}"
+                    out = (f"{clock} [User Authenticator #1/INFO]: UUID of player {name} is {uuid}\n"
+                           f"{clock} [Server thread/INFO]: {name} joined the game\n")
+            elif r < 0.985 and online:
+                out = f"{clock} [Server thread/INFO]: {rnd.choice(sorted(online))} was slain by Zombie\n"
+            else:
+                out = f"{clock} [Server thread/INFO]: {rnd.choice(names)} has made the advancement [Stone Age]\n"
+            f.write(out)
+            written += out.count("\n")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lines", type=int, default=2_000_000)
+    parser.add_argument("--no-chat", action="store_true",
+                        help="チャットを取り込まない（LOG_INGEST_CHAT=false。全文検索の索引を更新しない）")
+    parser.add_argument("--dir", default=None, help="作業ディレクトリ（既定は一時ディレクトリ）")
+    args = parser.parse_args()
+
+    work = args.dir or tempfile.mkdtemp(prefix="log_ingest_bench_")
+    log_dir = os.path.join(work, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    path = os.path.join(log_dir, "latest.log")
+    try:
+        api = load_api(os.path.join(work, "api.db"))
+        start = time.perf_counter()
+        lines = write_log(path, args.lines)
+        size = os.path.getsize(path)
+        print(f"log: {lines:,} lines, {size / 2**20:.0f} MiB (generated in {time.perf_counter() - start:.1f}s)")
+
+        ingester = LogIngester(api.get_db, path, log_dir, ingest_chat=not args.no_chat)
+        ingester.load_state()
+        start = time.perf_counter()
+        ingested = ingester.step()
+        elapsed = time.perf_counter() - start
+        print(f"ingest: {ingested:,} lines in {elapsed:.2f}s = {ingested / elapsed:,.0f} lines/s, "
+              f"{size / elapsed / 2**20:.1f} MiB/s")
+        print(f"stats: {ingester.stats}")
+
+        with api.get_db() as conn:
+            for table in ("chat_logs", "player_events", "player_activity", "player_stats"):
+                print(f"  {table}: {conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]:,}")
+
+        # 再起動: 保存したオフセットから続けるので何も読み直さない
+        ingester = LogIngester(api.get_db, path, log_dir, ingest_chat=not args.no_chat)
+        ingester.load_state()
+        start = time.perf_counter()
+        print(f"restart: {ingester.step()} lines in {(time.perf_counter() - start) * 1000:.1f} ms")
+        with open(path, "a") as f:
+            f.write("[23:59:59] [Async Chat Thread - #0/INFO]: <Player1> appended\n")
+        start = time.perf_counter()
+        print(f"append: {ingester.step()} lines in {(time.perf_counter() - start) * 1000:.1f} ms")
+    finally:
+        if args.dir is None:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+パフォーマンスデータ 7 日分の保存サイズと読み出し時間: 以前の performance_metrics（1 行 1 サンプル）vs MetricStore
+
+    python bench/metric_store_bench.py --days 7 --interval 1
+"""
+import argparse
+import datetime
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import api_env  # noqa: F401  api/ を sys.path に入れる
+
+from db import Database
+from metric_store import COLUMNS, INSERT, LEGACY_COLUMNS, MetricStore, iso, to_ms
+
+LEGACY_SCHEMA = """
+CREATE TABLE performance_metrics (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    tps REAL,
+    memory_used INTEGER,
+    memory_total INTEGER,
+    memory_percent REAL,
+    entities INTEGER,
+    chunks INTEGER,
+    players INTEGER
+)
+"""
+
+
+def samples(end_ms: int, days: float, interval: float, seed: int = 1):
+    """
+    (ts ミリ秒, 列の値...) を古い順に。値はゆっくり変わる（実際のサーバーと同じく差分が小さい）
+    """
+    rnd = random.Random(seed)
+    count = int(days * 86400 / interval)
+    entities, memory, players = 200, 2000, 3
+    for i in range(count):
+        ts = end_ms - int((count - i) * interval * 1000)
+        entities = max(0, entities + rnd.randint(-3, 3))
+        memory = max(500, min(8000, memory + rnd.randint(-20, 20)))
+        players = max(0, min(20, players + (rnd.random() < 0.01) * rnd.choice((-1, 1))))
+        tps = round(20 - rnd.random() * 0.5, 2)
+        yield (ts, tps, memory, 8192, round(memory / 8192 * 100, 2), entities, 300 + rnd.randint(-5, 5),
+               players, round(1000 / tps, 2), round(rnd.random() * 80, 1), rnd.randint(0, 1 << 20),
+               rnd.randint(0, 1 << 20))
+
+
+def file_size(path: str) -> int:
+    return sum(os.path.getsize(path + ext) for ext in ("", "-wal") if os.path.exists(path + ext))
+
+
+def best_of(n: int, func):
+    best, result = None, None
+    for _ in range(n):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument("--interval", type=float, default=1, help="サンプル間隔（秒）")
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="metric_store_bench_")
+    try:
+        end = to_ms(datetime.datetime.now(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0))
+        rows = list(samples(end, args.days, args.interval))
+        week = end - 7 * 86400 * 1000
+        hour = end - 3600 * 1000
+        print(f"{len(rows):,} samples ({args.days} days every {args.interval}s)")
+        print(f"{'':10} {'size':>10} {'7d all':>10} {'7d tps':>10} {'1h all':>10}")
+
+        legacy_path = os.path.join(work, "legacy.db")
+        conn = sqlite3.connect(legacy_path)
+        conn.execute(LEGACY_SCHEMA)
+        conn.execute("CREATE INDEX idx_perf_timestamp ON performance_metrics(timestamp)")
+        conn.executemany(
+            f"INSERT INTO performance_metrics (timestamp, {', '.join(LEGACY_COLUMNS)}) "
+            f"VALUES (?, {', '.join('?' for _ in LEGACY_COLUMNS)})",
+            ((iso(row[0]), *row[1:len(LEGACY_COLUMNS) + 1]) for row in rows)
+        )
+        conn.commit()
+        conn.execute("VACUUM")
+
+        def legacy_query(since, columns):
+            return conn.execute(
+                f"SELECT timestamp, {', '.join(columns)} FROM performance_metrics WHERE timestamp >= ? ORDER BY timestamp",
+                (iso(since),)
+            ).fetchall()
+
+        timings = [best_of(3, lambda: legacy_query(week, LEGACY_COLUMNS))[0],
+                   best_of(3, lambda: legacy_query(week, ("tps",)))[0],
+                   best_of(3, lambda: legacy_query(hour, LEGACY_COLUMNS))[0]]
+        conn.close()
+        print(f"{'legacy':10} {file_size(legacy_path) / 2**20:8.1f}MB " + " ".join(f"{t:8.1f}ms" for t in timings))
+
+        database = Database(os.path.join(work, "blocks.db"))
+        store = MetricStore(database.connection)
+        with database.connection() as conn:
+            store.init_schema(conn)
+            conn.executemany(INSERT, rows)
+        start = time.perf_counter()
+        store.seal(end + store.grace_ms)
+        seal_ms = (time.perf_counter() - start) * 1000
+        database.connection().execute("VACUUM")
+        database.checkpoint("TRUNCATE")
+
+        timings = [best_of(3, lambda: store.range(week, columns=LEGACY_COLUMNS))[0],
+                   best_of(3, lambda: store.range(week, columns=("tps",)))[0],
+                   best_of(3, lambda: store.range(hour, columns=LEGACY_COLUMNS))[0]]
+        print(f"{'blocks':10} {file_size(database.path) / 2**20:8.1f}MB " + " ".join(f"{t:8.1f}ms" for t in timings)
+              + f"  ({len(COLUMNS)} columns, seal {seal_ms:.0f} ms)")
+
+        result = store.range(0, columns=COLUMNS)
+        assert result["ts"] == [row[0] for row in rows]
+        for i, name in enumerate(COLUMNS, 1):
+            assert result[name] == [row[i] for row in rows], name
+        print("round trip: ok")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
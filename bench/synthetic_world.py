@@ -0,0 +1,131 @@
+"""
+ベンチマーク用の合成ワールドと、以前の zip バックアップ
+
+region ファイル（.mca）はセクターごとに zlib 圧縮されたチャンクの集まりなので、
+圧縮済みのデータと圧縮が効くデータを混ぜて作る。
+"""
+import os
+import random
+import sys
+import zipfile
+import zlib
+
+# api/ のモジュールを "import backup_store" の形で読み込む
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api")
+sys.path.insert(0, API_DIR)
+
+SECTOR = 4096
+# churn() で続けて書き換えるセクター数（32 セクター = 128 KiB）
+CHURN_RUN = 32
+
+
+def make_region(rnd: random.Random, size: int) -> bytes:
+    """
+    先頭 8 KiB のヘッダー + zlib 圧縮したチャンクをセクター境界に並べたもの
+    """
+    out = bytearray(rnd.randbytes(2 * SECTOR))
+    while len(out) < size:
+        # 地形は同じブロックが続くので 1/4 程度に縮む
+        raw = bytes(rnd.choice(b"\x00\x01\x02\x03\x07\x09") for _ in range(64)) * 512
+        blob = zlib.compress(raw + rnd.randbytes(8192), 6)
+        out += blob + b"\x00" * (-len(blob) % SECTOR)
+    return bytes(out[:size])
+
+
+def make_world(path: str, regions: int = 64, region_mb: float = 4, data_files: int = 300,
+               seed: int = 1) -> int:
+    """
+    path/world 以下に region・playerdata・data を作り、合計バイト数を返す
+    """
+    rnd = random.Random(seed)
+    region_dir = os.path.join(path, "world", "region")
+    os.makedirs(region_dir, exist_ok=True)
+    os.makedirs(os.path.join(path, "world", "playerdata"), exist_ok=True)
+    os.makedirs(os.path.join(path, "world", "data"), exist_ok=True)
+    template = make_region(rnd, int(region_mb * 1024 * 1024))
+    total = 0
+    for i in range(regions):
+        # region ごとに中身を変える（同じ内容だと重複排除が効きすぎる）
+        data = bytearray(template)
+        for offset in range(2 * SECTOR, len(data), SECTOR):
+            data[offset:offset + 16] = rnd.randbytes(16)
+        with open(os.path.join(region_dir, f"r.{i % 8}.{i // 8}.mca"), "wb") as f:
+            f.write(data)
+        total += len(data)
+    for i in range(data_files):
+        sub = "playerdata" if i % 3 == 0 else "data"
+        data = zlib.compress(b"{Name:\"minecraft:stone\",Count:%d}" % i * 2000)
+        with open(os.path.join(path, "world", sub, f"f{i}.dat"), "wb") as f:
+            f.write(data)
+        total += len(data)
+    with open(os.path.join(path, "server.properties"), "w") as f:
+        f.write("online-mode=true\n")
+    return total
+
+
+def make_text_files(path: str, files: int = 40, file_mb: float = 4, seed: int = 3) -> int:
+    """
+    path/logs と path/plugins に圧縮の効くテキスト（ログ・プラグインのデータ）を作り、合計バイト数を返す
+    """
+    rnd = random.Random(seed)
+    players = [f"Player{i}" for i in range(50)]
+    words = "the a stone dirt diamond zombie creeper chest door torch hello gg lol".split()
+    total = 0
+    for i in range(files):
+        sub = os.path.join(path, "logs") if i % 2 == 0 else os.path.join(path, "plugins", f"plugin{i}")
+        os.makedirs(sub, exist_ok=True)
+        lines, size = [], 0
+        while size < file_mb * 1024 * 1024:
+            line = (f"[{rnd.randrange(24):02}:{rnd.randrange(60):02}:{rnd.randrange(60):02}] "
+                    f"[Server thread/INFO]: <{rnd.choice(players)}> "
+                    + " ".join(rnd.choice(words) for _ in range(rnd.randrange(3, 12))) + "\n")
+            lines.append(line)
+            size += len(line)
+        data = "".join(lines).encode()
+        with open(os.path.join(sub, f"{i}.log" if i % 2 == 0 else "data.yml"), "wb") as f:
+            f.write(data)
+        total += len(data)
+    return total
+
+
+def churn(path: str, fraction: float = 0.01, seed: int = 2) -> int:
+    """
+    region の fraction 分のセクターと playerdata の一部を書き換える（1 回のプレイ分の変更）
+
+    プレイヤーのいる辺りのチャンクがまとめて保存されるので、書き換えは
+    CHURN_RUN セクターずつの連続した範囲にする。
+    """
+    rnd = random.Random(seed)
+    changed = 0
+    region_dir = os.path.join(path, "world", "region")
+    runs = []
+    for name in sorted(os.listdir(region_dir)):
+        size = os.path.getsize(os.path.join(region_dir, name))
+        runs += [(name, s) for s in range(2, size // SECTOR - CHURN_RUN + 1, CHURN_RUN)]
+    for name, sector in rnd.sample(runs, max(1, int(len(runs) * fraction))):
+        with open(os.path.join(region_dir, name), "r+b") as f:
+            f.seek(sector * SECTOR)
+            f.write(rnd.randbytes(SECTOR * CHURN_RUN))
+        changed += SECTOR * CHURN_RUN
+    data_dir = os.path.join(path, "world", "playerdata")
+    for name in sorted(os.listdir(data_dir))[:5]:
+        with open(os.path.join(data_dir, name), "ab") as f:
+            f.write(b"x")
+        changed += 1
+    return changed
+
+
+def zip_backup(source_dir: str, dest: str) -> int:
+    """
+    以前の /backup と同じ方法（ZIP_DEFLATED で 1 ファイルずつ）で固め、書いたバイト数を返す
+    """
+    with zipfile.ZipFile(dest, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for root, _, files in os.walk(source_dir):
+            for file in files:
+                full = os.path.join(root, file)
+                zipf.write(full, os.path.relpath(full, source_dir))
+    return os.path.getsize(dest)
+
+
+def mib(n: int) -> str:
+    return f"{n / 1024 / 1024:.1f} MiB"
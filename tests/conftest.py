@@ -0,0 +1,5 @@
+import os
+import sys
+
+# api/ のモジュールは互いを "import rcon_client" の形で読み込む
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
@@ -0,0 +1,75 @@
+"""
+プロフィール API（Mojang の bulk byname 互換）のローカルな代役
+
+    POST / に名前の JSON 配列 → [{"id": "<32 桁の16進>", "name": "<登録上の表記>"}, ...]
+
+テストでは ProfileService を起動して UuidResolver の api_url に url を渡す。
+開発用に単体でも動かせる（PROFILE_API_URL=http://127.0.0.1:8765/ を設定して API を起動）:
+
+    python tests/profile_service.py 8765 Notch=069a79f4-44e9-4726-a5be-fca90e38aaf5 ...
+"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ProfileService:
+    """
+    profiles: 名前 -> UUID
+    status:   200 以外にすると、その状態コードを返す（429 なら Retry-After に retry_after）
+    delay:    応答までの秒数
+    """
+
+    def __init__(self, profiles: dict, host: str = "127.0.0.1", port: int = 0):
+        self.profiles = {name.lower(): (name, uuid) for name, uuid in profiles.items()}
+        self.status = 200
+        self.retry_after = 30
+        self.delay = 0.0
+        self.requests = []
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                names = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                service.requests.append(names)
+                if service.delay:
+                    time.sleep(service.delay)
+                if service.status != 200:
+                    self.send_response(service.status)
+                    if service.status == 429:
+                        self.send_header("Retry-After", str(service.retry_after))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = json.dumps([
+                    {"id": service.profiles[name.lower()][1].replace("-", ""), "name": service.profiles[name.lower()][0]}
+                    for name in names if name.lower() in service.profiles
+                ]).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.url = f"http://{host}:{self.server.server_address[1]}/"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    profiles = dict(arg.split("=", 1) for arg in sys.argv[2:])
+    service = ProfileService(profiles, port=int(sys.argv[1]) if len(sys.argv) > 1 else 8765)
+    print(f"Profile service on {service.url} ({len(profiles)} profiles)")
+    service.server.serve_forever()
@@ -0,0 +1,63 @@
+"""
+key_cache.ApiKeyCache: キーの削除とコミットの前後関係
+"""
+import threading
+
+import pytest
+
+from db import Database
+from key_cache import ApiKeyCache
+
+KEY = "k" * 64
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Database(str(tmp_path / "api.db"))
+    with database.connection() as conn:
+        conn.execute("CREATE TABLE api_keys (key TEXT PRIMARY KEY, role TEXT, player_name TEXT, created TEXT)")
+        conn.execute("INSERT INTO api_keys VALUES (?, 'admin', 'Alex', '2026-01-01')", (KEY,))
+    return database
+
+
+def lookup_in_thread(cache, key):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(cache.lookup(key)))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_lookup_before_commit_is_evicted_after_commit(database):
+    cache = ApiKeyCache(database.connection, check_interval=3600)
+    with database.connection() as conn:
+        cache.init_schema(conn)
+    assert cache.lookup(KEY) == ("admin", "Alex")
+
+    with database.connection() as conn:
+        conn.execute("DELETE FROM api_keys WHERE key = ?", (KEY,))
+        cache.invalidate(conn, KEY)
+        # 別スレッドからはまだコミット前の行が見え、それが覚え直される
+        assert lookup_in_thread(cache, KEY) == ("admin", "Alex")
+    cache.evict(KEY)
+
+    assert cache.lookup(KEY) is None
+
+
+def test_lookup_racing_an_evict_is_not_cached(database):
+    cache = ApiKeyCache(database.connection, check_interval=3600)
+    with database.connection() as conn:
+        cache.init_schema(conn)
+    cache.lookup("other")
+
+    def get_db():
+        # 読んでいる途中で別スレッドがキーを変更してコミットした
+        cache.evict(KEY)
+        return database.connection()
+
+    cache.get_db = get_db
+    assert cache.lookup(KEY) == ("admin", "Alex")
+    cache.get_db = database.connection
+    misses = cache.stats["misses"]
+    cache.lookup(KEY)
+    assert cache.stats["misses"] == misses + 1
@@ -0,0 +1,161 @@
+"""
+LogIngester: コミット失敗時の状態の巻き戻しと、UUID が分からない行の扱い
+"""
+import datetime
+import sqlite3
+
+import pytest
+
+from db import Database
+from log_ingest import UNRESOLVED, LogIngester, offline_uuid
+from players import PlayerListFile
+from profiles import UuidResolver
+
+STEVE = "069a79f4-44e9-4726-a5be-fca90e38aaf5"
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Database(str(tmp_path / "api.db"))
+    with database.connection() as conn:
+        conn.execute("""
+            CREATE TABLE player_activity (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, player_uuid TEXT NOT NULL, player_name TEXT NOT NULL,
+                login_time TEXT NOT NULL, logout_time TEXT, session_duration INTEGER
+            )""")
+        conn.execute("""
+            CREATE TABLE player_stats (
+                player_uuid TEXT PRIMARY KEY, player_name TEXT NOT NULL, total_playtime INTEGER DEFAULT 0,
+                total_sessions INTEGER DEFAULT 0, first_join TEXT, last_join TEXT,
+                chat_messages INTEGER DEFAULT 0, deaths INTEGER DEFAULT 0, advancements INTEGER DEFAULT 0
+            )""")
+        conn.execute("""
+            CREATE TABLE chat_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL, player_uuid TEXT NOT NULL,
+                player_name TEXT NOT NULL, message TEXT NOT NULL, world TEXT
+            )""")
+    return database
+
+
+def ingester(database, tmp_path, resolve_uuids=None):
+    ingester = LogIngester(database.connection, str(tmp_path / "latest.log"), str(tmp_path),
+                           resolve_uuids=resolve_uuids)
+    ingester.load_state()
+    return ingester
+
+
+def line(clock, msg):
+    return f"[{clock}] [Server thread/INFO]: {msg}"
+
+
+# 2026-01-01 00:00:30 を基準に最初の行の日付を決める
+ANCHOR = datetime.datetime(2026, 1, 1, 0, 0, 30).timestamp()
+LINES = [
+    line("23:59:50", f"UUID of player Steve is {STEVE}"),
+    line("23:59:50", "Steve joined the game"),
+    line("00:00:10", "<Steve> happy new year"),
+]
+
+
+def test_failed_commit_restores_state(database, tmp_path, monkeypatch):
+    ing = ingester(database, tmp_path)
+    apply = LogIngester.apply
+
+    def failing_apply(self, conn, events, resolved=None):
+        apply(self, conn, events, resolved)
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(LogIngester, "apply", failing_apply)
+    with pytest.raises(sqlite3.OperationalError):
+        ing._commit(LINES, ANCHOR, 1, 100)
+    assert ing.last_ts is None and ing.sessions == {} and ing.uuids == {}
+    assert ing.offset == 0
+
+    monkeypatch.setattr(LogIngester, "apply", apply)
+    ing._commit(LINES, ANCHOR, 1, 100)
+    with database.connection() as conn:
+        activity = conn.execute("SELECT id, player_uuid, login_time FROM player_activity").fetchall()
+        chat = conn.execute("SELECT timestamp, player_uuid FROM chat_logs").fetchall()
+    assert activity == [(ing.sessions["Steve"][0], STEVE, "2025-12-31T23:59:50")]
+    assert chat == [("2026-01-01T00:00:10", STEVE)]
+    assert ing.stats["rollbacks"] == 1
+
+
+def test_online_mode_does_not_invent_uuids(database, tmp_path):
+    ing = ingester(database, tmp_path, resolve_uuids=lambda names: dict.fromkeys(names))
+    ing._commit([line("00:00:01", "<Alex> hi"), line("00:00:02", "<Alex> again")], ANCHOR, 1, 50)
+    with database.connection() as conn:
+        assert conn.execute("SELECT player_uuid FROM chat_logs").fetchall() == [(UNRESOLVED,), (UNRESOLVED,)]
+        assert conn.execute("SELECT COUNT(*) FROM player_stats").fetchone() == (0,)
+    assert ing.unresolved == {"Alex"}
+
+    # 後で UUID が分かったら書き換える
+    alex = "ec561538-f3fd-461d-aff5-086b22154bce"
+    ing._commit([line("00:01:00", f"UUID of player Alex is {alex}"), line("00:01:00", "Alex joined the game")],
+                ANCHOR, 1, 100)
+    with database.connection() as conn:
+        assert conn.execute("SELECT DISTINCT player_uuid FROM chat_logs").fetchall() == [(alex,)]
+    assert ing.unresolved == set()
+
+
+def test_offline_uuid_comes_from_the_resolver(database, tmp_path):
+    ing = ingester(database, tmp_path, resolve_uuids=lambda names: {name: offline_uuid(name) for name in names})
+    ing._commit([line("00:00:01", "<Alex> hi")], ANCHOR, 1, 50)
+    with database.connection() as conn:
+        assert conn.execute("SELECT player_uuid, chat_messages FROM player_stats").fetchall() == [
+            (offline_uuid("Alex"), 1)
+        ]
+
+
+def test_resolver_does_not_commit_part_of_a_failed_batch(database, tmp_path, monkeypatch):
+    # 本物の UuidResolver は同じ Database（スレッドごとに 1 本の接続）で自分のトランザクションを持つ
+    usercache = tmp_path / "usercache.json"
+    usercache.write_text("[]")
+    resolver = UuidResolver(database.connection, PlayerListFile(str(usercache)), lambda: True, "")
+    with database.connection() as conn:
+        resolver.init_schema(conn)
+    ing = ingester(database, tmp_path, resolve_uuids=lambda names: resolver.resolve(names, network=False))
+    lines = [line("00:00:01", "Alex joined the game"), line("00:00:02", "Bob joined the game")]
+    apply = LogIngester.apply
+
+    def failing_apply(self, conn, events, resolved=None):
+        apply(self, conn, events, resolved)
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(LogIngester, "apply", failing_apply)
+    with pytest.raises(sqlite3.OperationalError):
+        ing._commit(lines, ANCHOR, 1, 100)
+    with database.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM player_activity").fetchone() == (0,)
+
+    monkeypatch.setattr(LogIngester, "apply", apply)
+    ing._commit(lines, ANCHOR, 1, 100)
+    with database.connection() as conn:
+        assert conn.execute(
+            "SELECT player_name, player_uuid FROM player_activity ORDER BY id"
+        ).fetchall() == [("Alex", offline_uuid("Alex")), ("Bob", offline_uuid("Bob"))]
+
+
+def test_stats_are_backfilled_when_the_uuid_is_learned(database, tmp_path):
+    ing = ingester(database, tmp_path, resolve_uuids=lambda names: dict.fromkeys(names))
+    ing._commit([
+        line("00:00:00", "Alex joined the game"),
+        line("00:01:00", "<Alex> hi"),
+        line("00:02:00", "Alex was slain by Zombie"),
+        line("00:10:00", "Alex left the game"),
+    ], ANCHOR, 1, 100)
+    with database.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM player_stats").fetchone() == (0,)
+
+    alex = "ec561538-f3fd-461d-aff5-086b22154bce"
+    ing._commit([
+        line("00:20:00", f"UUID of player Alex is {alex}"),
+        line("00:20:00", "Alex joined the game"),
+        line("00:25:00", "Alex left the game"),
+    ], ANCHOR, 1, 200)
+    with database.connection() as conn:
+        stats = conn.execute("""
+            SELECT player_uuid, total_playtime, total_sessions, first_join, last_join, chat_messages, deaths
+            FROM player_stats
+        """).fetchall()
+    assert stats == [(alex, 600 + 300, 2, "2026-01-01T00:00:00", "2026-01-01T00:20:00", 1, 1)]
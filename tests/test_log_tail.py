@@ -0,0 +1,60 @@
+"""
+log_tail.LogFollower の配信（遅い購読者）
+"""
+import asyncio
+
+import log_tail
+from log_tail import LogFollower
+
+
+def write(path, lines):
+    with open(path, "a") as f:
+        f.writelines(f"{line}\n" for line in lines)
+
+
+def test_overflow_replaces_queue_with_gap(tmp_path):
+    path = str(tmp_path / "latest.log")
+    write(path, ["old"])
+    follower = LogFollower(path, queue_size=4)
+    follower._open(from_end=True)
+    start = follower.offset
+
+    async def main():
+        slow = follower.subscribe()
+        fast = follower.subscribe()
+        write(path, ["a", "b", "c"])
+        follower._publish(follower.poll())
+        fast.get_nowait(), fast.get_nowait(), fast.get_nowait()
+        write(path, [f"line {i}" for i in range(10)])
+        follower._publish(follower.poll())
+        return slow, fast
+
+    slow, fast = asyncio.run(main())
+    # 黙って途中から続けずに、読み飛ばした位置を 1 つだけ知らせる
+    assert slow.qsize() == 1
+    file_id, offset, line = slow.get_nowait()
+    assert line is log_tail.GAP
+    assert (file_id, offset) == (follower.file_id, follower.offset)
+    assert follower.gaps == 2  # fast も 10 行は入りきらない
+    assert follower.dropped == 4 + 4  # どちらも満杯の 4 行を捨てた
+
+    # 処理済みの位置から読み直せば何も失われない
+    chunk = log_tail.read_from(path, follower.file_id, start)
+    assert chunk["lines"] == ["a", "b", "c"] + [f"line {i}" for i in range(10)]
+    assert chunk["offset"] == offset
+
+
+def test_queue_with_room_gets_every_line(tmp_path):
+    path = str(tmp_path / "latest.log")
+    write(path, [])
+    follower = LogFollower(path, queue_size=100)
+    follower._open(from_end=True)
+
+    async def main():
+        queue = follower.subscribe()
+        write(path, ["x", "y"])
+        follower._publish(follower.poll())
+        return [queue.get_nowait()[2] for _ in range(queue.qsize())]
+
+    assert asyncio.run(main()) == ["x", "y"]
+    assert follower.gaps == 0
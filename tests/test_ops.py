@@ -0,0 +1,59 @@
+"""
+ops.AsyncOps の同時実行数の制限
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ops import AsyncOps, OperationTimeout
+
+
+def test_to_thread_keeps_slot_until_thread_finishes():
+    ops = AsyncOps({"io": 1})
+    release = threading.Event()
+    running = []
+
+    def work(tag):
+        running.append(tag)
+        release.wait(5)
+        return tag
+
+    async def main():
+        with pytest.raises(OperationTimeout):
+            await ops.to_thread("io", "work", work, "first", timeout=0.05)
+        # スレッドはまだ動いているので枠は空いていない
+        assert ops.stats()["inflight"] == {"io": 1}
+        second = asyncio.create_task(ops.to_thread("io", "work", work, "second"))
+        await asyncio.sleep(0.1)
+        assert running == ["first"]
+        release.set()
+        assert await second == "second"
+        assert ops.stats()["inflight"] == {}
+
+    asyncio.run(main())
+    assert ops.stats()["operations"]["io.work"]["timeouts"] == 1
+
+
+def test_to_thread_cancel_and_errors():
+    ops = AsyncOps({"io": 1})
+
+    def fail():
+        raise ValueError("boom")
+
+    async def main():
+        task = asyncio.create_task(ops.to_thread("io", "sleep", time.sleep, 0.1))
+        await asyncio.sleep(0.02)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert ops.stats()["inflight"] == {"io": 1}
+        with pytest.raises(ValueError):
+            await ops.to_thread("io", "fail", fail)
+        assert ops.stats()["inflight"] == {}
+
+    asyncio.run(main())
+    operations = ops.stats()["operations"]
+    assert operations["io.sleep"]["cancelled"] == 1
+    assert operations["io.fail"]["errors"] == 1
@@ -0,0 +1,117 @@
+"""
+UuidResolver をローカルのプロフィール API の代役に対して試す
+"""
+import json
+import os
+import time
+import uuid
+
+import pytest
+
+from db import Database
+from log_ingest import offline_uuid
+from players import PlayerListFile
+from profiles import UuidResolver
+from profile_service import ProfileService
+
+
+@pytest.fixture
+def service():
+    service = ProfileService({f"Remote{i:02d}": str(uuid.uuid4()) for i in range(30)}).start()
+    yield service
+    service.stop()
+
+
+@pytest.fixture
+def setup(tmp_path, service):
+    database = Database(str(tmp_path / "api.db"))
+    with database.connection() as conn:
+        conn.execute("CREATE TABLE player_stats (player_uuid TEXT PRIMARY KEY, player_name TEXT NOT NULL)")
+        conn.execute("CREATE INDEX idx_player_stats_name ON player_stats(player_name COLLATE NOCASE)")
+        conn.execute("INSERT INTO player_stats VALUES ('uuid-steve', 'Steve')")
+    usercache = tmp_path / "usercache.json"
+    usercache.write_text(json.dumps([{"name": "Cached", "uuid": "AAAAAAAA-0000-0000-0000-000000000001"}]))
+    mode = {"offline": False}
+    resolver = UuidResolver(
+        database.connection, PlayerListFile(str(usercache)), lambda: mode["offline"], service.url,
+        batch_size=10, ttl=3600, negative_ttl=60,
+    )
+    with database.connection() as conn:
+        resolver.init_schema(conn)
+    yield resolver, database, mode
+    resolver.shutdown()
+
+
+def expire(database, seconds):
+    with database.connection() as conn:
+        conn.execute("UPDATE player_profiles SET resolved_at = resolved_at - ?", (seconds,))
+
+
+def test_local_sources_do_not_call_the_api(setup, service):
+    resolver, _, _ = setup
+    result = resolver.resolve(["cached", "STEVE"])
+    assert result == {"cached": "aaaaaaaa-0000-0000-0000-000000000001", "STEVE": "uuid-steve"}
+    assert service.requests == []
+
+
+def test_offline_mode_derives_the_uuid(setup, service):
+    resolver, _, mode = setup
+    mode["offline"] = True
+    assert resolver.resolve_one("Nobody") == offline_uuid("Nobody")
+    assert service.requests == []
+
+
+def test_api_lookups_are_batched_and_cached(setup, service):
+    resolver, _, _ = setup
+    names = [f"remote{i:02d}" for i in range(25)]
+    result = resolver.resolve(names)
+    assert [len(batch) for batch in service.requests] == [10, 10, 5]
+    assert result["remote07"] == str(uuid.UUID(service.profiles["remote07"][1]))
+    resolver.resolve(names)
+    assert len(service.requests) == 3
+    assert resolver.names([result["remote07"]]) == {result["remote07"]: "Remote07"}
+
+
+def test_unknown_names_are_negatively_cached(setup, service):
+    resolver, database, _ = setup
+    assert resolver.resolve_one("Ghost") is None
+    assert resolver.resolve_one("ghost") is None
+    assert len(service.requests) == 1
+    expire(database, 61)
+    assert resolver.resolve_one("Ghost") is None
+    assert len(service.requests) == 2
+
+
+def test_429_blocks_further_requests(setup, service):
+    resolver, _, _ = setup
+    service.status = 429
+    assert resolver.resolve_one("Remote01") is None
+    assert resolver.resolve_one("Remote02") is None
+    assert len(service.requests) == 1
+    assert resolver._blocked_until - time.monotonic() > 25
+    resolver._blocked_until = 0
+    service.status = 200
+    assert resolver.resolve_one("Remote02") is not None
+
+
+def test_stale_entries_are_used_when_the_api_fails(setup, service):
+    resolver, database, _ = setup
+    known = resolver.resolve_one("Remote03")
+    expire(database, 7200)
+    service.status = 500
+    assert resolver.resolve_one("Remote03") == known
+    assert resolver.stats["stale"] == 1
+    assert len(service.requests) == 2
+
+
+def test_local_only_lookups_do_not_wait_for_the_api(setup, service):
+    resolver, _, _ = setup
+    service.delay = 0.5
+    start = time.monotonic()
+    assert resolver.resolve_one("Remote04", network=False) is None
+    assert time.monotonic() - start < 0.2
+    deadline = time.monotonic() + 5
+    while resolver.resolve_one("Remote04", network=False) is None:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    assert len(service.requests) == 1
@@ -0,0 +1,184 @@
+"""
+rcon_client を 127.0.0.1 のフェイク RCON サーバーに対して試す
+"""
+import asyncio
+import struct
+
+import pytest
+
+from rcon_client import (
+    RESPONSE_CHUNK_CHARS, SERVERDATA_AUTH, SERVERDATA_EXECCOMMAND, SERVERDATA_RESPONSE_VALUE,
+    RconAuthError, RconError, RconPool, encode_packet,
+)
+
+
+class FakeRcon:
+    """
+    handler(cmd) は応答の本文（str）・分割した応答（list）・None（応答しない）・
+    "DROP"（受け取った直後に切断）のどれかを返す
+    """
+
+    def __init__(self, handler, password="pw"):
+        self.handler = handler
+        self.password = password
+        self.commands = []
+        self.connections = 0
+        self.writers = []
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        for writer in self.writers:
+            writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def drop_idle(self):
+        for writer in self.writers:
+            writer.close()
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        self.writers.append(writer)
+        try:
+            while True:
+                (length,) = struct.unpack("<i", await reader.readexactly(4))
+                payload = await reader.readexactly(length)
+                req_id, ptype = struct.unpack_from("<ii", payload)
+                body = payload[8:-2].decode()
+                if ptype == SERVERDATA_AUTH:
+                    ok = body == self.password
+                    writer.write(encode_packet(req_id if ok else -1, SERVERDATA_EXECCOMMAND, ""))
+                elif ptype == SERVERDATA_RESPONSE_VALUE:
+                    # Minecraft は知らない種類のパケットに同じ ID で応答する
+                    writer.write(encode_packet(req_id, SERVERDATA_RESPONSE_VALUE, "Unknown request 0"))
+                else:
+                    self.commands.append(body)
+                    reply = self.handler(body)
+                    if reply == "DROP":
+                        writer.close()
+                        return
+                    if reply is None:
+                        continue
+                    for part in reply if isinstance(reply, list) else [reply]:
+                        writer.write(encode_packet(req_id, SERVERDATA_RESPONSE_VALUE, part))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+def test_auth_success():
+    async def main():
+        server = await FakeRcon(lambda cmd: f"ran {cmd}").start()
+        pool = RconPool("127.0.0.1", server.port, "pw")
+        try:
+            assert await pool.command("list") == "ran list"
+            assert await pool.command("time query daytime") == "ran time query daytime"
+            assert server.connections == 1
+        finally:
+            pool.close()
+            await server.stop()
+    run(main())
+
+
+def test_auth_failure_is_not_retried():
+    async def main():
+        server = await FakeRcon(lambda cmd: "ok").start()
+        pool = RconPool("127.0.0.1", server.port, "wrong", retries=3)
+        try:
+            with pytest.raises(RconAuthError):
+                await pool.command("list")
+            assert server.connections == 1
+            assert server.commands == []
+        finally:
+            pool.close()
+            await server.stop()
+    run(main())
+
+
+def test_split_response_is_joined_via_sentinel():
+    first = "a" * RESPONSE_CHUNK_CHARS
+    rest = "b" * 1000
+
+    async def main():
+        server = await FakeRcon(lambda cmd: [first, rest]).start()
+        pool = RconPool("127.0.0.1", server.port, "pw")
+        try:
+            assert await pool.command("data get entity Steve") == first + rest
+            # 番兵の応答は次のコマンドに混ざらない
+            server.handler = lambda cmd: "next"
+            assert await pool.command("list") == "next"
+        finally:
+            pool.close()
+            await server.stop()
+    run(main())
+
+
+def test_reconnects_after_idle_connection_is_dropped():
+    async def main():
+        server = await FakeRcon(lambda cmd: "ok").start()
+        pool = RconPool("127.0.0.1", server.port, "pw")
+        try:
+            assert await pool.command("list") == "ok"
+            server.drop_idle()
+            await asyncio.sleep(0.05)
+            assert await pool.command("say hi") == "ok"
+            assert server.connections == 2
+            # 切れていた接続では実行されていない
+            assert server.commands == ["list", "say hi"]
+        finally:
+            pool.close()
+            await server.stop()
+    run(main())
+
+
+def test_timeout_does_not_resend():
+    async def main():
+        server = await FakeRcon(lambda cmd: None if cmd.startswith("give") else "ok").start()
+        pool = RconPool("127.0.0.1", server.port, "pw", retries=3)
+        try:
+            with pytest.raises(RconError, match="timed out"):
+                await pool.command("give Steve diamond 64", timeout=0.2)
+            await asyncio.sleep(0.1)
+            assert server.commands == ["give Steve diamond 64"]
+        finally:
+            pool.close()
+            await server.stop()
+    run(main())
+
+
+def test_command_sent_on_fresh_connection_is_not_resent():
+    async def main():
+        server = await FakeRcon(lambda cmd: "DROP").start()
+        pool = RconPool("127.0.0.1", server.port, "pw", retries=3)
+        try:
+            with pytest.raises(RconError, match="closed"):
+                await pool.command("op Steve")
+            assert server.commands == ["op Steve"]
+        finally:
+            pool.close()
+            await server.stop()
+    run(main())
+
+
+def test_pipeline_matches_responses_to_commands():
+    async def main():
+        server = await FakeRcon(lambda cmd: f"Added {cmd.split()[-1]} to the whitelist").start()
+        pool = RconPool("127.0.0.1", server.port, "pw")
+        try:
+            names = [f"p{i}" for i in range(150)]
+            outputs = await pool.pipeline([f"whitelist add {n}" for n in names])
+            assert outputs == [f"Added {n} to the whitelist" for n in names]
+        finally:
+            pool.close()
+            await server.stop()
+    run(main())
@@ -0,0 +1,50 @@
+"""
+restore.RestoreCoordinator の入れ替え（keep に当たるエントリ）
+"""
+import os
+import zipfile
+
+from restore import RestoreCoordinator
+
+
+class ZipOnlyStore:
+    workers = 2
+
+    def exists(self, name):
+        return False
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_swap_leaves_kept_entries_in_place(tmp_path):
+    data = tmp_path / "data"
+    write(str(data / "world" / "level.dat"), "current")
+    write(str(data / "logs" / "latest.log"), "current log")
+
+    # 古い ZIP バックアップには logs/ も入っている
+    backup = str(tmp_path / "old.zip")
+    with zipfile.ZipFile(backup, "w") as zipf:
+        zipf.writestr("world/level.dat", "restored")
+        zipf.writestr("logs/latest.log", "old log")
+
+    restorer = RestoreCoordinator(ZipOnlyStore(), str(data), str(data / ".restore-staging"),
+                                  str(data / ".restore-previous"), keep=("logs",))
+    restorer.stage(backup)
+    swap = restorer.swap()
+
+    assert swap["entries"] == 1
+    assert read(str(data / "world" / "level.dat")) == "restored"
+    # ログはそのまま（取り込みのチェックポイントとずれない）
+    assert read(str(data / "logs" / "latest.log")) == "current log"
+    assert read(str(data / ".restore-previous" / "world" / "level.dat")) == "current"
+    assert not os.path.exists(str(data / ".restore-previous" / "logs"))
+    assert not os.path.exists(str(data / ".restore-staging"))